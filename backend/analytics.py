@@ -0,0 +1,212 @@
+import asyncio
+import logging
+import os
+import sys
+import time
+from collections import Counter, OrderedDict, defaultdict
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+# Add current directory to Python path for local imports
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import database
+
+logger = logging.getLogger("TravelBot")
+
+# Reports are cached per query and recomputed at most this often
+ANALYTICS_REFRESH_SECONDS = float(os.getenv("ANALYTICS_REFRESH_SECONDS", "60"))
+ANALYTICS_CACHE_SIZE = 64
+
+# Time buckets are prefixes of the ISO created_at timestamp
+BUCKET_PREFIX_LENGTHS = {"hour": 13, "day": 10, "month": 7}
+ALL_BUCKET = "all"
+METRICS = ("steps", "drop_off", "destinations", "turns")
+
+
+def build_pipeline(bucket: Optional[str], since: Optional[str], until: Optional[str], top: int) -> List[Dict]:
+    """
+    Aggregation computing every metric in one pass over the conversations
+
+    Only the fields in ConversationState.analytics_facts are projected, so
+    messages never leave the database. Each facet returns rows of
+    {"_id": {"bucket", "key"}, "count"[, "total"]}; destinations only the
+    top ones of each bucket.
+    """
+    match = {}
+    if since or until:
+        match["created_at"] = {}
+        if since:
+            match["created_at"]["$gte"] = since
+        if until:
+            match["created_at"]["$lt"] = until
+
+    if bucket:
+        bucket_expr = {"$substrCP": [{"$ifNull": ["$created_at", ""]}, 0, BUCKET_PREFIX_LENGTHS[bucket]]}
+    else:
+        bucket_expr = {"$literal": ALL_BUCKET}
+
+    return [
+        {"$match": match},
+        {"$project": {
+            "_id": 0,
+            "bucket": bucket_expr,
+            "conversation_step": 1,
+            "missing_fields": 1,
+            "destination": 1,
+            "turns_to_itinerary": 1
+        }},
+        {"$facet": {
+            "steps": [
+                {"$group": {"_id": {"bucket": "$bucket", "key": "$conversation_step"}, "count": {"$sum": 1}}}
+            ],
+            "drop_off": [
+                {"$match": {"conversation_step": {"$ne": "completed"}}},
+                {"$unwind": "$missing_fields"},
+                {"$group": {"_id": {"bucket": "$bucket", "key": "$missing_fields"}, "count": {"$sum": 1}}}
+            ],
+            "destinations": [
+                {"$match": {"destination": {"$nin": [None, ""]}}},
+                {"$group": {"_id": {"bucket": "$bucket", "key": "$destination"}, "count": {"$sum": 1}}},
+                # Cut the long tail in the database: $push keeps the sort order within each bucket
+                {"$sort": {"count": -1, "_id.key": 1}},
+                {"$group": {"_id": "$_id.bucket", "rows": {"$push": {"_id": "$_id", "count": "$count"}}}},
+                {"$project": {"rows": {"$slice": ["$rows", top]}}},
+                {"$unwind": "$rows"},
+                {"$replaceRoot": {"newRoot": "$rows"}}
+            ],
+            "turns": [
+                {"$match": {"turns_to_itinerary": {"$type": "number"}}},
+                {"$group": {"_id": {"bucket": "$bucket", "key": None}, "count": {"$sum": 1}, "total": {"$sum": "$turns_to_itinerary"}}}
+            ]
+        }}
+    ]
+
+
+def aggregate_facts(facts: Iterable[Dict], bucket: Optional[str], since: Optional[str], until: Optional[str], top: int) -> Dict[str, List[Dict]]:
+    """In-memory equivalent of build_pipeline over per-session analytics facts"""
+    counts = {metric: Counter() for metric in METRICS}
+    turn_totals = Counter()
+
+    for fact in facts:
+        created_at = fact.get("created_at") or ""
+        if (since and created_at < since) or (until and created_at >= until):
+            continue
+        key_bucket = created_at[:BUCKET_PREFIX_LENGTHS[bucket]] if bucket else ALL_BUCKET
+
+        counts["steps"][(key_bucket, fact.get("conversation_step"))] += 1
+        if fact.get("conversation_step") != "completed":
+            for field in fact.get("missing_fields") or []:
+                counts["drop_off"][(key_bucket, field)] += 1
+        if fact.get("destination"):
+            counts["destinations"][(key_bucket, fact["destination"])] += 1
+        if isinstance(fact.get("turns_to_itinerary"), (int, float)):
+            counts["turns"][(key_bucket, None)] += 1
+            turn_totals[(key_bucket, None)] += fact["turns_to_itinerary"]
+
+    result = {}
+    for metric in METRICS:
+        result[metric] = [
+            {"_id": {"bucket": key_bucket, "key": key}, "count": count, "total": turn_totals[(key_bucket, key)]}
+            for (key_bucket, key), count in counts[metric].items()
+        ]
+
+    per_bucket = defaultdict(list)
+    for row in sorted(result["destinations"], key=lambda r: (-r["count"], r["_id"]["key"])):
+        per_bucket[row["_id"]["bucket"]].append(row)
+    result["destinations"] = [row for rows in per_bucket.values() for row in rows[:top]]
+    return result
+
+
+def build_report(rows: Dict[str, List[Dict]], top: int) -> List[Dict]:
+    """Shape facet rows into one entry per time bucket"""
+    buckets = defaultdict(lambda: {
+        "sessions": 0,
+        "steps": {},
+        "drop_off": {},
+        "top_destinations": [],
+        "itineraries": 0,
+        "avg_turns_to_itinerary": None
+    })
+
+    for row in rows.get("steps", []):
+        entry = buckets[row["_id"]["bucket"]]
+        entry["steps"][row["_id"]["key"] or "unknown"] = row["count"]
+        entry["sessions"] += row["count"]
+    for row in rows.get("drop_off", []):
+        buckets[row["_id"]["bucket"]]["drop_off"][row["_id"]["key"]] = row["count"]
+    for row in rows.get("destinations", []):
+        buckets[row["_id"]["bucket"]]["top_destinations"].append({"destination": row["_id"]["key"], "sessions": row["count"]})
+    for row in rows.get("turns", []):
+        entry = buckets[row["_id"]["bucket"]]
+        entry["itineraries"] = row["count"]
+        entry["avg_turns_to_itinerary"] = round(row["total"] / row["count"], 2) if row["count"] else None
+
+    report = []
+    for name in sorted(buckets):
+        entry = buckets[name]
+        entry["top_destinations"] = sorted(entry["top_destinations"], key=lambda d: (-d["sessions"], d["destination"]))[:top]
+        entry["drop_off"] = dict(sorted(entry["drop_off"].items(), key=lambda item: -item[1]))
+        report.append({"bucket": name, **entry})
+    return report
+
+
+async def compute_report(bucket: Optional[str], since: Optional[str], until: Optional[str], top: int) -> Dict:
+    """Run the analytics query against the active store"""
+    started = time.perf_counter()
+    if database.use_in_memory:
+        rows = aggregate_facts(list(database.in_memory_facts.values()), bucket, since, until, top)
+    else:
+        results = await database.aggregate_conversations(build_pipeline(bucket, since, until, top))
+        rows = results[0] if results else {}
+
+    report = {
+        "bucket": bucket or ALL_BUCKET,
+        "since": since,
+        "until": until,
+        "generated_at": datetime.now().isoformat(),
+        "buckets": build_report(rows, top)
+    }
+    logger.info(f"Computed analytics report ({len(report['buckets'])} bucket(s)) in {(time.perf_counter() - started) * 1000:.0f}ms")
+    return report
+
+
+class AnalyticsCache:
+    """
+    Caches reports per query for refresh_seconds
+
+    Concurrent requests for a report that is being computed wait for that
+    computation instead of starting their own.
+    """
+
+    def __init__(self, refresh_seconds: float = ANALYTICS_REFRESH_SECONDS, max_entries: int = ANALYTICS_CACHE_SIZE):
+        self.refresh_seconds = refresh_seconds
+        self.max_entries = max_entries
+        self._reports: "OrderedDict[tuple, tuple]" = OrderedDict()  # key -> (computed_at, report)
+        self._pending: Dict[tuple, asyncio.Future] = {}
+
+    async def get(self, bucket: Optional[str], since: Optional[str], until: Optional[str], top: int, refresh: bool = False) -> Dict:
+        key = (bucket, since, until, top)
+        cached = self._reports.get(key)
+        if cached and not refresh and time.monotonic() - cached[0] < self.refresh_seconds:
+            return cached[1]
+
+        pending = self._pending.get(key)
+        if pending:
+            return await asyncio.shield(pending)
+
+        future = asyncio.ensure_future(compute_report(bucket, since, until, top))
+        self._pending[key] = future
+        try:
+            report = await asyncio.shield(future)
+        finally:
+            self._pending.pop(key, None)
+
+        self._reports[key] = (time.monotonic(), report)
+        self._reports.move_to_end(key)
+        if len(self._reports) > self.max_entries:
+            self._reports.popitem(last=False)
+        return report
+
+
+analytics_cache = AnalyticsCache()
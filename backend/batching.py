@@ -0,0 +1,94 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger("TravelBot")
+
+BatchHandler = Callable[[List[Tuple[str, Any]]], Awaitable[Dict[str, Any]]]
+SingleHandler = Callable[[Any], Awaitable[Any]]
+
+
+class MicroBatcher:
+    """
+    Combines requests that arrive within a short window into one call
+
+    Items submitted within window_ms of the first pending item (or until
+    max_items are pending) are passed together to batch_handler as
+    [(item_id, item), ...], which returns {item_id: result}. Items missing
+    from that result, or all of them if the batch call fails, are retried
+    one by one with single_handler. A lone item goes straight to
+    single_handler.
+    """
+
+    def __init__(self, batch_handler: BatchHandler, single_handler: SingleHandler, window_ms: float, max_items: int):
+        self.batch_handler = batch_handler
+        self.single_handler = single_handler
+        self.window = window_ms / 1000
+        self.max_items = max(1, max_items)
+        self._pending: List[Tuple[Any, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks = set()
+
+    async def submit(self, item: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        # Mark failures as retrieved even if the caller has already given up
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._pending.append((item, future))
+
+        if len(self._pending) >= self.max_items:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+
+        # Shield so a caller's timeout doesn't cancel the shared batch
+        return await asyncio.shield(future)
+
+    def _flush(self):
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.create_task(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run_single(self, item: Any, future: asyncio.Future):
+        try:
+            result = await self.single_handler(item)
+            if not future.done():
+                future.set_result(result)
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+
+    async def _run(self, batch: List[Tuple[Any, asyncio.Future]]):
+        if len(batch) == 1:
+            await self._run_single(*batch[0])
+            return
+
+        items = [(str(index), item) for index, (item, _) in enumerate(batch)]
+        try:
+            results = await self.batch_handler(items)
+        except asyncio.TimeoutError as e:
+            # Out of time: retrying one by one would only be later still
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        except Exception as e:
+            logger.warning(f"Batched call for {len(batch)} items failed, falling back to single calls: {e}")
+            results = {}
+
+        retries = []
+        for (item_id, item), (_, future) in zip(items, batch):
+            if item_id in results:
+                if not future.done():
+                    future.set_result(results[item_id])
+            else:
+                retries.append(self._run_single(item, future))
+
+        if retries:
+            logger.info(f"Retrying {len(retries)} of {len(batch)} batched items individually")
+            await asyncio.gather(*retries)
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Startup Benchmark for Travel Bot Backend
+
+Measures cold import time of each backend module (each in a fresh interpreter)
+and the time to initialize each lazily created component. Run it before and
+after changes that touch imports to keep cold start and worker restarts fast.
+
+Usage:
+    python bench_startup.py [--runs N] [--json] [--budget-ms MS]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+MODULES = ["models", "utils", "places", "database", "services", "main"]
+
+IMPORT_SNIPPET = """
+import time
+start = time.perf_counter()
+import {module}
+print((time.perf_counter() - start) * 1000)
+"""
+
+COMPONENTS_SNIPPET = """
+import asyncio, json
+from components import components
+asyncio.run(components.warm_up())
+print(json.dumps({name: info["init_ms"] for name, info in components.status()["components"].items()}))
+"""
+
+
+def run_snippet(snippet):
+    """Run a snippet in a fresh interpreter from the backend directory and return its stdout"""
+    result = subprocess.run(
+        [sys.executable, "-c", snippet],
+        cwd=BACKEND_DIR,
+        capture_output=True,
+        text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr else "unknown error")
+    return result.stdout.strip().splitlines()[-1]
+
+
+def measure_imports(runs):
+    """Median cold import time per module, in milliseconds"""
+    timings = {}
+    for module in MODULES:
+        try:
+            samples = [float(run_snippet(IMPORT_SNIPPET.format(module=module))) for _ in range(runs)]
+            timings[module] = round(statistics.median(samples), 1)
+        except RuntimeError as e:
+            print(f"Could not import {module}: {e}", file=sys.stderr)
+            timings[module] = None
+    return timings
+
+
+def measure_components():
+    """Initialization time per registered component, in milliseconds"""
+    try:
+        return json.loads(run_snippet(COMPONENTS_SNIPPET))
+    except RuntimeError as e:
+        print(f"Could not warm up components: {e}", file=sys.stderr)
+        return {}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure Travel Bot backend startup cost")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters per module (default 5)")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    parser.add_argument("--budget-ms", type=float, help="Fail if importing main takes longer than this")
+    args = parser.parse_args()
+
+    results = {
+        "imports_ms": measure_imports(args.runs),
+        "components_ms": measure_components(),
+    }
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print("Cold import time (median of {} runs):".format(args.runs))
+        for module, ms in results["imports_ms"].items():
+            print(f"  {module:<12} {'error' if ms is None else f'{ms:8.1f} ms'}")
+        print("Component initialization:")
+        for name, ms in results["components_ms"].items():
+            print(f"  {name:<12} {'-' if ms is None else f'{ms:8.1f} ms'}")
+
+    main_ms = results["imports_ms"].get("main")
+    if args.budget_ms is not None and (main_ms is None or main_ms > args.budget_ms):
+        print(f"Importing main exceeded the {args.budget_ms} ms budget", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,55 @@
+import hashlib
+import os
+import zlib
+from collections import OrderedDict
+from typing import Optional
+
+# Texts at least this large are stored once as compressed, content-addressed blobs
+BLOB_MIN_BYTES = int(os.getenv("BLOB_MIN_BYTES", "2048"))
+BLOB_CACHE_SIZE = int(os.getenv("BLOB_CACHE_SIZE", "512"))
+
+
+def blob_key(text: str) -> str:
+    """Content address of a text"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def should_externalize(text: Optional[str]) -> bool:
+    return bool(text) and len(text) >= BLOB_MIN_BYTES
+
+
+def compress_text(text: str) -> bytes:
+    return zlib.compress(text.encode("utf-8"), 6)
+
+
+def decompress_text(data: bytes) -> str:
+    return zlib.decompress(data).decode("utf-8")
+
+
+class LRUCache:
+    """Small least-recently-used map"""
+
+    def __init__(self, max_items: int):
+        self.max_items = max_items
+        self._items: OrderedDict = OrderedDict()
+
+    def get(self, key):
+        value = self._items.get(key)
+        if value is not None:
+            self._items.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self._items[key] = value
+        self._items.move_to_end(key)
+        if len(self._items) > self.max_items:
+            self._items.popitem(last=False)
+
+    def __contains__(self, key) -> bool:
+        return key in self._items
+
+
+# Decompressed texts of recently used blobs
+blob_cache = LRUCache(BLOB_CACHE_SIZE)
+# Keys this process has already written, so repeated saves skip the upsert
+stored_blob_keys = LRUCache(BLOB_CACHE_SIZE * 4)
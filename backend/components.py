@@ -0,0 +1,125 @@
+import asyncio
+import inspect
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger("TravelBot")
+
+
+def load_environment():
+    """Load variables from .env before any module reads its configuration"""
+    from dotenv import load_dotenv
+    load_dotenv()
+
+
+class ComponentRegistry:
+    """
+    Lazily created, process-wide components (LLM client, date parser, ...)
+
+    Each component is built on first use, or ahead of time by warm_up(), which
+    builds all registered components in parallel. Factories may be plain
+    functions (run in a thread during warm-up) or coroutine functions.
+    """
+
+    def __init__(self):
+        self._factories: Dict[str, Callable[[], Any]] = {}
+        self._instances: Dict[str, Any] = {}
+        # One lock per component, so building one never waits for another
+        self._locks: Dict[str, threading.Lock] = {}
+        self.timings: Dict[str, float] = {}
+        self._warmed_up = False
+
+    @property
+    def ready(self) -> bool:
+        """Warm-up has run and every component was created successfully"""
+        return self._warmed_up and all(name in self._instances for name in self._factories)
+
+    def register(self, name: str, factory: Callable[[], Any]):
+        self._factories[name] = factory
+        self._locks.setdefault(name, threading.Lock())
+
+    def _build(self, name: str) -> Any:
+        with self._locks[name]:
+            if name not in self._instances:
+                start = time.perf_counter()
+                self._instances[name] = self._factories[name]()
+                self.timings[name] = time.perf_counter() - start
+                logger.info(f"Initialized component '{name}' in {self.timings[name] * 1000:.0f}ms")
+            return self._instances[name]
+
+    def override(self, name: str, instance: Any):
+        """Replace a component with a ready-made instance (e.g. a stub for replays)"""
+        self._locks.setdefault(name, threading.Lock())
+        with self._locks[name]:
+            self._factories[name] = lambda: instance
+            self._instances[name] = instance
+
+    def get(self, name: str) -> Any:
+        """Return a synchronous component, creating it on first use"""
+        if name in self._instances:
+            return self._instances[name]
+        return self._build(name)
+
+    async def aget(self, name: str) -> Any:
+        """Return a component from async code, creating it on first use"""
+        if name in self._instances:
+            return self._instances[name]
+
+        factory = self._factories[name]
+        if inspect.iscoroutinefunction(factory):
+            start = time.perf_counter()
+            self._instances[name] = await factory()
+            self.timings[name] = time.perf_counter() - start
+            logger.info(f"Initialized component '{name}' in {self.timings[name] * 1000:.0f}ms")
+            return self._instances[name]
+        return await asyncio.to_thread(self._build, name)
+
+    async def warm_up(self, names: Optional[List[str]] = None):
+        """Create the given (default: all) components in parallel; the registry is ready if none failed"""
+        names = names if names is not None else list(self._factories)
+        start = time.perf_counter()
+        results = await asyncio.gather(*(self.aget(name) for name in names), return_exceptions=True)
+        for name, result in zip(names, results):
+            if isinstance(result, Exception):
+                logger.error(f"Failed to warm up component '{name}': {result}")
+        self._warmed_up = True
+        logger.info(f"Warm-up finished in {(time.perf_counter() - start) * 1000:.0f}ms")
+
+    def status(self) -> Dict:
+        return {
+            "ready": self.ready,
+            "components": {
+                name: {
+                    "initialized": name in self._instances,
+                    "init_ms": round(self.timings[name] * 1000, 1) if name in self.timings else None
+                }
+                for name in self._factories
+            }
+        }
+
+
+def _create_llm_client():
+    from groq import Groq
+    return Groq()
+
+
+def _create_date_parser():
+    import dateparser
+    # The first parse builds dateparser's language data; do it here instead of on a user's turn
+    dateparser.parse("tomorrow")
+    return dateparser
+
+
+components = ComponentRegistry()
+components.register("llm_client", _create_llm_client)
+components.register("date_parser", _create_date_parser)
+
+
+def get_llm_client():
+    return components.get("llm_client")
+
+
+def get_date_parser():
+    return components.get("date_parser")
@@ -1,31 +1,50 @@
+import json
 import logging
 import os
 import sys
-from typing import Optional, Dict
-from datetime import datetime
+from typing import Optional, Dict, Iterable, List
+from datetime import datetime, timedelta, timezone
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
 
 # Add current directory to Python path for local imports
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from models import ConversationState
+from models import ConversationState, GenerationJob
+from itinerary import parse_itinerary_days
+from tracing import span
+from blobs import blob_key, should_externalize, compress_text, decompress_text, blob_cache, stored_blob_keys
 
 logger = logging.getLogger("TravelBot")
 
 # MongoDB configuration
 MONGODB_URL = os.getenv("MONGODB_URL")
+# Finished jobs (and their results) are deleted this long after they finish
+JOB_RETENTION_SECONDS = int(os.getenv("JOB_RETENTION_SECONDS", "86400"))
 mongo_client: Optional[AsyncIOMotorClient] = None
 database = None
 conversations_collection = None
+jobs_collection = None
+rate_limits_collection = None
+blobs_collection = None
+pregenerated_collection = None
 
 # In-memory fallback storage
 in_memory_conversations: Dict[str, ConversationState] = {}
+in_memory_jobs: Dict[str, GenerationJob] = {}
+_jobs_pruned_at = 0.0
+in_memory_blobs: Dict[str, bytes] = {}
+in_memory_pregenerated: Dict[str, Dict] = {}
+# Compact per-session projection kept up to date on every save, so analytics never scans full states
+in_memory_facts: Dict[str, Dict] = {}
 use_in_memory = False
 
 
 async def init_database():
     """Initialize MongoDB connection and collections"""
-    global mongo_client, database, conversations_collection, use_in_memory
+    global mongo_client, database, conversations_collection, jobs_collection, rate_limits_collection, blobs_collection
+    global pregenerated_collection, use_in_memory
 
     # If no MongoDB URL is provided, use in-memory storage
     if not MONGODB_URL:
@@ -37,9 +56,23 @@ async def init_database():
         mongo_client = AsyncIOMotorClient(MONGODB_URL)
         database = mongo_client.get_database("travel-bot")
         conversations_collection = database.get_collection("conversations")
+        jobs_collection = database.get_collection("jobs")
+        rate_limits_collection = database.get_collection("rate_limits")
+        blobs_collection = database.get_collection("blobs")
+        pregenerated_collection = database.get_collection("pregenerated_itineraries")
 
         # Test the connection
         await mongo_client.admin.command('ping')
+
+        # One bucket per key, so concurrent first requests can't each upsert their own; idle buckets expire
+        await rate_limits_collection.create_index("key", unique=True)
+        await rate_limits_collection.create_index("expires_at", expireAfterSeconds=0)
+        await pregenerated_collection.create_index("key", unique=True)
+        await conversations_collection.create_index("created_at")
+        await jobs_collection.create_index("job_id", unique=True)
+        # Serves the worker claim query; finished jobs expire on their own
+        await jobs_collection.create_index([("status", 1), ("created_at", 1)])
+        await jobs_collection.create_index("expires_at", expireAfterSeconds=0)
         logger.info("Successfully connected to MongoDB")
     except Exception as e:
         logger.error(f"Failed to connect to MongoDB: {e}")
@@ -65,7 +98,8 @@ async def get_conversation_state(session_id: str) -> Optional[ConversationState]
             logger.error("Database not initialized")
             return None
 
-        conversation_doc = await conversations_collection.find_one({"session_id": session_id})
+        with span("state.load"):
+            conversation_doc = await conversations_collection.find_one({"session_id": session_id})
         if conversation_doc:
             return ConversationState.from_dict(conversation_doc)
         return None
@@ -81,17 +115,19 @@ async def save_conversation_state(state: ConversationState):
 
         if use_in_memory:
             in_memory_conversations[state.session_id] = state
+            in_memory_facts[state.session_id] = state.analytics_facts()
             return
 
         if conversations_collection is None:
             logger.error("Database not initialized")
             return
 
-        await conversations_collection.replace_one(
-            {"session_id": state.session_id},
-            state.to_dict(),
-            upsert=True
-        )
+        with span("state.save", **{"state.messages": len(state.messages)}):
+            await conversations_collection.replace_one(
+                {"session_id": state.session_id},
+                await _state_document(state),
+                upsert=True
+            )
     except Exception as e:
         logger.error(f"Error saving conversation state: {e}")
 
@@ -101,6 +137,7 @@ async def delete_conversation_state(session_id: str):
     try:
         if use_in_memory:
             in_memory_conversations.pop(session_id, None)
+            in_memory_facts.pop(session_id, None)
             return
 
         if conversations_collection is None:
@@ -129,3 +166,340 @@ async def get_all_conversations():
     except Exception as e:
         logger.error(f"Error retrieving all conversations: {e}")
         return []
+
+
+async def aggregate_conversations(pipeline: List[Dict]) -> List[Dict]:
+    """Run an aggregation pipeline over stored conversations"""
+    if conversations_collection is None:
+        raise RuntimeError("Database not initialized")
+
+    cursor = conversations_collection.aggregate(pipeline, allowDiskUse=True)
+    return await cursor.to_list(length=None)
+
+
+async def save_job(job: GenerationJob):
+    """Save a background generation job to storage"""
+    try:
+        if use_in_memory:
+            in_memory_jobs[job.job_id] = job
+            if job.is_finished:
+                _prune_in_memory_jobs()
+            return
+
+        if jobs_collection is None:
+            logger.error("Database not initialized")
+            return
+
+        await jobs_collection.replace_one(
+            {"job_id": job.job_id},
+            await _job_document(job),
+            upsert=True
+        )
+    except Exception as e:
+        logger.error(f"Error saving job: {e}")
+
+
+def _prune_in_memory_jobs():
+    """Drop finished jobs past the retention period, at most once a minute"""
+    global _jobs_pruned_at
+    now = datetime.now()
+    if now.timestamp() - _jobs_pruned_at < 60:
+        return
+    _jobs_pruned_at = now.timestamp()
+
+    cutoff = now - timedelta(seconds=JOB_RETENTION_SECONDS)
+    expired = [job_id for job_id, job in in_memory_jobs.items() if job.finished_at and job.finished_at < cutoff]
+    for job_id in expired:
+        del in_memory_jobs[job_id]
+
+
+async def get_job(job_id: str) -> Optional[GenerationJob]:
+    """Retrieve a background generation job from storage"""
+    try:
+        if use_in_memory:
+            return in_memory_jobs.get(job_id)
+
+        if jobs_collection is None:
+            logger.error("Database not initialized")
+            return None
+
+        job_doc = await jobs_collection.find_one({"job_id": job_id})
+        if job_doc:
+            job = GenerationJob.from_dict(job_doc)
+            await _resolve_job_result(job)
+            return job
+        return None
+    except Exception as e:
+        logger.error(f"Error retrieving job: {e}")
+        return None
+
+
+async def claim_next_job(lease_seconds: float, max_attempts: int) -> Optional[GenerationJob]:
+    """
+    Atomically mark the oldest claimable job as running and return it
+
+    Claimable jobs are queued ones and running ones whose worker hasn't
+    finished them within lease_seconds (it probably died), as long as they
+    have been claimed fewer than max_attempts times.
+    """
+    now = datetime.now()
+    lease_cutoff = now - timedelta(seconds=lease_seconds)
+    try:
+        if use_in_memory:
+            claimable = [
+                job for job in in_memory_jobs.values()
+                if job.attempts < max_attempts and (
+                    job.status == "queued"
+                    or (job.status == "running" and job.started_at and job.started_at < lease_cutoff)
+                )
+            ]
+            if not claimable:
+                return None
+            job = min(claimable, key=lambda j: j.created_at)
+            job.status = "running"
+            job.started_at = now
+            job.attempts += 1
+            return job
+
+        if jobs_collection is None:
+            logger.error("Database not initialized")
+            return None
+
+        job_doc = await jobs_collection.find_one_and_update(
+            {
+                "$or": [
+                    {"status": "queued"},
+                    {"status": "running", "started_at": {"$lt": lease_cutoff.isoformat()}}
+                ],
+                "attempts": {"$not": {"$gte": max_attempts}}
+            },
+            {"$set": {"status": "running", "started_at": now.isoformat()}, "$inc": {"attempts": 1}},
+            sort=[("created_at", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+        if job_doc:
+            return GenerationJob.from_dict(job_doc)
+        return None
+    except Exception as e:
+        logger.error(f"Error claiming job: {e}")
+        return None
+
+
+async def take_rate_limit_tokens(key: str, capacity: float, refill_per_second: float, cost: float = 1) -> Optional[float]:
+    """
+    Atomically refill and take tokens from a shared token bucket
+
+    Returns 0 if the tokens were taken, the seconds until enough tokens are
+    available otherwise, or None if shared storage is not available.
+    """
+    if use_in_memory or rate_limits_collection is None:
+        return None
+
+    try:
+        now = datetime.now().timestamp()
+        idle_seconds = capacity / refill_per_second if refill_per_second > 0 else 3600
+        update = [
+            {"$set": {
+                "tokens": {"$min": [capacity, {"$add": [
+                    {"$ifNull": ["$tokens", capacity]},
+                    {"$multiply": [{"$max": [0, {"$subtract": [now, {"$ifNull": ["$updated_at", now]}]}]}, refill_per_second]}
+                ]}]},
+                "updated_at": now,
+                "expires_at": {"$add": ["$$NOW", int(idle_seconds * 1000)]}
+            }},
+            {"$set": {"allowed": {"$gte": ["$tokens", cost]}}},
+            {"$set": {"tokens": {"$cond": ["$allowed", {"$subtract": ["$tokens", cost]}, "$tokens"]}}}
+        ]
+        try:
+            bucket = await rate_limits_collection.find_one_and_update(
+                {"key": key}, update, upsert=True, return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            # Another request created the bucket between our lookup and insert; it exists now
+            bucket = await rate_limits_collection.find_one_and_update(
+                {"key": key}, update, upsert=True, return_document=ReturnDocument.AFTER
+            )
+        if bucket["allowed"]:
+            return 0
+        return (cost - bucket["tokens"]) / refill_per_second if refill_per_second > 0 else idle_seconds
+    except Exception as e:
+        logger.error(f"Error updating rate limit bucket: {e}")
+        return None
+
+
+async def get_pregenerated_itinerary(key: str) -> Optional[Dict]:
+    """Retrieve a pre-generated itinerary by its trip key"""
+    try:
+        if use_in_memory:
+            return in_memory_pregenerated.get(key)
+
+        if pregenerated_collection is None:
+            logger.error("Database not initialized")
+            return None
+
+        return await pregenerated_collection.find_one({"key": key}, {"_id": 0})
+    except Exception as e:
+        logger.error(f"Error retrieving pre-generated itinerary: {e}")
+        return None
+
+
+async def save_pregenerated_itinerary(entry: Dict):
+    """Save a pre-generated itinerary, replacing any previous one for the same trip key"""
+    if use_in_memory:
+        in_memory_pregenerated[entry["key"]] = entry
+        return
+
+    if pregenerated_collection is None:
+        raise RuntimeError("Database not initialized")
+
+    await pregenerated_collection.replace_one({"key": entry["key"]}, entry, upsert=True)
+
+
+async def get_pregenerated_keys() -> List[str]:
+    """Trip keys that already have a pre-generated itinerary"""
+    if use_in_memory:
+        return list(in_memory_pregenerated)
+
+    if pregenerated_collection is None:
+        logger.error("Database not initialized")
+        return []
+
+    return [doc["key"] async for doc in pregenerated_collection.find({}, {"key": 1})]
+
+
+async def put_blob(text: str) -> str:
+    """Store a text once as a compressed, content-addressed blob and return its key"""
+    key = blob_key(text)
+    blob_cache.put(key, text)
+    if key in stored_blob_keys:
+        return key
+
+    data = compress_text(text)
+    if use_in_memory or blobs_collection is None:
+        in_memory_blobs[key] = data
+    else:
+        # Identical texts share one blob, so an existing one is left untouched
+        await blobs_collection.update_one(
+            {"_id": key},
+            {"$setOnInsert": {"data": data, "size": len(text), "created_at": datetime.now().isoformat()}},
+            upsert=True
+        )
+    stored_blob_keys.put(key, True)
+    return key
+
+
+async def get_blob_texts(keys: Iterable[str]) -> Dict[str, str]:
+    """Load blobs by key; keys that are not found are left out of the result"""
+    texts = {}
+    missing = []
+    for key in set(keys):
+        text = blob_cache.get(key)
+        if text is None:
+            missing.append(key)
+        else:
+            texts[key] = text
+
+    if missing:
+        if use_in_memory or blobs_collection is None:
+            found = {key: in_memory_blobs[key] for key in missing if key in in_memory_blobs}
+        else:
+            found = {}
+            async for doc in blobs_collection.find({"_id": {"$in": missing}}):
+                found[doc["_id"]] = doc["data"]
+        for key, data in found.items():
+            text = decompress_text(data)
+            blob_cache.put(key, text)
+            texts[key] = text
+    return texts
+
+
+async def _try_put_blob(text: str) -> Optional[str]:
+    """put_blob, or None so the caller keeps the text inline if the blob can't be written"""
+    try:
+        return await put_blob(text)
+    except Exception as e:
+        logger.error(f"Error saving blob, keeping text inline: {e}")
+        return None
+
+
+async def _state_document(state: ConversationState) -> Dict:
+    """Session document with large message bodies and the itinerary replaced by blob references"""
+    for message in state.messages:
+        if "content_ref" not in message and should_externalize(message.get("content")):
+            key = await _try_put_blob(message["content"])
+            if key:
+                message["content_ref"] = key
+
+    # An itinerary that was never loaded keeps its existing reference
+    if state.itinerary is not None:
+        state.itinerary_ref = None
+        if should_externalize(state.itinerary):
+            payload = json.dumps({"itinerary": state.itinerary})
+            state.itinerary_ref = await _try_put_blob(payload)
+
+    document = state.to_dict()
+    document["messages"] = [
+        {k: v for k, v in message.items() if k != "content"} if "content_ref" in message else message
+        for message in state.messages
+    ]
+    if state.itinerary_ref:
+        document["itinerary"] = None
+    return document
+
+
+async def resolve_messages(messages: List[Dict]) -> List[Dict]:
+    """Load the content of messages stored as blob references, in place"""
+    pending = [m for m in messages if "content" not in m and m.get("content_ref")]
+    if pending:
+        try:
+            texts = await get_blob_texts(m["content_ref"] for m in pending)
+        except Exception as e:
+            logger.error(f"Error loading message blobs: {e}")
+            texts = {}
+        for message in pending:
+            if message["content_ref"] in texts:
+                message["content"] = texts[message["content_ref"]]
+    return messages
+
+
+async def resolve_itinerary(state: ConversationState) -> bool:
+    """Load an itinerary stored as a blob reference; returns whether the state has an itinerary"""
+    if state.itinerary is None and state.itinerary_ref:
+        try:
+            texts = await get_blob_texts([state.itinerary_ref])
+        except Exception as e:
+            logger.error(f"Error loading itinerary blob: {e}")
+            texts = {}
+        payload = texts.get(state.itinerary_ref)
+        if payload:
+            state.itinerary = json.loads(payload)["itinerary"]
+            state.itinerary_days = parse_itinerary_days(state.itinerary)
+    return state.itinerary is not None
+
+
+async def resolve_state(state: ConversationState) -> ConversationState:
+    """Load every blob reference of a state, before it is sent to a client"""
+    await resolve_messages(state.messages)
+    await resolve_itinerary(state)
+    return state
+
+
+async def _job_document(job: GenerationJob) -> Dict:
+    """Job document with a large itinerary result replaced by a blob reference"""
+    document = job.to_dict()
+    if job.finished_at:
+        # A BSON date for the TTL index; finished_at is local time
+        document["expires_at"] = job.finished_at.astimezone(timezone.utc) + timedelta(seconds=JOB_RETENTION_SECONDS)
+    if job.result and should_externalize(job.result.get("itinerary")):
+        key = await _try_put_blob(job.result["itinerary"])
+        if key:
+            document["result"] = {k: v for k, v in job.result.items() if k != "itinerary"}
+            document["result"]["itinerary_ref"] = key
+    return document
+
+
+async def _resolve_job_result(job: GenerationJob):
+    if job.result and "itinerary_ref" in job.result:
+        texts = await get_blob_texts([job.result["itinerary_ref"]])
+        if job.result["itinerary_ref"] in texts:
+            job.result["itinerary"] = texts[job.result.pop("itinerary_ref")]
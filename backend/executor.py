@@ -0,0 +1,119 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import sys
+from concurrent.futures import BrokenExecutor, Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Add current directory to Python path for local imports
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from batching import MicroBatcher
+
+logger = logging.getLogger("TravelBot")
+
+# CPU-bound text processing runs off the event loop: 'process' (uses every core),
+# 'thread' or 'inline'
+CPU_EXECUTOR = os.getenv("CPU_EXECUTOR", "process")
+CPU_EXECUTOR_WORKERS = int(os.getenv("CPU_EXECUTOR_WORKERS", "0")) or os.cpu_count() or 1
+# Inputs smaller than this (in characters) are cheaper to process inline than to hand off
+CPU_OFFLOAD_MIN_CHARS = int(os.getenv("CPU_OFFLOAD_MIN_CHARS", "256"))
+# Calls submitted within this window are sent to the pool together
+CPU_BATCH_WINDOW_MS = float(os.getenv("CPU_BATCH_WINDOW_MS", "2"))
+CPU_BATCH_MAX_ITEMS = int(os.getenv("CPU_BATCH_MAX_ITEMS", "32"))
+
+Call = Tuple[Callable, tuple]
+
+
+def _warm_worker():
+    """Process pool initializer: load the date parser once per worker instead of on its first call"""
+    try:
+        from components import get_date_parser
+        get_date_parser()
+    except Exception as e:
+        logger.warning(f"CPU worker could not preload the date parser: {e}")
+
+
+def _run_calls(calls: List[Call]) -> List[Tuple[bool, Any]]:
+    """Run a batch of calls in one pool task; a failing call doesn't fail the others"""
+    results = []
+    for func, args in calls:
+        try:
+            results.append((True, func(*args)))
+        except Exception as e:
+            results.append((False, e))
+    return results
+
+
+class CpuExecutor:
+    """
+    Runs CPU-bound functions in a thread or process pool
+
+    Small inputs run inline on the event loop. Larger ones are collected for
+    a couple of milliseconds and submitted to the pool as one task, so a burst
+    of turns costs one round trip instead of one per call. Functions and
+    arguments must be picklable in process mode.
+    """
+
+    def __init__(
+        self,
+        kind: str = CPU_EXECUTOR,
+        workers: int = CPU_EXECUTOR_WORKERS,
+        min_chars: int = CPU_OFFLOAD_MIN_CHARS,
+        window_ms: float = CPU_BATCH_WINDOW_MS,
+        max_items: int = CPU_BATCH_MAX_ITEMS
+    ):
+        self.kind = kind
+        self.workers = max(1, workers)
+        self.min_chars = min_chars
+        self._pool: Optional[Executor] = None
+        self._batcher = MicroBatcher(self._run_batch, self._run_single, window_ms, max_items)
+
+    def start(self) -> Optional[Executor]:
+        """Create the pool; workers are started as calls arrive"""
+        if self._pool is None and self.kind != "inline":
+            if self.kind == "process":
+                # Spawned rather than forked: the parent already runs database and logging threads
+                self._pool = ProcessPoolExecutor(
+                    self.workers, mp_context=multiprocessing.get_context("spawn"), initializer=_warm_worker
+                )
+            else:
+                self._pool = ThreadPoolExecutor(self.workers, thread_name_prefix="cpu")
+            logger.info(f"Started {self.kind} pool with {self.workers} worker(s) for CPU-bound work")
+        return self._pool
+
+    def shutdown(self):
+        if self._pool:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    async def run(self, func: Callable, *args, size: int = 0, offload: bool = False) -> Any:
+        """
+        Call func(*args), off the event loop if the input is at least min_chars
+
+        Pass offload=True for work whose cost doesn't grow with the input's size.
+        """
+        if self.kind == "inline" or (size < self.min_chars and not offload):
+            return func(*args)
+        try:
+            return await self._batcher.submit((func, args))
+        except BrokenExecutor as e:
+            # A crashed worker breaks the whole pool; start a fresh one on the next call
+            logger.error(f"CPU {self.kind} pool broke ({e}), restarting it")
+            self.shutdown()
+            return func(*args)
+
+    async def _run_single(self, call: Call) -> Any:
+        func, args = call
+        return await asyncio.get_running_loop().run_in_executor(self.start(), func, *args)
+
+    async def _run_batch(self, items: List[Tuple[str, Call]]) -> Dict[str, Any]:
+        results = await asyncio.get_running_loop().run_in_executor(
+            self.start(), _run_calls, [call for _, call in items]
+        )
+        # Failed calls are left out and retried on their own, which raises their error to the caller
+        return {item_id: value for (item_id, _), (ok, value) in zip(items, results) if ok}
+
+
+cpu_executor = CpuExecutor()
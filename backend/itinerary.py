@@ -0,0 +1,139 @@
+import re
+from typing import Optional, Dict, Iterable, List
+
+# "### Day 1: Arrival", "**Day 2 - Louvre**", "Day 3:" at the start of a line
+DAY_HEADING_PATTERN = re.compile(r"^[ \t]*(?:#{1,6}[ \t]*)?(?:\*\*|__)?[ \t]*Day[ \t]+(\d+)\b.*$", re.IGNORECASE | re.MULTILINE)
+# "- **Morning:**", "#### Afternoon", "Evening -" at the start of a line
+SLOT_HEADING_PATTERN = re.compile(r"^[ \t]*(?:[-*][ \t]*)?(?:#{1,6}[ \t]*)?(?:\*\*|__)?[ \t]*(Morning|Afternoon|Evening|Night)\b", re.IGNORECASE | re.MULTILINE)
+# A non-day markdown heading after the last day starts the closing notes ("### Travel Tips")
+OUTRO_HEADING_PATTERN = re.compile(r"^[ \t]*#{1,6}[ \t]*(?!\**[ \t]*Day\b)\S.*$", re.IGNORECASE | re.MULTILINE)
+
+SLOTS = ["morning", "afternoon", "evening", "night"]
+
+ORDINAL_DAYS = {
+    "first": 1, "second": 2, "third": 3, "fourth": 4, "fifth": 5,
+    "sixth": 6, "seventh": 7, "eighth": 8, "ninth": 9, "tenth": 10,
+}
+NUMBER_WORDS = {
+    "one": 1, "two": 2, "three": 3, "four": 4, "five": 5,
+    "six": 6, "seven": 7, "eight": 8, "nine": 9, "ten": 10,
+}
+EDIT_KEYWORDS = [
+    "change", "replace", "swap", "modify", "adjust", "instead", "remove", "skip",
+    "add", "different", "update", "edit", "rather", "switch", "move",
+]
+# Only count as an edit when a day or slot is mentioned ("make day 2 more relaxed")
+WEAK_EDIT_KEYWORDS = ["make", "more", "less", "fewer", "want", "prefer"]
+
+
+def parse_itinerary_days(text: str) -> List[Dict]:
+    """
+    Split an itinerary into per-day sections
+
+    Each section's content is an exact substring of the text (heading included),
+    so edited days can be spliced back without touching the rest.
+    """
+    headings = list(DAY_HEADING_PATTERN.finditer(text))
+    days = []
+    seen = set()
+    for index, heading in enumerate(headings):
+        day_number = int(heading.group(1))
+        end = headings[index + 1].start() if index + 1 < len(headings) else len(text)
+        content = text[heading.start():end]
+
+        # Keep closing notes out of the last day
+        if index + 1 == len(headings):
+            outro = OUTRO_HEADING_PATTERN.search(content, len(heading.group(0)))
+            if outro:
+                content = content[:outro.start()]
+
+        if day_number in seen:
+            continue
+        seen.add(day_number)
+        days.append({"day": day_number, "content": content.rstrip()})
+    return days
+
+
+def split_day_slots(content: str) -> Dict[str, str]:
+    """Split a day's content into its morning/afternoon/evening/night sections"""
+    headings = list(SLOT_HEADING_PATTERN.finditer(content))
+    slots = {}
+    for index, heading in enumerate(headings):
+        slot = heading.group(1).lower()
+        end = headings[index + 1].start() if index + 1 < len(headings) else len(content)
+        if slot not in slots:
+            slots[slot] = content[heading.start():end].rstrip()
+    return slots
+
+
+def classify_itinerary_edit(message: str, day_numbers: Iterable[int]) -> Optional[Dict]:
+    """
+    Work out which days and slots an edit request touches
+
+    day_numbers are the days parsed from the itinerary, which needn't be 1..N
+    ("Day 1-2" and "Day 3" parse as days 1 and 3); other days are ignored.
+    Returns None if the message doesn't look like an edit, otherwise
+    {"days": [...], "slots": [...]} where empty lists mean "not specified".
+    """
+    day_numbers = set(day_numbers)
+    text = message.lower()
+    days = set()
+    for start, end in re.findall(r"\bdays?\s*(\d+)\s*(?:-|to|through)\s*(\d+)\b", text):
+        # Only the itinerary's own days: the bounds are user input, so never expand the range itself
+        days.update(day for day in day_numbers if int(start) <= day <= int(end))
+    for group in re.findall(r"\bdays?\s+((?:\d+(?:\s*,\s*|\s+and\s+|\s*&\s*)?)+)", text):
+        days.update(int(number) for number in re.findall(r"\d+", group))
+    for word, number in NUMBER_WORDS.items():
+        if re.search(rf"\bday\s+{word}\b", text):
+            days.add(number)
+    for word, number in ORDINAL_DAYS.items():
+        if re.search(rf"\b{word}\s+day\b", text):
+            days.add(number)
+    for number in re.findall(r"\b(\d+)(?:st|nd|rd|th)\s+day\b", text):
+        days.add(int(number))
+    if re.search(r"\b(?:last|final)\s+day\b", text) and day_numbers:
+        days.add(max(day_numbers))
+
+    slots = [slot for slot in SLOTS if re.search(rf"\b{slot}s?\b", text)]
+    if "tonight" in text and "evening" not in slots:
+        slots.append("evening")
+
+    days = sorted(days & day_numbers)
+    if not any(re.search(rf"\b{keyword}\b", text) for keyword in EDIT_KEYWORDS):
+        has_target = bool(days or slots)
+        if not has_target or not any(re.search(rf"\b{keyword}\b", text) for keyword in WEAK_EDIT_KEYWORDS):
+            return None
+
+    return {"days": days, "slots": slots}
+
+
+def apply_itinerary_edits(itinerary: str, days: List[Dict], edited_text: str, slots: List[str]) -> Optional[str]:
+    """
+    Splice regenerated days (or just their slots) from edited_text into the itinerary
+
+    Returns the updated itinerary, or None if edited_text contains none of the days.
+    """
+    current = {day["day"]: day["content"] for day in days}
+    updated = itinerary
+    applied = False
+
+    for edited_day in parse_itinerary_days(edited_text):
+        old_content = current.get(edited_day["day"])
+        if old_content is None:
+            continue
+
+        new_content = edited_day["content"]
+        if slots:
+            # Only replace the requested slot sections, keep the rest of the day as is
+            old_slots = split_day_slots(old_content)
+            new_slots = split_day_slots(new_content)
+            new_content = old_content
+            for slot in slots:
+                if slot in old_slots and slot in new_slots:
+                    new_content = new_content.replace(old_slots[slot], new_slots[slot], 1)
+
+        if new_content != old_content:
+            updated = updated.replace(old_content, new_content, 1)
+            applied = True
+
+    return updated if applied else None
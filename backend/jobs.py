@@ -0,0 +1,189 @@
+import asyncio
+import logging
+import os
+import sys
+import uuid
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Optional
+
+# Add current directory to Python path for local imports
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from models import GenerationJob
+from database import save_job, get_job, claim_next_job
+
+logger = logging.getLogger("TravelBot")
+
+# Job mode configuration
+JOB_MODE = os.getenv("ITINERARY_JOB_MODE", "false").lower() == "true"
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_QUEUE_BACKEND = os.getenv("JOB_QUEUE_BACKEND", "memory")  # memory or storage
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "0.5"))
+# A job that isn't finished this long after it was claimed (or queued, for the in-memory
+# queue) is assumed lost with its worker
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "300"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+
+JobHandler = Callable[[GenerationJob], Awaitable[Dict]]
+
+
+class JobQueue(ABC):
+    """Queue interface used by the worker pool"""
+
+    @abstractmethod
+    async def put(self, job: GenerationJob):
+        ...
+
+    @abstractmethod
+    async def get(self) -> GenerationJob:
+        ...
+
+
+class InMemoryJobQueue(JobQueue):
+    """Process-local queue; jobs are still saved to storage so they can be polled"""
+
+    def __init__(self):
+        self._queue: asyncio.Queue = asyncio.Queue()
+
+    async def put(self, job: GenerationJob):
+        await save_job(job)
+        await self._queue.put(job)
+
+    async def get(self) -> GenerationJob:
+        job = await self._queue.get()
+        job.status = "running"
+        job.started_at = datetime.now()
+        job.attempts += 1
+        await save_job(job)
+        return job
+
+
+class StorageJobQueue(JobQueue):
+    """Queue backed by the storage layer, so separate worker processes can share it"""
+
+    async def put(self, job: GenerationJob):
+        await save_job(job)
+
+    async def get(self) -> GenerationJob:
+        while True:
+            job = await claim_next_job(JOB_LEASE_SECONDS, JOB_MAX_ATTEMPTS)
+            if job:
+                return job
+            await asyncio.sleep(JOB_POLL_INTERVAL)
+
+
+def create_job_queue(backend: str = JOB_QUEUE_BACKEND) -> JobQueue:
+    """Create the configured job queue"""
+    if backend == "storage":
+        return StorageJobQueue()
+    if backend != "memory":
+        logger.warning(f"Unknown job queue backend '{backend}', using in-memory queue")
+    return InMemoryJobQueue()
+
+
+job_queue: JobQueue = create_job_queue()
+
+# Job id -> completion event, for waiters in this process
+_job_events: Dict[str, asyncio.Event] = {}
+
+
+class JobWorkerPool:
+    """Fixed-size pool of asyncio workers pulling jobs from the queue"""
+
+    def __init__(self, queue: JobQueue, handler: JobHandler, workers: int = JOB_WORKERS):
+        self.queue = queue
+        self.handler = handler
+        self.workers = workers
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self):
+        for index in range(self.workers):
+            self._tasks.append(asyncio.create_task(self._worker(index)))
+        logger.info(f"Started {self.workers} job workers")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        logger.info("Job workers stopped")
+
+    async def _worker(self, index: int):
+        while True:
+            job = await self.queue.get()
+            logger.info(f"Worker {index} running job {job.job_id} for session {job.session_id}")
+            try:
+                job.result = await self.handler(job)
+                job.status = "completed"
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Job {job.job_id} failed: {e}")
+                job.status = "failed"
+                job.error = str(e)
+            job.finished_at = datetime.now()
+            await save_job(job)
+            event = _job_events.pop(job.job_id, None)
+            if event:
+                event.set()
+
+
+def job_is_stale(job: GenerationJob) -> bool:
+    """Whether an unfinished job has outlived its lease, so no worker is going to finish it"""
+    if job.is_finished:
+        return False
+    if job.status == "running":
+        since = job.started_at
+    elif isinstance(job_queue, InMemoryJobQueue):
+        # Queued jobs of a process-local queue don't survive a restart
+        since = job.created_at
+    else:
+        # Storage-queued jobs stay claimable, however long the backlog
+        return False
+    return since is None or (datetime.now() - since).total_seconds() > JOB_LEASE_SECONDS
+
+
+async def enqueue_job(session_id: str, kind: str = "itinerary", job_id: Optional[str] = None) -> GenerationJob:
+    """Create a job for a session and put it on the queue"""
+    job = GenerationJob(job_id or uuid.uuid4().hex, session_id, kind)
+    if isinstance(job_queue, InMemoryJobQueue):
+        # Only in-process workers can signal completion directly
+        _job_events[job.job_id] = asyncio.Event()
+    await job_queue.put(job)
+    logger.info(f"Queued {kind} job {job.job_id} for session {session_id}")
+    return job
+
+
+async def wait_for_job(job_id: str, timeout: Optional[float] = None) -> Optional[GenerationJob]:
+    """
+    Wait until a job finishes and return it
+
+    Wakes immediately for jobs run in this process and polls storage for jobs
+    run by other workers. Returns the job in its current state on timeout, or
+    None if it does not exist.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout if timeout is not None else None
+
+    while True:
+        job = await get_job(job_id)
+        if job is None or job.is_finished:
+            _job_events.pop(job_id, None)
+            return job
+
+        wait = JOB_POLL_INTERVAL
+        if deadline is not None:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return job
+            wait = min(wait, remaining)
+
+        event = _job_events.get(job_id)
+        try:
+            if event:
+                await asyncio.wait_for(event.wait(), timeout=wait)
+            else:
+                await asyncio.sleep(wait)
+        except asyncio.TimeoutError:
+            pass
@@ -1,18 +1,33 @@
+import asyncio
 import logging
 import json
 import sys
 import os
 from datetime import datetime
-from fastapi import FastAPI, Request
-from fastapi.responses import StreamingResponse
+from typing import Optional
+from fastapi import FastAPI, Request, WebSocket
+from fastapi.responses import StreamingResponse, JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
 
 # Add current directory to Python path for local imports
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from database import init_database, close_database, get_conversation_state, delete_conversation_state
-from services import process_user_message
+# Load .env before importing modules that read their configuration at import time
+from components import components, load_environment
+load_environment()
+
+from database import init_database, close_database, get_conversation_state, delete_conversation_state, resolve_state
+from services import process_user_message, run_itinerary_job
+from places import load_place_index
+from jobs import JOB_MODE, JOB_WORKERS, JobWorkerPool, job_queue, wait_for_job
+from websocket_chat import handle_chat_websocket
+from resilience import breakers
+from ratelimit import RateLimitMiddleware
+from analytics import analytics_cache, BUCKET_PREFIX_LENGTHS
+from executor import cpu_executor
+from tracing import start_turn_trace, finish_turn_trace, span, close_tracing
+from streams import start_turn, get_session_stream, drop_session_stream, parse_last_event_id
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -30,20 +45,66 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Rate limiting runs first so rejected clients cost as little as possible
+app.add_middleware(RateLimitMiddleware)
+
 logger.info("TravelBot API is running on port 8000")
 
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Headers": "*",
+}
+
+# In-process itinerary workers (job mode only)
+job_worker_pool: Optional[JobWorkerPool] = None
+
+# Wait for all components before serving, instead of warming up in the background
+WARMUP_BLOCKING = os.getenv("WARMUP_BLOCKING", "false").lower() == "true"
+warmup_task: Optional[asyncio.Task] = None
+
+components.register("storage", init_database)
+components.register("place_index", load_place_index)
+components.register("cpu_executor", cpu_executor.start)
+
+
+def encode_state_update(state) -> str:
+    """JSON for a state_update event"""
+    with span("state.encode"):
+        return json.dumps({"type": "state_update", "state": state.to_update_dict()})
+
 
 # Application lifecycle events
 @app.on_event("startup")
 async def startup_event():
-    """Initialize database connection on startup"""
-    await init_database()
+    """Initialize storage, then warm up the remaining components"""
+    global job_worker_pool, warmup_task
+    await components.aget("storage")
+
+    # LLM client, date parser and place index are built in parallel; until then they are
+    # created lazily on first use, and /ready reports not ready
+    if WARMUP_BLOCKING:
+        await components.warm_up()
+    else:
+        warmup_task = asyncio.create_task(components.warm_up())
+
+    # With JOB_WORKERS=0 this process only enqueues; separate worker.py processes generate
+    if JOB_MODE and JOB_WORKERS > 0:
+        job_worker_pool = JobWorkerPool(job_queue, run_itinerary_job, JOB_WORKERS)
+        job_worker_pool.start()
 
 
 @app.on_event("shutdown")
 async def shutdown_event():
-    """Close database connection on shutdown"""
+    """Stop job workers and close database connection on shutdown"""
+    if warmup_task and not warmup_task.done():
+        warmup_task.cancel()
+    if job_worker_pool:
+        await job_worker_pool.stop()
     await close_database()
+    cpu_executor.shutdown()
+    close_tracing()
 
 
 # API Routes
@@ -66,31 +127,40 @@ async def chat_endpoint(session_id: str, request: Request):
         StreamingResponse: Server-Side Events stream with bot responses
     """
     try:
-        body = await request.json()
-        user_message = body.get("message", "").strip()
+        # The turn's background task inherits this context, and with it the trace
+        trace = start_turn_trace(session_id, **{"chat.transport": "sse"})
+        with span("request.parse"):
+            body = await request.json()
+            user_message = body.get("message", "").strip()
 
         if not user_message:
             return {"error": "Message is required"}
 
-        async def event_generator():
-            """Generate Server-Side Events for real-time communication"""
-            async for chunk in process_user_message(session_id, user_message):
-                yield chunk
-
-            # Send session state update at the end
-            state = await get_conversation_state(session_id)
-            if state:
-                yield f"data: {json.dumps({'type': 'state_update', 'state': state.to_dict()})}\n\n"
+        async def turn_events():
+            """Generate the turn's events; runs in the background so a dropped client can resume"""
+            error = None
+            try:
+                async for chunk in process_user_message(session_id, user_message):
+                    yield chunk
+
+                # Send session state update at the end
+                state = await get_conversation_state(session_id)
+                if state:
+                    yield f"data: {encode_state_update(state)}\n\n"
+            except Exception as e:
+                error = e
+                raise
+            finally:
+                finish_turn_trace(trace, error)
+
+        stream = start_turn(session_id, user_message, turn_events)
+        if stream is None:
+            return {"error": "Another message is still being processed for this session"}
 
         return StreamingResponse(
-            event_generator(),
+            stream.subscribe(stream.turn_start_id),
             media_type="text/event-stream",
-            headers={
-                "Cache-Control": "no-cache",
-                "Connection": "keep-alive",
-                "Access-Control-Allow-Origin": "*",
-                "Access-Control-Allow-Headers": "*",
-            }
+            headers=SSE_HEADERS
         )
 
     except Exception as e:
@@ -98,6 +168,102 @@ async def chat_endpoint(session_id: str, request: Request):
         return {"error": "An error occurred while processing your message"}
 
 
+@app.get("/chat/{session_id}/stream")
+async def resume_chat_stream(session_id: str, request: Request, last_event_id: Optional[str] = None):
+    """
+    Resume a chat Server-Side Events stream after a dropped connection
+
+    Replays buffered events after the client's Last-Event-ID and then follows
+    the in-flight turn, if any, without starting a new generation.
+
+    Args:
+        session_id: Unique identifier for the conversation session
+        request: FastAPI request object carrying the Last-Event-ID header
+        last_event_id: Fallback for clients that cannot set headers (e.g. EventSource polyfills)
+
+    Returns:
+        StreamingResponse: Server-Side Events stream with the remaining bot responses
+    """
+    stream = get_session_stream(session_id)
+    if stream is None:
+        return {"error": "No stream found for this session"}
+
+    resume_from = parse_last_event_id(request.headers.get("last-event-id") or last_event_id)
+    return StreamingResponse(
+        stream.subscribe(resume_from),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS
+    )
+
+
+@app.websocket("/ws/chat/{session_id}")
+async def chat_websocket(websocket: WebSocket, session_id: str):
+    """
+    Persistent chat endpoint over WebSocket
+
+    Clients send {"message": "..."} frames (pipelining is allowed) and receive
+    the same JSON events as the SSE stream. Session state stays in memory for
+    the lifetime of the connection and is saved on idle and on close.
+
+    Args:
+        websocket: WebSocket connection
+        session_id: Unique identifier for the conversation session
+    """
+    await handle_chat_websocket(websocket, session_id)
+
+
+@app.get("/jobs/{job_id}")
+async def get_job_status(job_id: str, wait: float = 0):
+    """
+    Poll a background itinerary job
+
+    Args:
+        job_id: Identifier returned in the chat stream's 'job' event
+        wait: Seconds to long-poll for completion before returning (max 30)
+
+    Returns:
+        dict: Job status, and the generated messages once completed
+    """
+    job = await wait_for_job(job_id, timeout=min(max(wait, 0), 30))
+    if job:
+        return job.to_dict()
+    return {"error": "Job not found"}
+
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    """
+    Subscribe to a background itinerary job with Server-Side Events
+
+    Args:
+        job_id: Identifier returned in the chat stream's 'job' event
+
+    Returns:
+        StreamingResponse: Server-Side Events stream that delivers the itinerary when ready
+    """
+    async def event_generator():
+        job = await wait_for_job(job_id)
+        if job is None:
+            yield f"data: {json.dumps({'type': 'error', 'content': 'Job not found'})}\n\n"
+        elif job.result and job.result.get("superseded"):
+            yield f"data: {json.dumps({'type': 'error', 'content': 'This itinerary was replaced by a newer request.'})}\n\n"
+        elif job.status == "completed" and job.result:
+            yield f"data: {json.dumps({'type': 'itinerary', 'content': job.result['itinerary']})}\n\n"
+            yield f"data: {json.dumps({'type': 'message', 'content': job.result['follow_up']})}\n\n"
+            state = await get_conversation_state(job.session_id)
+            if state:
+                yield f"data: {encode_state_update(state)}\n\n"
+        else:
+            yield f"data: {json.dumps({'type': 'error', 'content': 'Itinerary generation failed. Please try again.'})}\n\n"
+        yield f"data: {json.dumps({'type': 'done'})}\n\n"
+
+    return StreamingResponse(
+        event_generator(),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS
+    )
+
+
 @app.get("/session/{session_id}")
 async def get_session(session_id: str):
     """
@@ -111,6 +277,8 @@ async def get_session(session_id: str):
     """
     state = await get_conversation_state(session_id)
     if state:
+        # Large message bodies are stored as blobs and only loaded when history is requested
+        await resolve_state(state)
         return {
             "session_id": session_id,
             "state": state.to_dict(),
@@ -130,19 +298,117 @@ async def delete_session(session_id: str):
     Returns:
         dict: Confirmation message
     """
+    drop_session_stream(session_id)
     await delete_conversation_state(session_id)
     return {"message": "Session deleted successfully"}
 
 
+# Report fields returned by /analytics/{metric}
+ANALYTICS_METRIC_FIELDS = {
+    "steps": ["sessions", "steps"],
+    "drop-off": ["drop_off"],
+    "destinations": ["top_destinations"],
+    "turns": ["itineraries", "avg_turns_to_itinerary"],
+}
+
+
+@app.get("/analytics")
+async def get_analytics(
+    bucket: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    top: int = 10,
+    refresh: bool = False
+):
+    """
+    Conversation funnel and usage report, computed in the database
+
+    Args:
+        bucket: Group sessions by creation 'hour', 'day' or 'month' (default: one bucket)
+        since: Only sessions created at or after this ISO timestamp
+        until: Only sessions created before this ISO timestamp
+        top: Number of top destinations per bucket
+        refresh: Recompute instead of using a cached report
+
+    Returns:
+        dict: Per-bucket session counts by step, drop-off by missing field,
+        top destinations and average turns to itinerary
+    """
+    if bucket and bucket not in BUCKET_PREFIX_LENGTHS:
+        return {"error": f"bucket must be one of {', '.join(BUCKET_PREFIX_LENGTHS)}"}
+    try:
+        since = datetime.fromisoformat(since).isoformat() if since else None
+        until = datetime.fromisoformat(until).isoformat() if until else None
+    except ValueError:
+        return {"error": "since and until must be ISO dates or timestamps"}
+
+    try:
+        return await analytics_cache.get(bucket, since, until, min(max(top, 1), 100), refresh)
+    except Exception as e:
+        logger.error(f"Error computing analytics: {e}")
+        return {"error": "Analytics are temporarily unavailable"}
+
+
+@app.get("/analytics/{metric}")
+async def get_analytics_metric(
+    metric: str,
+    bucket: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    top: int = 10,
+    refresh: bool = False
+):
+    """
+    A single metric of the analytics report
+
+    Args:
+        metric: 'steps', 'drop-off', 'destinations' or 'turns'
+        bucket, since, until, top, refresh: As for /analytics
+
+    Returns:
+        dict: The report with only the requested metric in each bucket
+    """
+    fields = ANALYTICS_METRIC_FIELDS.get(metric)
+    if not fields:
+        return {"error": f"metric must be one of {', '.join(ANALYTICS_METRIC_FIELDS)}"}
+
+    report = await get_analytics(bucket, since, until, top, refresh)
+    if "error" in report:
+        return report
+    return {
+        **report,
+        "buckets": [
+            {"bucket": entry["bucket"], **{field: entry[field] for field in fields}}
+            for entry in report["buckets"]
+        ]
+    }
+
+
 @app.get("/health")
 def health_check():
     """
     Health check endpoint
 
     Returns:
-        dict: Health status and timestamp
+        dict: Health status, timestamp and LLM circuit breaker states
+    """
+    return {
+        "status": "healthy",
+        "timestamp": datetime.now().isoformat(),
+        "circuits": {name: breaker.to_dict() for name, breaker in breakers.items()}
+    }
+
+
+@app.get("/ready")
+def readiness_check():
+    """
+    Readiness check endpoint
+
+    Returns:
+        JSONResponse: 200 once all components are warmed up, 503 before that
     """
-    return {"status": "healthy", "timestamp": datetime.now().isoformat()}
+    status = components.status()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
 
 
 # Application entry point
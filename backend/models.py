@@ -1,6 +1,13 @@
+import os
+import sys
 from typing import Optional, Dict, List
 from datetime import datetime
 
+# Add current directory to Python path for local imports
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from itinerary import parse_itinerary_days
+
 
 class ConversationState:
     def __init__(self, session_id: str):
@@ -11,10 +18,15 @@ class ConversationState:
         self.end_date: Optional[str] = None
         self.trip_duration: Optional[int] = None
         self.itinerary: Optional[str] = None
+        # [{"day": 1, "content": "..."}], substrings of itinerary; not stored, parsed again on load
+        self.itinerary_days: List[Dict] = []
+        self.itinerary_ref: Optional[str] = None  # Blob holding the itinerary, loaded on demand
         self.theme: Optional[str] = None
         self.scope: Optional[str] = None  # 'domestic' or 'international'
         self.conversation_step = "greeting"  # greeting, gathering_info, generating_itinerary, completed
-        self.messages: List[Dict] = []
+        self.job_id: Optional[str] = None  # Background itinerary job, when job mode is enabled
+        self.turns_to_itinerary: Optional[int] = None  # User turns it took to reach the first itinerary
+        self.messages: List[Dict] = []  # Large contents may be stored as a "content_ref" blob key instead
         self.missing_fields: List[str] = []
         self.created_at = datetime.now()
         self.updated_at = datetime.now()
@@ -27,9 +39,13 @@ class ConversationState:
             "start_date": self.start_date,
             "end_date": self.end_date,
             "trip_duration": self.trip_duration,
+            "itinerary": self.itinerary,
+            "itinerary_ref": self.itinerary_ref,
             "theme": self.theme,
             "scope": self.scope,
             "conversation_step": self.conversation_step,
+            "job_id": self.job_id,
+            "turns_to_itinerary": self.turns_to_itinerary,
             "missing_fields": self.missing_fields,
             "messages": self.messages,
             "created_at": self.created_at.isoformat() if self.created_at else None,
@@ -44,9 +60,14 @@ class ConversationState:
         state.start_date = data.get("start_date")
         state.end_date = data.get("end_date")
         state.trip_duration = data.get("trip_duration")
+        state.itinerary = data.get("itinerary")
+        state.itinerary_days = parse_itinerary_days(state.itinerary) if state.itinerary else []
+        state.itinerary_ref = data.get("itinerary_ref")
         state.theme = data.get("theme")
         state.scope = data.get("scope")
         state.conversation_step = data.get("conversation_step", "greeting")
+        state.job_id = data.get("job_id")
+        state.turns_to_itinerary = data.get("turns_to_itinerary")
         state.messages = data.get("messages", [])
         state.missing_fields = data.get("missing_fields", [])
         created_at_str = data.get("created_at")
@@ -63,6 +84,36 @@ class ConversationState:
         })
         self.updated_at = datetime.now()
 
+    def merge_messages(self, messages: List[Dict]) -> int:
+        """Add the messages of another copy of this session that this one lacks; returns how many"""
+        known = {(m["role"], m["timestamp"]) for m in self.messages}
+        extra = [m for m in messages if (m["role"], m["timestamp"]) not in known]
+        if extra:
+            self.messages = sorted(self.messages + extra, key=lambda m: m["timestamp"])
+        return len(extra)
+
+    def analytics_facts(self) -> Dict:
+        """The fields analytics reports use, matching the projection of the analytics pipeline"""
+        return {
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "conversation_step": self.conversation_step,
+            "missing_fields": list(self.missing_fields),
+            "destination": self.destination,
+            "turns_to_itinerary": self.turns_to_itinerary
+        }
+
+    def to_update_dict(self) -> Dict:
+        """
+        The state for per-turn state_update events
+
+        Messages and the itinerary were already streamed as events (and may only be
+        blob references here), so they are left out; /session returns them in full.
+        """
+        data = self.to_dict()
+        for field in ("messages", "itinerary"):
+            data.pop(field, None)
+        return data
+
     def get_missing_fields(self) -> List[str]:
         missing = []
         if not self.destination:
@@ -74,3 +125,50 @@ class ConversationState:
         if not self.trip_duration:
             missing.append("trip_duration")
         return missing
+
+
+class GenerationJob:
+    def __init__(self, job_id: str, session_id: str, kind: str = "itinerary"):
+        self.job_id = job_id
+        self.session_id = session_id
+        self.kind = kind
+        self.status = "queued"  # queued, running, completed, failed
+        self.attempts = 0  # Times a worker has claimed the job
+        self.result: Optional[Dict] = None
+        self.error: Optional[str] = None
+        self.created_at = datetime.now()
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in ("completed", "failed")
+
+    def to_dict(self) -> Dict:
+        return {
+            "job_id": self.job_id,
+            "session_id": self.session_id,
+            "kind": self.kind,
+            "status": self.status,
+            "attempts": self.attempts,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "GenerationJob":
+        job = cls(data["job_id"], data["session_id"], data.get("kind", "itinerary"))
+        job.status = data.get("status", "queued")
+        job.attempts = data.get("attempts", 0)
+        job.result = data.get("result")
+        job.error = data.get("error")
+        created_at_str = data.get("created_at")
+        job.created_at = datetime.fromisoformat(created_at_str) if created_at_str else datetime.now()
+        started_at_str = data.get("started_at")
+        job.started_at = datetime.fromisoformat(started_at_str) if started_at_str else None
+        finished_at_str = data.get("finished_at")
+        job.finished_at = datetime.fromisoformat(finished_at_str) if finished_at_str else None
+        return job
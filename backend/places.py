@@ -0,0 +1,287 @@
+import json
+import logging
+import os
+import unicodedata
+from typing import Optional, Dict, List
+
+logger = logging.getLogger("TravelBot")
+
+# Optional JSON file with extra places: [{"name": ..., "country": ..., "region": ..., "aliases": [...]}]
+PLACES_FILE = os.getenv("PLACES_FILE")
+
+# Built-in gazetteer: (canonical name, country, region, aliases)
+# Countries use themselves as the country; regions are continents/sub-continents.
+# Aliases are other names for the same place; places within it (a region's city,
+# a city's landmark) get their own entries, since the canonical name goes into prompts.
+_BUILTIN_PLACES = [
+    # India
+    ("India", "India", "South Asia", ["bharat", "hindustan"]),
+    ("Delhi", "India", "South Asia", ["new delhi", "dilli"]),
+    ("Mumbai", "India", "South Asia", ["bombay"]),
+    ("Bengaluru", "India", "South Asia", ["bangalore", "blr"]),
+    ("Chennai", "India", "South Asia", ["madras"]),
+    ("Kolkata", "India", "South Asia", ["calcutta"]),
+    ("Hyderabad", "India", "South Asia", ["hyd"]),
+    ("Pune", "India", "South Asia", ["poona"]),
+    ("Ahmedabad", "India", "South Asia", ["amdavad"]),
+    ("Jaipur", "India", "South Asia", ["pink city"]),
+    ("Goa", "India", "South Asia", []),
+    ("Kerala", "India", "South Asia", ["gods own country"]),
+    ("Kochi", "India", "South Asia", ["cochin"]),
+    ("Varanasi", "India", "South Asia", ["banaras", "benares", "kashi"]),
+    ("Agra", "India", "South Asia", []),
+    ("Udaipur", "India", "South Asia", []),
+    ("Manali", "India", "South Asia", []),
+    ("Shimla", "India", "South Asia", ["simla"]),
+    ("Rishikesh", "India", "South Asia", []),
+    ("Leh", "India", "South Asia", []),
+    ("Ladakh", "India", "South Asia", ["leh ladakh"]),
+    ("Srinagar", "India", "South Asia", []),
+    ("Kashmir", "India", "South Asia", []),
+    ("Darjeeling", "India", "South Asia", []),
+    ("Andaman and Nicobar Islands", "India", "South Asia", ["andaman", "andamans"]),
+    ("Port Blair", "India", "South Asia", []),
+    ("Mysuru", "India", "South Asia", ["mysore"]),
+    ("Puducherry", "India", "South Asia", ["pondicherry", "pondy"]),
+    # Rest of Asia
+    ("Nepal", "Nepal", "South Asia", []),
+    ("Kathmandu", "Nepal", "South Asia", []),
+    ("Sri Lanka", "Sri Lanka", "South Asia", ["ceylon"]),
+    ("Colombo", "Sri Lanka", "South Asia", []),
+    ("Maldives", "Maldives", "South Asia", []),
+    ("Male", "Maldives", "South Asia", []),
+    ("Bhutan", "Bhutan", "South Asia", []),
+    ("Thailand", "Thailand", "Southeast Asia", []),
+    ("Bangkok", "Thailand", "Southeast Asia", ["bkk", "krung thep"]),
+    ("Phuket", "Thailand", "Southeast Asia", []),
+    ("Singapore", "Singapore", "Southeast Asia", ["sg", "sin"]),
+    ("Malaysia", "Malaysia", "Southeast Asia", []),
+    ("Kuala Lumpur", "Malaysia", "Southeast Asia", ["kl"]),
+    ("Indonesia", "Indonesia", "Southeast Asia", []),
+    ("Bali", "Indonesia", "Southeast Asia", []),
+    ("Denpasar", "Indonesia", "Southeast Asia", []),
+    ("Vietnam", "Vietnam", "Southeast Asia", ["viet nam"]),
+    ("Hanoi", "Vietnam", "Southeast Asia", []),
+    ("Ho Chi Minh City", "Vietnam", "Southeast Asia", ["saigon", "hcmc"]),
+    ("Japan", "Japan", "East Asia", ["nippon"]),
+    ("Tokyo", "Japan", "East Asia", []),
+    ("Kyoto", "Japan", "East Asia", []),
+    ("Osaka", "Japan", "East Asia", []),
+    ("China", "China", "East Asia", ["prc"]),
+    ("Beijing", "China", "East Asia", ["peking"]),
+    ("Shanghai", "China", "East Asia", []),
+    ("Hong Kong", "China", "East Asia", ["hk", "hkg"]),
+    ("South Korea", "South Korea", "East Asia", ["korea", "republic of korea"]),
+    ("Seoul", "South Korea", "East Asia", []),
+    ("United Arab Emirates", "United Arab Emirates", "Middle East", ["uae", "emirates"]),
+    ("Dubai", "United Arab Emirates", "Middle East", ["dxb"]),
+    ("Abu Dhabi", "United Arab Emirates", "Middle East", []),
+    ("Turkey", "Turkey", "Middle East", ["turkiye"]),
+    ("Istanbul", "Turkey", "Middle East", ["constantinople"]),
+    ("Russia", "Russia", "Europe", ["russian federation"]),
+    ("Moscow", "Russia", "Europe", []),
+    # Europe
+    ("France", "France", "Europe", []),
+    ("Paris", "France", "Europe", ["city of light"]),
+    ("Nice", "France", "Europe", []),
+    ("United Kingdom", "United Kingdom", "Europe", ["uk", "great britain", "britain"]),
+    ("England", "United Kingdom", "Europe", []),
+    ("London", "United Kingdom", "Europe", ["lon"]),
+    ("Edinburgh", "United Kingdom", "Europe", []),
+    ("Italy", "Italy", "Europe", ["italia"]),
+    ("Rome", "Italy", "Europe", ["roma"]),
+    ("Venice", "Italy", "Europe", ["venezia"]),
+    ("Florence", "Italy", "Europe", ["firenze"]),
+    ("Milan", "Italy", "Europe", ["milano"]),
+    ("Spain", "Spain", "Europe", ["espana"]),
+    ("Barcelona", "Spain", "Europe", ["bcn"]),
+    ("Madrid", "Spain", "Europe", []),
+    ("Portugal", "Portugal", "Europe", []),
+    ("Lisbon", "Portugal", "Europe", ["lisboa"]),
+    ("Netherlands", "Netherlands", "Europe", ["holland", "the netherlands"]),
+    ("Amsterdam", "Netherlands", "Europe", []),
+    ("Germany", "Germany", "Europe", ["deutschland"]),
+    ("Berlin", "Germany", "Europe", []),
+    ("Munich", "Germany", "Europe", ["munchen"]),
+    ("Czech Republic", "Czech Republic", "Europe", ["czechia"]),
+    ("Prague", "Czech Republic", "Europe", ["praha"]),
+    ("Austria", "Austria", "Europe", []),
+    ("Vienna", "Austria", "Europe", ["wien"]),
+    ("Hungary", "Hungary", "Europe", []),
+    ("Budapest", "Hungary", "Europe", []),
+    ("Switzerland", "Switzerland", "Europe", ["swiss"]),
+    ("Zurich", "Switzerland", "Europe", ["zuerich"]),
+    ("Greece", "Greece", "Europe", ["hellas"]),
+    ("Athens", "Greece", "Europe", []),
+    ("Santorini", "Greece", "Europe", ["thira"]),
+    ("Croatia", "Croatia", "Europe", []),
+    ("Dubrovnik", "Croatia", "Europe", []),
+    ("Montenegro", "Montenegro", "Europe", []),
+    ("Serbia", "Serbia", "Europe", []),
+    ("Poland", "Poland", "Europe", []),
+    ("Krakow", "Poland", "Europe", ["cracow"]),
+    ("Slovakia", "Slovakia", "Europe", []),
+    ("Romania", "Romania", "Europe", []),
+    ("Bulgaria", "Bulgaria", "Europe", []),
+    ("Ukraine", "Ukraine", "Europe", []),
+    ("Belarus", "Belarus", "Europe", []),
+    ("Estonia", "Estonia", "Europe", []),
+    ("Latvia", "Latvia", "Europe", []),
+    ("Lithuania", "Lithuania", "Europe", []),
+    ("Norway", "Norway", "Europe", []),
+    ("Oslo", "Norway", "Europe", []),
+    ("Sweden", "Sweden", "Europe", []),
+    ("Stockholm", "Sweden", "Europe", []),
+    ("Finland", "Finland", "Europe", ["suomi"]),
+    ("Helsinki", "Finland", "Europe", []),
+    ("Denmark", "Denmark", "Europe", []),
+    ("Copenhagen", "Denmark", "Europe", ["kobenhavn"]),
+    ("Iceland", "Iceland", "Europe", []),
+    ("Reykjavik", "Iceland", "Europe", []),
+    # Americas
+    ("United States", "United States", "North America", ["usa", "us", "united states of america", "america"]),
+    ("New York", "United States", "North America", ["nyc", "new york city", "ny", "big apple"]),
+    ("Manhattan", "United States", "North America", []),
+    ("Los Angeles", "United States", "North America", ["la", "lax"]),
+    ("San Francisco", "United States", "North America", ["sf", "san fran", "sfo"]),
+    ("Las Vegas", "United States", "North America", ["vegas"]),
+    ("Miami", "United States", "North America", []),
+    ("Chicago", "United States", "North America", []),
+    ("Canada", "Canada", "North America", []),
+    ("Toronto", "Canada", "North America", []),
+    ("Vancouver", "Canada", "North America", []),
+    ("Mexico", "Mexico", "North America", []),
+    ("Cancun", "Mexico", "North America", []),
+    ("Brazil", "Brazil", "South America", ["brasil"]),
+    ("Rio de Janeiro", "Brazil", "South America", ["rio"]),
+    ("Argentina", "Argentina", "South America", []),
+    ("Buenos Aires", "Argentina", "South America", []),
+    ("Peru", "Peru", "South America", []),
+    ("Cusco", "Peru", "South America", ["cuzco"]),
+    ("Machu Picchu", "Peru", "South America", []),
+    ("Chile", "Chile", "South America", []),
+    # Africa and Oceania
+    ("Egypt", "Egypt", "Africa", []),
+    ("Cairo", "Egypt", "Africa", []),
+    ("Morocco", "Morocco", "Africa", []),
+    ("Marrakesh", "Morocco", "Africa", ["marrakech"]),
+    ("South Africa", "South Africa", "Africa", []),
+    ("Cape Town", "South Africa", "Africa", []),
+    ("Kenya", "Kenya", "Africa", []),
+    ("Mauritius", "Mauritius", "Africa", []),
+    ("Seychelles", "Seychelles", "Africa", []),
+    ("Australia", "Australia", "Oceania", ["oz"]),
+    ("Sydney", "Australia", "Oceania", []),
+    ("Melbourne", "Australia", "Oceania", []),
+    ("New Zealand", "New Zealand", "Oceania", ["nz", "aotearoa"]),
+    ("Auckland", "New Zealand", "Oceania", []),
+]
+
+
+class Place:
+    def __init__(self, name: str, country: str, region: Optional[str] = None, aliases: Optional[List[str]] = None):
+        self.name = name
+        self.country = country
+        self.region = region
+        self.aliases = aliases or []
+
+    @property
+    def is_country(self) -> bool:
+        return self.name == self.country
+
+    def to_dict(self) -> Dict:
+        return {
+            "name": self.name,
+            "country": self.country,
+            "region": self.region,
+            "aliases": self.aliases
+        }
+
+
+# Normalized alias -> Place, built once by load_place_index()
+place_index: Dict[str, Place] = {}
+
+
+def normalize_place_key(text: str) -> str:
+    """Normalize a place string for lookup: lowercase, no diacritics, no punctuation"""
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    text = "".join(ch if ch.isalnum() else " " for ch in text.lower())
+    words = text.split()
+    if words and words[0] == "the":
+        words = words[1:]
+    return " ".join(words)
+
+
+def _add_place(index: Dict[str, Place], place: Place):
+    for alias in [place.name] + place.aliases:
+        key = normalize_place_key(alias)
+        if key and key not in index:
+            index[key] = place
+
+
+def load_place_index() -> Dict[str, Place]:
+    """Build the canonical place index (built-in gazetteer plus optional PLACES_FILE)"""
+    global place_index
+
+    index: Dict[str, Place] = {}
+    for name, country, region, aliases in _BUILTIN_PLACES:
+        _add_place(index, Place(name, country, region, aliases))
+
+    if PLACES_FILE:
+        try:
+            with open(PLACES_FILE, encoding="utf-8") as f:
+                for entry in json.load(f):
+                    place = Place(entry["name"], entry.get("country", entry["name"]), entry.get("region"), entry.get("aliases", []))
+                    # Custom entries take precedence over the built-in ones
+                    for alias in [place.name] + place.aliases:
+                        key = normalize_place_key(alias)
+                        if key:
+                            index[key] = place
+        except Exception as e:
+            logger.error(f"Failed to load places file {PLACES_FILE}: {e}")
+
+    place_index = index
+    logger.info(f"Loaded place index with {len(place_index)} aliases")
+    return place_index
+
+
+def lookup_place(text: Optional[str]) -> Optional[Place]:
+    """Resolve a free-form place string to its canonical Place"""
+    if not text:
+        return None
+    if not place_index:
+        load_place_index()
+    place = place_index.get(normalize_place_key(text))
+    if place or "," not in text:
+        return place
+
+    # "Paris, France", "Kyoto, Kansai, Japan": the leading segment names the place, and the last
+    # one must be its country, so "Paris, Texas" stays unknown
+    segments = [normalize_place_key(segment) for segment in text.split(",")]
+    place = place_index.get(segments[0])
+    if not place or not segments[-1]:
+        return place
+    country = place_index.get(segments[-1])
+    return place if country and country.country == place.country else None
+
+
+def canonicalize_place(text: Optional[str]) -> Optional[str]:
+    """Return the canonical place name, or the trimmed input if it is unknown"""
+    if not text:
+        return text
+    place = lookup_place(text)
+    return place.name if place else text.strip()
+
+
+def resolve_scope(destination: Optional[str], flying_from: Optional[str], domestic_country: str) -> Optional[str]:
+    """Decide 'domestic' or 'international' from the place index, or None if unknown"""
+    dest_place = lookup_place(destination)
+    if not dest_place:
+        return None
+
+    origin_place = lookup_place(flying_from) if flying_from else lookup_place(domestic_country)
+    if not origin_place:
+        return None
+
+    return "domestic" if dest_place.country == origin_place.country else "international"
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+Itinerary Pre-generation for Travel Bot Backend
+
+Generates itineraries for popular destination/duration/theme combinations ahead
+of time and stores them in MongoDB, where generate_itinerary serves them to
+matching trips instead of calling the model. The demand list is a JSON lines
+file of {"destination", "trip_duration", "theme", "count"} entries, either
+written by hand or mined from stored sessions. Combinations that already have
+an itinerary are skipped, so an interrupted run resumes where it stopped.
+
+Usage:
+    python pregenerate.py mine demand.jsonl [--top 50] [--min-count 2]
+    python pregenerate.py run demand.jsonl [--top 50] [--concurrency 4] [--force]
+    python pregenerate.py run --from-sessions [--top 50] [--min-count 2]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from collections import Counter
+from datetime import datetime
+
+# Add current directory to Python path for local imports
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from components import load_environment
+load_environment()
+
+import database
+from itinerary import parse_itinerary_days
+from places import canonicalize_place
+from services import GENERATION_MODEL, build_itinerary_prompt, request_itinerary, pregenerated_key
+
+# Longer trips are too rare and too expensive to generate speculatively
+MAX_TRIP_DAYS = 14
+
+
+def demand_entry(destination, trip_duration, theme=None, count=0):
+    theme = (theme or "").strip().lower() or None
+    return {
+        "destination": canonicalize_place(destination),
+        "trip_duration": int(trip_duration),
+        "theme": theme,
+        "count": count
+    }
+
+
+def rank_demand(entries, top=None, min_count=0):
+    """Merge duplicate combinations, drop unusable ones and order by demand"""
+    merged = {}
+    for entry in entries:
+        if not entry["destination"] or not 0 < entry["trip_duration"] <= MAX_TRIP_DAYS:
+            continue
+        key = pregenerated_key(entry["destination"], entry["trip_duration"], entry["theme"])
+        if key in merged:
+            merged[key]["count"] += entry["count"]
+        else:
+            merged[key] = dict(entry)
+
+    ranked = sorted(merged.values(), key=lambda e: e["count"], reverse=True)
+    ranked = [entry for entry in ranked if entry["count"] >= min_count]
+    return ranked[:top] if top else ranked
+
+
+# Counts combinations in the database, so session documents (and their messages) never leave it
+DEMAND_PIPELINE = [
+    {"$match": {"destination": {"$nin": [None, ""]}, "trip_duration": {"$nin": [None, "", 0]}}},
+    {"$group": {
+        "_id": {"destination": "$destination", "trip_duration": "$trip_duration", "theme": "$theme"},
+        "count": {"$sum": 1}
+    }}
+]
+
+
+async def mine_demand():
+    """One entry per destination/duration/theme combination seen in stored sessions"""
+    if database.use_in_memory:
+        counts = Counter(
+            (state.destination, state.trip_duration, state.theme)
+            for state in database.in_memory_conversations.values()
+            if state.destination and state.trip_duration
+        )
+        rows = [
+            ({"destination": destination, "trip_duration": days, "theme": theme}, count)
+            for (destination, days, theme), count in counts.items()
+        ]
+    else:
+        rows = [(row["_id"], row["count"]) for row in await database.aggregate_conversations(DEMAND_PIPELINE)]
+    # rank_demand merges combinations that only differ in spelling (e.g. "3" and 3 days)
+    return [demand_entry(trip["destination"], trip["trip_duration"], trip.get("theme"), count) for trip, count in rows]
+
+
+def read_demand(path):
+    entries = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                data = json.loads(line)
+                entries.append(demand_entry(data["destination"], data["trip_duration"], data.get("theme"), data.get("count", 0)))
+    return entries
+
+
+async def pregenerate(demand, concurrency, force):
+    """Generate and store an itinerary for every combination in demand that doesn't have one yet"""
+    existing = set() if force else set(await database.get_pregenerated_keys())
+    pending = [
+        entry for entry in demand
+        if pregenerated_key(entry["destination"], entry["trip_duration"], entry["theme"]) not in existing
+    ]
+    stats = {"generated": 0, "skipped": len(demand) - len(pending), "failed": 0}
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    print(f"{len(pending)} itineraries to generate, {stats['skipped']} already stored")
+
+    async def generate(entry):
+        key = pregenerated_key(entry["destination"], entry["trip_duration"], entry["theme"])
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                prompt = build_itinerary_prompt(entry["destination"], entry["trip_duration"], entry["theme"])
+                itinerary = await request_itinerary(prompt)
+                if not parse_itinerary_days(itinerary):
+                    raise ValueError("reply has no day-by-day sections")
+
+                # Saved as soon as it's ready, so an interrupted run loses at most the in-flight ones
+                await database.save_pregenerated_itinerary({
+                    "key": key,
+                    "destination": entry["destination"],
+                    "trip_duration": entry["trip_duration"],
+                    "theme": entry["theme"],
+                    "itinerary": itinerary,
+                    "model": GENERATION_MODEL,
+                    "demand": entry["count"],
+                    "created_at": datetime.now().isoformat()
+                })
+                stats["generated"] += 1
+                print(f"  generated {key} in {time.perf_counter() - started:.1f}s")
+            except Exception as e:
+                stats["failed"] += 1
+                print(f"  failed {key}: {e!r}")
+
+    await asyncio.gather(*(generate(entry) for entry in pending))
+    return stats
+
+
+async def run_mine(output_path, top, min_count):
+    await database.init_database()
+    demand = rank_demand(await mine_demand(), top, min_count)
+    await database.close_database()
+
+    with open(output_path, "w", encoding="utf-8") as f:
+        for entry in demand:
+            f.write(json.dumps(entry) + "\n")
+    print(f"Wrote {len(demand)} combinations to {output_path}")
+
+
+async def run_pregenerate(demand_path, from_sessions, top, min_count, concurrency, force):
+    await database.init_database()
+    if database.use_in_memory:
+        print("Pre-generated itineraries must be stored in MongoDB; set MONGODB_URL")
+        return 1
+
+    try:
+        entries = await mine_demand() if from_sessions else read_demand(demand_path)
+        demand = rank_demand(entries, top, min_count)
+        started = time.perf_counter()
+        stats = await pregenerate(demand, concurrency, force)
+    finally:
+        await database.close_database()
+
+    print(
+        f"Done in {time.perf_counter() - started:.1f}s: {stats['generated']} generated, "
+        f"{stats['skipped']} already stored, {stats['failed']} failed"
+    )
+    return 1 if stats["failed"] else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-generate itineraries for popular trips")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    mine_parser = subparsers.add_parser("mine", help="Write a demand list mined from stored sessions")
+    mine_parser.add_argument("output", help="JSON lines file to write")
+
+    run_parser = subparsers.add_parser("run", help="Generate and store itineraries for a demand list")
+    run_parser.add_argument("demand", nargs="?", help="Demand list (JSON lines)")
+    run_parser.add_argument("--from-sessions", action="store_true", help="Mine the demand list from stored sessions")
+    run_parser.add_argument("--concurrency", type=int, default=4, help="Itineraries generated at once")
+    run_parser.add_argument("--force", action="store_true", help="Regenerate combinations that are already stored")
+
+    for sub in (mine_parser, run_parser):
+        sub.add_argument("--top", type=int, help="Only the N most requested combinations")
+        sub.add_argument("--min-count", type=int, default=0, help="Skip combinations requested fewer times")
+
+    args = parser.parse_args()
+    if args.command == "mine":
+        asyncio.run(run_mine(args.output, args.top, args.min_count))
+        return 0
+    if not args.demand and not args.from_sessions:
+        parser.error("run needs a demand file or --from-sessions")
+    return asyncio.run(run_pregenerate(args.demand, args.from_sessions, args.top, args.min_count, args.concurrency, args.force))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
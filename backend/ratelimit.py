@@ -0,0 +1,172 @@
+import json
+import logging
+import math
+import os
+import re
+import sys
+import time
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+# Add current directory to Python path for local imports
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from database import take_rate_limit_tokens
+
+logger = logging.getLogger("TravelBot")
+
+# Rate limit configuration
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")  # memory or storage
+RATE_LIMIT_REQUESTS_PER_MINUTE = float(os.getenv("RATE_LIMIT_REQUESTS_PER_MINUTE", "120"))
+RATE_LIMIT_TURNS_PER_MINUTE_IP = float(os.getenv("RATE_LIMIT_TURNS_PER_MINUTE_IP", "30"))
+RATE_LIMIT_TURNS_PER_MINUTE_SESSION = float(os.getenv("RATE_LIMIT_TURNS_PER_MINUTE_SESSION", "10"))
+RATE_LIMIT_TRUST_PROXY = os.getenv("RATE_LIMIT_TRUST_PROXY", "false").lower() == "true"
+# Proxies in front of the app that append to X-Forwarded-For; entries left of theirs are client-supplied
+RATE_LIMIT_PROXY_HOPS = max(1, int(os.getenv("RATE_LIMIT_PROXY_HOPS", "1")))
+RATE_LIMIT_MAX_BUCKETS = int(os.getenv("RATE_LIMIT_MAX_BUCKETS", "100000"))
+
+# Requests that are never limited
+EXEMPT_PATHS = {"/health", "/ready"}
+# Chat turns (each may trigger LLM calls) get their own, smaller budgets
+CHAT_TURN_PATH = re.compile(r"^/chat/([^/]+)$")
+
+
+class TokenBucket:
+    def __init__(self, capacity: float, refill_per_second: float):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def take(self, cost: float = 1) -> float:
+        """Take tokens; returns 0 on success or the seconds to wait before retrying"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.refill_per_second)
+        self.updated_at = now
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return 0
+        return (cost - self.tokens) / self.refill_per_second if self.refill_per_second > 0 else math.inf
+
+
+class RateLimiter:
+    """
+    Token buckets keyed by client IP and session id
+
+    Buckets live in process memory (bounded, least recently used evicted) or,
+    with the storage backend, in MongoDB so several workers share them. If the
+    shared store is unavailable the in-memory buckets are used.
+    """
+
+    def __init__(self, backend: str = RATE_LIMIT_BACKEND, max_buckets: int = RATE_LIMIT_MAX_BUCKETS):
+        self.backend = backend
+        self.max_buckets = max_buckets
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+
+    def _take_local(self, key: str, per_minute: float) -> float:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            # Allow a burst of one minute's budget
+            bucket = TokenBucket(per_minute, per_minute / 60)
+            self._buckets[key] = bucket
+            if len(self._buckets) > self.max_buckets:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+        return bucket.take()
+
+    async def take(self, key: str, per_minute: float) -> float:
+        if self.backend == "storage":
+            retry_after = await take_rate_limit_tokens(key, per_minute, per_minute / 60)
+            if retry_after is not None:
+                return retry_after
+        return self._take_local(key, per_minute)
+
+    async def check(self, limits: List[Tuple[str, float]]) -> float:
+        """Take one token from each (key, per_minute) bucket; returns the longest wait, 0 if allowed"""
+        retry_after = 0.0
+        for key, per_minute in limits:
+            if per_minute > 0:
+                retry_after = max(retry_after, await self.take(key, per_minute))
+        return retry_after
+
+    async def check_turn(self, client_ip: str, session_id: str) -> float:
+        """Budget check for one chat turn from a client and session"""
+        return await self.check([
+            (f"turn:ip:{client_ip}", RATE_LIMIT_TURNS_PER_MINUTE_IP),
+            (f"turn:session:{session_id}", RATE_LIMIT_TURNS_PER_MINUTE_SESSION),
+        ])
+
+
+rate_limiter = RateLimiter()
+
+
+def get_client_ip(scope) -> str:
+    """Client address of an ASGI connection, from X-Forwarded-For only when behind a trusted proxy"""
+    if RATE_LIMIT_TRUST_PROXY:
+        forwarded = [
+            address.strip()
+            for name, value in scope.get("headers", []) if name == b"x-forwarded-for"
+            for address in value.decode("latin-1").split(",") if address.strip()
+        ]
+        if forwarded:
+            # Each trusted proxy appends the address it received the request from, so the
+            # client is the entry added by the outermost one; anything further left is spoofable
+            return forwarded[-min(RATE_LIMIT_PROXY_HOPS, len(forwarded))]
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+class RateLimitMiddleware:
+    """
+    ASGI middleware that rejects over-budget clients before any work is done
+
+    Every HTTP request and WebSocket handshake takes from the client's request
+    bucket, and chat turns (POST /chat/{session_id}) also take from the
+    client's and the session's turn buckets. Rejected HTTP requests get a 429
+    with Retry-After; rejected WebSocket handshakes are closed. WebSocket
+    messages are checked per turn by the chat connection itself.
+    """
+
+    def __init__(self, app, limiter: Optional[RateLimiter] = None):
+        self.app = app
+        self.limiter = limiter or rate_limiter
+
+    async def __call__(self, scope, receive, send):
+        if not RATE_LIMIT_ENABLED or scope["type"] not in ("http", "websocket") or scope["path"] in EXEMPT_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        client_ip = get_client_ip(scope)
+        limits = [(f"request:ip:{client_ip}", RATE_LIMIT_REQUESTS_PER_MINUTE)]
+        retry_after = await self.limiter.check(limits)
+
+        turn = CHAT_TURN_PATH.match(scope["path"])
+        if not retry_after and turn and scope.get("method") == "POST":
+            retry_after = await self.limiter.check_turn(client_ip, turn.group(1))
+
+        if not retry_after:
+            await self.app(scope, receive, send)
+            return
+
+        logger.warning(f"Rate limited {client_ip} on {scope['path']} (retry after {retry_after:.1f}s)")
+        if scope["type"] == "websocket":
+            # Reject the handshake; the server answers it with a 403
+            await receive()
+            await send({"type": "websocket.close", "code": 1008, "reason": "Too many requests"})
+            return
+
+        retry_seconds = max(1, math.ceil(retry_after))
+        body = json.dumps({"error": "Too many requests", "retry_after": retry_seconds}).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode("latin-1")),
+                (b"retry-after", str(retry_seconds).encode("latin-1")),
+                (b"access-control-allow-origin", b"*"),
+            ]
+        })
+        await send({"type": "http.response.body", "body": body})
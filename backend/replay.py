@@ -0,0 +1,435 @@
+#!/usr/bin/env python3
+"""
+Traffic Replay Harness for Travel Bot Backend
+
+Exports the user turns of stored conversations and replays them through the
+message pipeline (process_user_message) in-process, against in-memory storage
+and a stubbed or recorded LLM. Each run writes per-turn latencies, extracted
+entities and conversation_step transitions, and two runs (e.g. from two
+builds) can be compared.
+
+Usage:
+    python replay.py export traffic.jsonl [--limit N]
+    python replay.py run traffic.jsonl results.json [--speed 10] [--llm stub|record|recorded]
+    python replay.py compare baseline.json candidate.json
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import re
+import statistics
+import sys
+import time
+from datetime import datetime
+
+# Add current directory to Python path for local imports
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from components import components, load_environment
+load_environment()
+
+import database
+from places import lookup_place
+from services import process_user_message
+
+ENTITY_FIELDS = ["destination", "flying_from", "start_date", "end_date", "trip_duration", "theme", "scope"]
+DEFAULT_RECORDING_FILE = "llm_recording.jsonl"
+
+
+async def export_traffic(output_path, limit=None):
+    """Write the user turns of every stored conversation as JSON lines"""
+    await database.init_database()
+    conversations = await database.get_all_conversations()
+    exported = 0
+
+    with open(output_path, "w", encoding="utf-8") as f:
+        for state in conversations[:limit] if limit else conversations:
+            await database.resolve_messages(state.messages)
+            turns = [
+                {"content": message["content"], "timestamp": message.get("timestamp")}
+                for message in state.messages
+                if message.get("role") == "user"
+            ]
+            if turns:
+                f.write(json.dumps({"session_id": state.session_id, "turns": turns}) + "\n")
+                exported += 1
+
+    await database.close_database()
+    print(f"Exported {exported} sessions to {output_path}")
+
+
+def load_traffic(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+class _Message:
+    def __init__(self, content):
+        self.content = content
+
+
+class _Choice:
+    def __init__(self, content):
+        self.message = _Message(content)
+
+
+class _Completion:
+    def __init__(self, content):
+        self.choices = [_Choice(content)]
+
+
+class _Delta:
+    def __init__(self, content):
+        self.content = content
+
+
+class _ChunkChoice:
+    def __init__(self, content):
+        self.delta = _Delta(content)
+
+
+class _Chunk:
+    def __init__(self, content):
+        self.choices = [_ChunkChoice(content)]
+
+
+def _respond(content, stream):
+    """A completion, or a stream of small chunks when stream=True was requested"""
+    if not stream:
+        return _Completion(content)
+    return iter([_Chunk(content[i:i + 16]) for i in range(0, len(content), 16)])
+
+
+class _Completions:
+    def __init__(self, create):
+        self.create = create
+
+
+class _Chat:
+    def __init__(self, create):
+        self.completions = _Completions(create)
+
+
+class StubLLMClient:
+    """
+    Deterministic stand-in for the Groq client
+
+    Extraction requests get a JSON answer built from simple rules, itinerary
+    requests get a day-by-day skeleton and edit requests get the sections they
+    were sent back with each line revised, after an optional fixed latency.
+    """
+
+    def __init__(self, latency_ms=0):
+        self.latency = latency_ms / 1000
+        self.chat = _Chat(self.create)
+
+    def create(self, model, messages, **kwargs):
+        return _respond(self.content(messages), kwargs.get("stream", False))
+
+    def content(self, messages):
+        if self.latency:
+            time.sleep(self.latency)
+        system = messages[0]["content"] if messages else ""
+        user = messages[-1]["content"] if messages else ""
+        if "JSON array of user messages" in system:
+            items = json.loads(user)
+            return json.dumps({"results": [dict(self._extract(item["message"]), id=item["id"]) for item in items]})
+        if "Extract the following fields" in system:
+            return json.dumps(self._extract(user))
+        if "rewritten sections" in system:
+            return self._edit(user)
+        return self._itinerary(user)
+
+    def _extract(self, text):
+        data = {field: None for field in ["destination", "flying_from", "start_date", "end_date", "trip_duration", "travel_type", "region_preference"]}
+
+        origin = re.search(r"\bfrom\s+([A-Za-z][A-Za-z .'-]*?)(?=\s+(?:to|on|for|in|starting)\b|[,.!?]|$)", text)
+        if origin and lookup_place(origin.group(1)):
+            data["flying_from"] = origin.group(1).strip()
+        target = re.search(r"\b(?:to|visit|in)\s+([A-Za-z][A-Za-z .'-]*?)(?=\s+(?:from|on|for|starting|in)\b|[,.!?]|$)", text)
+        if target and lookup_place(target.group(1)):
+            data["destination"] = target.group(1).strip()
+        elif not origin and lookup_place(text):
+            # A bare place name answering "Where would you like to travel to?"
+            data["destination"] = text.strip()
+
+        date = re.search(r"\b\d{4}-\d{2}-\d{2}\b", text)
+        if date:
+            data["start_date"] = date.group(0)
+        duration = re.search(r"\b(\d+)[\s-]*days?\b", text, flags=re.IGNORECASE)
+        if duration:
+            data["trip_duration"] = int(duration.group(1))
+        elif re.fullmatch(r"\s*\d+\s*", text):
+            data["trip_duration"] = int(text)
+        return data
+
+    def _itinerary(self, prompt):
+        days = re.search(r"for (\d+) days", prompt)
+        day_count = int(days.group(1)) if days else 1
+        sections = []
+        for day in range(1, day_count + 1):
+            sections.append(
+                f"### Day {day}: Exploring\n"
+                f"- **Morning:** Walking tour\n"
+                f"- **Afternoon:** Local museum\n"
+                f"- **Evening:** Dinner at a local restaurant"
+            )
+        return "\n\n".join(sections)
+
+    def _edit(self, prompt):
+        # Sections follow the context, request and instruction paragraphs
+        sections = "\n\n".join(prompt.split("\n\n")[2:])
+        return "\n".join(
+            line if line.lstrip().startswith("#") or not line.strip() else f"{line} (revised)"
+            for line in sections.splitlines()
+        )
+
+
+def _request_key(model, messages):
+    payload = json.dumps({"model": model, "messages": messages}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class RecordingLLMClient:
+    """Wraps the real client and appends every response to a recording file"""
+
+    def __init__(self, inner, path):
+        self.inner = inner
+        self.path = path
+        self.chat = _Chat(self.create)
+
+    def create(self, model, messages, **kwargs):
+        response = self.inner.chat.completions.create(model=model, messages=messages, **kwargs)
+        if kwargs.get("stream"):
+            content = "".join(chunk.choices[0].delta.content or "" for chunk in response if chunk.choices)
+        else:
+            content = response.choices[0].message.content
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"key": _request_key(model, messages), "content": content}) + "\n")
+        return _respond(content or "", kwargs.get("stream", False))
+
+
+class RecordedLLMClient:
+    """Serves responses from a recording file, falling back to the stub on a miss"""
+
+    def __init__(self, path, latency_ms=0):
+        self.responses = {}
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self.responses[entry["key"]] = entry["content"]
+        self.stub = StubLLMClient(latency_ms)
+        self.misses = 0
+        self.chat = _Chat(self.create)
+
+    def create(self, model, messages, **kwargs):
+        key = _request_key(model, messages)
+        if key in self.responses:
+            if self.stub.latency:
+                time.sleep(self.stub.latency)
+            return _respond(self.responses[key] or "", kwargs.get("stream", False))
+        self.misses += 1
+        return self.stub.create(model, messages, **kwargs)
+
+
+def install_llm(mode, recording_path, latency_ms):
+    """Replace the registry's LLM client for the duration of the run"""
+    if mode == "record":
+        client = RecordingLLMClient(components.get("llm_client"), recording_path)
+    elif mode == "recorded":
+        client = RecordedLLMClient(recording_path, latency_ms)
+    else:
+        client = StubLLMClient(latency_ms)
+    components.override("llm_client", client)
+    return client
+
+
+def _parse_timestamp(value):
+    try:
+        return datetime.fromisoformat(value).timestamp() if value else None
+    except ValueError:
+        return None
+
+
+def _snapshot(state):
+    snapshot = {field: getattr(state, field) for field in ENTITY_FIELDS}
+    snapshot["conversation_step"] = state.conversation_step
+    return snapshot
+
+
+async def replay_session(session, speed, origin_time, run_start):
+    """Replay one session's turns in order, honoring original timing scaled by speed"""
+    session_id = f"replay-{session['session_id']}"
+    await database.delete_conversation_state(session_id)
+    results = []
+
+    for index, turn in enumerate(session["turns"]):
+        sent_at = _parse_timestamp(turn.get("timestamp"))
+        if speed > 0 and sent_at is not None and origin_time is not None:
+            delay = (sent_at - origin_time) / speed - (time.perf_counter() - run_start)
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+        start = time.perf_counter()
+        first_event_ms = None
+        event_types = []
+        async for chunk in process_user_message(session_id, turn["content"]):
+            if first_event_ms is None:
+                first_event_ms = (time.perf_counter() - start) * 1000
+            event_types.append(json.loads(chunk[len("data: "):]).get("type"))
+        latency_ms = (time.perf_counter() - start) * 1000
+
+        state = await database.get_conversation_state(session_id)
+        results.append({
+            "turn": index,
+            "message": turn["content"],
+            "latency_ms": round(latency_ms, 2),
+            "first_event_ms": round(first_event_ms or latency_ms, 2),
+            "events": event_types,
+            "state": _snapshot(state) if state else None
+        })
+
+    return {"session_id": session["session_id"], "turns": results}
+
+
+def latency_summary(values):
+    if not values:
+        return {}
+    ordered = sorted(values)
+
+    def percentile(p):
+        return round(ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))], 2)
+
+    return {
+        "count": len(ordered),
+        "mean": round(statistics.mean(ordered), 2),
+        "p50": percentile(50),
+        "p90": percentile(90),
+        "p99": percentile(99),
+        "max": round(ordered[-1], 2)
+    }
+
+
+async def run_replay(traffic_path, output_path, speed, llm_mode, recording_path, latency_ms, concurrency):
+    # Never write replayed traffic to the real database
+    database.use_in_memory = True
+    client = install_llm(llm_mode, recording_path, latency_ms)
+
+    sessions = load_traffic(traffic_path)
+    timestamps = [
+        _parse_timestamp(session["turns"][0].get("timestamp"))
+        for session in sessions if session["turns"]
+    ]
+    timestamps = [ts for ts in timestamps if ts is not None]
+    origin_time = min(timestamps) if timestamps else None
+
+    semaphore = asyncio.Semaphore(concurrency)
+    run_start = time.perf_counter()
+
+    async def bounded(session):
+        async with semaphore:
+            return await replay_session(session, speed, origin_time, run_start)
+
+    session_results = await asyncio.gather(*(bounded(session) for session in sessions))
+    elapsed = time.perf_counter() - run_start
+
+    latencies = [turn["latency_ms"] for session in session_results for turn in session["turns"]]
+    first_events = [turn["first_event_ms"] for session in session_results for turn in session["turns"]]
+    report = {
+        "traffic": traffic_path,
+        "llm": llm_mode,
+        "speed": speed,
+        "elapsed_seconds": round(elapsed, 2),
+        "latency_ms": latency_summary(latencies),
+        "first_event_ms": latency_summary(first_events),
+        "sessions": session_results
+    }
+    if isinstance(client, RecordedLLMClient):
+        report["recording_misses"] = client.misses
+
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, default=str)
+
+    print(f"Replayed {len(latencies)} turns from {len(sessions)} sessions in {elapsed:.1f}s")
+    print(f"Turn latency (ms): {report['latency_ms']}")
+    print(f"First event (ms):  {report['first_event_ms']}")
+    print(f"Results written to {output_path}")
+
+
+def compare_runs(baseline_path, candidate_path):
+    """Print latency changes and behavioral differences between two replay runs"""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    with open(candidate_path, encoding="utf-8") as f:
+        candidate = json.load(f)
+
+    print("Turn latency (ms):")
+    for key in ["p50", "p90", "p99", "max", "mean"]:
+        before = baseline["latency_ms"].get(key)
+        after = candidate["latency_ms"].get(key)
+        if before is not None and after is not None:
+            change = f"{(after - before) / before * 100:+.1f}%" if before else "n/a"
+            print(f"  {key:<5} {before:10.2f} -> {after:10.2f}  ({change})")
+
+    candidate_sessions = {session["session_id"]: session for session in candidate["sessions"]}
+    diffs = 0
+    for session in baseline["sessions"]:
+        other = candidate_sessions.get(session["session_id"])
+        if other is None:
+            print(f"Session {session['session_id']}: missing from candidate")
+            diffs += 1
+            continue
+        for before, after in zip(session["turns"], other["turns"]):
+            if before["state"] == after["state"]:
+                continue
+            diffs += 1
+            changed = {
+                key: (before["state"] or {}).get(key) for key in set(before["state"] or {}) | set(after["state"] or {})
+                if (before["state"] or {}).get(key) != (after["state"] or {}).get(key)
+            }
+            print(f"Session {session['session_id']} turn {before['turn']}: {before['message']!r}")
+            for key in sorted(changed):
+                print(f"    {key}: {changed[key]!r} -> {(after['state'] or {}).get(key)!r}")
+
+    print(f"{diffs} behavioral difference(s)")
+    return 1 if diffs else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay stored Travel Bot conversations")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export", help="Export user turns from stored sessions")
+    export_parser.add_argument("output", help="JSON lines file to write")
+    export_parser.add_argument("--limit", type=int, help="Export at most this many sessions")
+
+    run_parser = subparsers.add_parser("run", help="Replay exported traffic through the pipeline")
+    run_parser.add_argument("traffic", help="File written by 'export'")
+    run_parser.add_argument("output", help="JSON results file to write")
+    run_parser.add_argument("--speed", type=float, default=0, help="Timing acceleration (1 = original timing, 0 = no delays)")
+    run_parser.add_argument("--llm", choices=["stub", "record", "recorded"], default="stub", help="LLM to use (default stub)")
+    run_parser.add_argument("--recording", default=DEFAULT_RECORDING_FILE, help="Recording file for record/recorded modes")
+    run_parser.add_argument("--llm-latency-ms", type=float, default=0, help="Simulated latency for stubbed responses")
+    run_parser.add_argument("--concurrency", type=int, default=50, help="Sessions replayed at once (default 50)")
+
+    compare_parser = subparsers.add_parser("compare", help="Compare two replay results")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("candidate")
+
+    args = parser.parse_args()
+
+    if args.command == "export":
+        asyncio.run(export_traffic(args.output, args.limit))
+        return 0
+    if args.command == "run":
+        asyncio.run(run_replay(args.traffic, args.output, args.speed, args.llm, args.recording, args.llm_latency_ms, args.concurrency))
+        return 0
+    return compare_runs(args.baseline, args.candidate)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
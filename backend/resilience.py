@@ -0,0 +1,133 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger("TravelBot")
+
+# Latency budgets per stage, in seconds
+EXTRACTION_BUDGET_SECONDS = float(os.getenv("EXTRACTION_BUDGET_SECONDS", "4"))
+GENERATION_BUDGET_SECONDS = float(os.getenv("GENERATION_BUDGET_SECONDS", "60"))
+EDIT_BUDGET_SECONDS = float(os.getenv("EDIT_BUDGET_SECONDS", "30"))
+# Launch a second extraction attempt if the first hasn't answered after this long (0 disables)
+EXTRACTION_HEDGE_AFTER_SECONDS = float(os.getenv("EXTRACTION_HEDGE_AFTER_SECONDS", "0"))
+
+# Circuit breaker configuration
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "3"))
+BREAKER_RESET_SECONDS = float(os.getenv("BREAKER_RESET_SECONDS", "30"))
+
+
+class CircuitBreaker:
+    """
+    Stops calling a failing dependency for a while
+
+    After failure_threshold consecutive failures the circuit opens and calls
+    are short-circuited. Once reset_seconds have passed it goes half-open and
+    lets a single probe through: success closes it, failure opens it again.
+    A probe that never reports back (its call was cancelled) is released, and
+    one left outstanding for reset_seconds is replaced by a new probe.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = BREAKER_FAILURE_THRESHOLD, reset_seconds: float = BREAKER_RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = "closed"  # closed, open, half_open
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self._probe_started_at = 0.0
+
+    def allow_request(self) -> bool:
+        if self.state == "closed":
+            return True
+        if self.state == "open":
+            if time.monotonic() - self.opened_at < self.reset_seconds:
+                return False
+            self.state = "half_open"
+            logger.info(f"Circuit '{self.name}' half-open, probing")
+        # Half-open: only one probe at a time
+        now = time.monotonic()
+        if self._probe_in_flight and now - self._probe_started_at < self.reset_seconds:
+            return False
+        self._probe_in_flight = True
+        self._probe_started_at = now
+        return True
+
+    def release(self):
+        """Give back a probe whose call ended without a result, e.g. because it was cancelled"""
+        self._probe_in_flight = False
+
+    def record_success(self):
+        if self.state != "closed":
+            logger.info(f"Circuit '{self.name}' closed")
+        self.state = "closed"
+        self.failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._probe_in_flight = False
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                logger.warning(f"Circuit '{self.name}' opened after {self.failures} failure(s)")
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    def to_dict(self) -> Dict:
+        return {"state": self.state, "failures": self.failures}
+
+
+# One breaker per LLM stage
+breakers: Dict[str, CircuitBreaker] = {
+    "extraction": CircuitBreaker("extraction"),
+    "generation": CircuitBreaker("generation"),
+}
+
+
+async def call_with_budget(func: Callable[[], Any], budget: float, hedge_after: Optional[float] = None) -> Any:
+    """
+    Run a blocking call in a thread and give up once the latency budget is spent
+
+    With hedge_after set, a second identical attempt is started if the first
+    hasn't finished by then, and whichever succeeds first wins. Raises
+    asyncio.TimeoutError when the budget runs out. Abandoned attempts finish
+    in their threads, so func should also carry its own client timeout.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + budget
+    hedging = bool(hedge_after) and hedge_after < budget
+    attempts = [asyncio.ensure_future(asyncio.to_thread(func))]
+    started = 1
+    last_error: Optional[BaseException] = None
+
+    try:
+        if hedging:
+            done, _ = await asyncio.wait(attempts, timeout=hedge_after)
+            if not done:
+                logger.info("Hedging slow call with a second attempt")
+                attempts.append(asyncio.ensure_future(asyncio.to_thread(func)))
+                started += 1
+
+        while attempts:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                raise asyncio.TimeoutError()
+            done, _ = await asyncio.wait(attempts, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                raise asyncio.TimeoutError()
+            for attempt in done:
+                attempts.remove(attempt)
+                if attempt.exception() is None:
+                    return attempt.result()
+                last_error = attempt.exception()
+
+            # A fast failure gets one retry when hedging is enabled
+            if not attempts and hedging and started < 2:
+                attempts.append(asyncio.ensure_future(asyncio.to_thread(func)))
+                started += 1
+        raise last_error
+    finally:
+        for attempt in attempts:
+            attempt.cancel()
@@ -1,36 +1,62 @@
 import logging
 import json
-import re
 import asyncio
 import sys
 import os
-from typing import AsyncGenerator
-from groq import Groq
-from dotenv import load_dotenv
+import uuid
+from datetime import datetime
+from typing import AsyncGenerator, Awaitable, Callable, Dict, List, Optional, Tuple
 
 # Add current directory to Python path for local imports
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from models import ConversationState
-from database import get_conversation_state, save_conversation_state
-from utils import is_greeting, normalize_dates_in_text, clean_entity_value, get_missing_info_questions
-
-load_dotenv()
+from models import ConversationState, GenerationJob
+from database import (
+    get_conversation_state, save_conversation_state, resolve_itinerary, get_pregenerated_itinerary, get_job
+)
+from utils import (
+    is_greeting, normalize_dates_in_text, count_date_expressions, clean_entity_value, get_missing_info_questions,
+    strip_reasoning, JsonStreamParser, extract_first_json, rule_based_entities
+)
+from places import canonicalize_place, resolve_scope, normalize_place_key
+from components import get_llm_client
+from batching import MicroBatcher
+from executor import cpu_executor
+from resilience import (
+    breakers, call_with_budget, EXTRACTION_BUDGET_SECONDS, EXTRACTION_HEDGE_AFTER_SECONDS,
+    GENERATION_BUDGET_SECONDS, EDIT_BUDGET_SECONDS
+)
+from jobs import JOB_MODE, enqueue_job, job_is_stale
+from tracing import span, annotate_turn, capture, record_prompt
+from itinerary import parse_itinerary_days, split_day_slots, classify_itinerary_edit, apply_itinerary_edits
 
 logger = logging.getLogger("TravelBot")
 
-# Initialize Groq client
-client = Groq()
-
 DEFAULT_DOMESTIC_COUNTRY = "India"
 
+# Micro-batching of entity extraction across concurrent sessions
+EXTRACTION_BATCHING = os.getenv("EXTRACTION_BATCHING", "false").lower() == "true"
+EXTRACTION_BATCH_WINDOW_MS = float(os.getenv("EXTRACTION_BATCH_WINDOW_MS", "5"))
+EXTRACTION_BATCH_MAX_ITEMS = int(os.getenv("EXTRACTION_BATCH_MAX_ITEMS", "8"))
+
+# Model routing per stage: a small, fast model in JSON mode for extraction and a larger
+# model for itineraries. Set *_MAX_TOKENS to 0 for no cap.
+EXTRACTION_MODEL = os.getenv("EXTRACTION_MODEL", "llama-3.1-8b-instant")
+EXTRACTION_MAX_TOKENS = int(os.getenv("EXTRACTION_MAX_TOKENS", "300"))
+# JSON mode can't be streamed; without it the reply is streamed and read only up to the first JSON object
+EXTRACTION_JSON_MODE = os.getenv("EXTRACTION_JSON_MODE", "true").lower() == "true"
+GENERATION_MODEL = os.getenv("GENERATION_MODEL", "deepseek-r1-distill-llama-70b")
+GENERATION_MAX_TOKENS = int(os.getenv("GENERATION_MAX_TOKENS", "0"))
+EDIT_MODEL = os.getenv("EDIT_MODEL", GENERATION_MODEL)
+EDIT_MAX_TOKENS = int(os.getenv("EDIT_MAX_TOKENS", "0"))
+
+# Serve itineraries built ahead of time by pregenerate.py when the trip matches
+SERVE_PREGENERATED = os.getenv("SERVE_PREGENERATED", "true").lower() == "true"
+
+StateSaver = Callable[[ConversationState], Awaitable[None]]
 
-def extract_entities(user_input: str, state: ConversationState) -> ConversationState:
-    """Extract travel entities from user input using AI"""
-    logger.info("Extracting entities...")
-    normalized_input = normalize_dates_in_text(user_input)
 
-    system_prompt = """
+EXTRACTION_SYSTEM_PROMPT = """
 You are an AI travel assistant. Extract the following fields from the user's message and return only a JSON object:
 
 {
@@ -49,139 +75,479 @@ You are an AI travel assistant. Extract the following fields from the user's mes
 - For dates, use YYYY-MM-DD format.
 """
 
-    ai_extraction_success = False
 
+def complete_extraction(messages: List[Dict], max_tokens: int, openers: str = "{") -> str:
+    """
+    Run an extraction completion on the extraction model and return the raw reply
+
+    In JSON mode the whole reply is the JSON object. Otherwise the reply is
+    streamed and reading stops as soon as the first JSON value opening with
+    one of openers is complete, skipping any reasoning preamble.
+    """
+    options = {
+        "model": EXTRACTION_MODEL,
+        "messages": messages,
+        "temperature": 0,
+        "timeout": EXTRACTION_BUDGET_SECONDS
+    }
+    if max_tokens > 0:
+        options["max_tokens"] = max_tokens
+
+    if EXTRACTION_JSON_MODE:
+        response = get_llm_client().chat.completions.create(response_format={"type": "json_object"}, **options)
+        return (response.choices[0].message.content or "").strip()
+
+    stream = get_llm_client().chat.completions.create(stream=True, **options)
+    parser = JsonStreamParser(openers)
     try:
-        response = client.chat.completions.create(
-            model="deepseek-r1-distill-llama-70b",
-            messages=[
-                {"role": "system", "content": system_prompt.strip()},
-                {"role": "user", "content": normalized_input.strip()}
-            ],
-            temperature=0
+        for chunk in stream:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta and parser.feed(delta):
+                break
+    finally:
+        if hasattr(stream, "close"):
+            stream.close()
+    return parser.buffer.strip()
+
+
+def request_entity_extraction(normalized_input: str) -> str:
+    """Ask the model for the entities in a message and return its raw reply"""
+    return complete_extraction(
+        [
+            {"role": "system", "content": EXTRACTION_SYSTEM_PROMPT.strip()},
+            {"role": "user", "content": normalized_input.strip()}
+        ],
+        EXTRACTION_MAX_TOKENS
+    )
+
+
+BATCH_EXTRACTION_SYSTEM_PROMPT = """
+You are an AI travel assistant. You will receive a JSON array of user messages, each with an "id".
+For every message, extract the following fields and return only a JSON object with one result per message:
+
+{
+  "results": [
+    {
+      "id": "<the message's id>",
+      "destination": "...",
+      "flying_from": "...",
+      "start_date": "...",
+      "end_date": "...",
+      "trip_duration": ...,
+      "travel_type": "...",
+      "region_preference": "domestic" or "international" or null
+    }
+  ]
+}
+
+- Treat each message independently.
+- If any value is missing or cannot be clearly determined, use null.
+- Only reply with the JSON object, without explanation or extra formatting.
+- For trip_duration, extract number of days as integer.
+- For dates, use YYYY-MM-DD format.
+"""
+
+
+def request_batch_entity_extraction(items: List[Tuple[str, str]]) -> str:
+    """Ask the model for the entities in several messages at once and return its raw reply"""
+    batch = [{"id": item_id, "message": text.strip()} for item_id, text in items]
+    return complete_extraction(
+        [
+            {"role": "system", "content": BATCH_EXTRACTION_SYSTEM_PROMPT.strip()},
+            {"role": "user", "content": json.dumps(batch, ensure_ascii=False)}
+        ],
+        EXTRACTION_MAX_TOKENS * len(items),
+        # Batched replies may be a bare array of results
+        openers="{["
+    )
+
+
+def parse_extraction_reply(raw_reply: str) -> Optional[Dict]:
+    """Pull the first JSON object out of an extraction reply, or None if there isn't one"""
+    json_text = extract_first_json(raw_reply)
+    if not json_text:
+        logger.warning("No valid JSON found in model response.")
+        return None
+    try:
+        return json.loads(json_text)
+    except json.JSONDecodeError as e:
+        logger.warning(f"Failed to parse AI extraction: {e}")
+        return None
+
+
+async def extract_single(normalized_input: str) -> Optional[Dict]:
+    """One extraction call, within the latency budget"""
+    raw_reply = await call_with_budget(
+        lambda: request_entity_extraction(normalized_input),
+        EXTRACTION_BUDGET_SECONDS,
+        EXTRACTION_HEDGE_AFTER_SECONDS
+    )
+    return parse_extraction_reply(raw_reply)
+
+
+async def extract_batch(items: List[Tuple[str, str]]) -> Dict[str, Dict]:
+    """One extraction call for several messages; returns results keyed by item id"""
+    raw_reply = await call_with_budget(lambda: request_batch_entity_extraction(items), EXTRACTION_BUDGET_SECONDS)
+    json_text = extract_first_json(raw_reply, "{[")
+    if not json_text:
+        raise ValueError("No JSON found in batched extraction reply")
+    data = json.loads(json_text)
+    entries = data.get("results", []) if isinstance(data, dict) else data
+    return {
+        str(entry["id"]): entry
+        for entry in entries
+        if isinstance(entry, dict) and "id" in entry
+    }
+
+
+# Opt-in: combine extraction requests from concurrent sessions into one completion
+extraction_batcher = MicroBatcher(extract_batch, extract_single, EXTRACTION_BATCH_WINDOW_MS, EXTRACTION_BATCH_MAX_ITEMS)
+
+
+def apply_extracted_entities(data: Dict, state: ConversationState):
+    """Copy model-extracted entities into the state, only filling fields that are not already set"""
+    if not state.destination:
+        state.destination = clean_entity_value(data.get("destination"))
+    if not state.flying_from:
+        state.flying_from = clean_entity_value(data.get("flying_from"))
+    if not state.start_date:
+        state.start_date = clean_entity_value(data.get("start_date"))
+    if not state.end_date:
+        state.end_date = clean_entity_value(data.get("end_date"))
+    if not state.trip_duration:
+        trip_duration = data.get("trip_duration")
+        state.trip_duration = int(trip_duration) if isinstance(trip_duration, int) and trip_duration > 0 else None
+    if not state.scope:
+        state.scope = clean_entity_value(data.get("region_preference"))
+    if not state.theme:
+        state.theme = clean_entity_value(data.get("travel_type"))
+
+
+async def extract_entities(user_input: str, state: ConversationState) -> ConversationState:
+    """
+    Extract travel entities from user input using AI
+
+    The model call is bounded by EXTRACTION_BUDGET_SECONDS and guarded by a
+    circuit breaker; when it is slow, failing or short-circuited the
+    rule-based fallback is used instead.
+    """
+    logger.info("Extracting entities...")
+    # Each date expression costs a dateparser call however short the message, so any
+    # message with one is offloaded; the rest only runs the (cheap) patterns
+    date_expressions = count_date_expressions(user_input)
+    with span("dates.normalize", **{"input.chars": len(user_input), "dates.found": date_expressions}):
+        normalized_input = await cpu_executor.run(
+            normalize_dates_in_text, user_input, size=len(user_input), offload=date_expressions > 0
         )
 
-        raw_reply = response.choices[0].message.content
-        if raw_reply is None:
-            raw_reply = ""
-        raw_reply = raw_reply.strip()
-
-        match = re.search(r'\{.*\}', raw_reply, flags=re.DOTALL)
-        if match:
-            json_str = match.group(0)
-            data = json.loads(json_str)
-
-            # Only update fields that are not already set
-            if not state.destination:
-                state.destination = clean_entity_value(data.get("destination"))
-            if not state.flying_from:
-                state.flying_from = clean_entity_value(data.get("flying_from"))
-            if not state.start_date:
-                state.start_date = clean_entity_value(data.get("start_date"))
-            if not state.end_date:
-                state.end_date = clean_entity_value(data.get("end_date"))
-            if not state.trip_duration:
-                trip_duration = data.get("trip_duration")
-                state.trip_duration = int(trip_duration) if isinstance(trip_duration, int) and trip_duration > 0 else None
-            if not state.scope:
-                state.scope = clean_entity_value(data.get("region_preference"))
-            if not state.theme:
-                state.theme = clean_entity_value(data.get("travel_type"))
-
-            ai_extraction_success = True
-        else:
-            logger.warning("No valid JSON found in model response.")
-    except Exception as e:
-        logger.warning(f"Failed to extract entities using AI: {e}")
+    ai_extraction_success = False
+    breaker = breakers["extraction"]
+
+    if not breaker.allow_request():
+        logger.info("Extraction circuit is open, skipping AI extraction")
+    else:
+        try:
+            record_prompt(len(EXTRACTION_SYSTEM_PROMPT) + len(normalized_input))
+            with span("extraction", **{"llm.model": EXTRACTION_MODEL, "extraction.batched": EXTRACTION_BATCHING}):
+                if EXTRACTION_BATCHING:
+                    data = await asyncio.wait_for(extraction_batcher.submit(normalized_input), EXTRACTION_BUDGET_SECONDS)
+                else:
+                    data = await extract_single(normalized_input)
+            breaker.record_success()
+
+            if data:
+                apply_extracted_entities(data, state)
+                ai_extraction_success = True
+        except asyncio.CancelledError:
+            breaker.release()
+            raise
+        except asyncio.TimeoutError:
+            breaker.record_failure()
+            logger.warning(f"AI extraction exceeded its {EXTRACTION_BUDGET_SECONDS}s budget")
+        except Exception as e:
+            breaker.record_failure()
+            logger.warning(f"Failed to extract entities using AI: {e}")
 
     # Fallback: Simple rule-based extraction for common cases
     if not ai_extraction_success:
-        logger.info("Using fallback entity extraction...")
-
-        # Simple destination extraction
-        if not state.destination:
-            # Common destinations
-            destinations = ["paris", "london", "tokyo", "new york", "rome", "barcelona", "amsterdam", "berlin", "madrid", "lisbon", "prague", "vienna", "budapest", "dubai", "singapore", "thailand", "bali", "maldives", "greece", "italy", "spain", "france", "germany", "japan", "india", "china", "australia", "canada", "usa", "uk", "mexico", "brazil", "argentina", "peru", "chile", "egypt", "morocco", "turkey", "russia", "norway", "sweden", "finland", "denmark", "iceland", "croatia", "montenegro", "serbia", "poland", "czech republic", "slovakia", "hungary", "romania", "bulgaria", "ukraine", "belarus", "estonia", "latvia", "lithuania"]
-
-            user_lower = user_input.lower()
-            for dest in destinations:
-                if dest in user_lower:
-                    state.destination = dest.title()
-                    break
-
-        # Simple duration extraction
-        if not state.trip_duration:
-            # Look for number + "day" patterns
-            duration_match = re.search(r'(\d+)\s*day', user_input.lower())
-            if duration_match:
-                state.trip_duration = int(duration_match.group(1))
-
-        # Simple theme extraction
-        if not state.theme:
-            themes = {
-                "romantic": ["romantic", "romance", "honeymoon", "couple", "anniversary"],
-                "adventure": ["adventure", "hiking", "trekking", "climbing", "extreme"],
-                "family": ["family", "kids", "children", "child"],
-                "business": ["business", "work", "conference", "meeting"],
-                "relaxation": ["relaxation", "spa", "wellness", "peaceful", "quiet"],
-                "cultural": ["cultural", "museum", "history", "art", "heritage"],
-                "food": ["food", "culinary", "restaurant", "dining", "cuisine"]
-            }
-
-            user_lower = user_input.lower()
-            for theme_type, keywords in themes.items():
-                if any(keyword in user_lower for keyword in keywords):
-                    state.theme = theme_type
-                    break
+        with span("extraction.fallback"):
+            logger.info("Using fallback entity extraction...")
+
+            # Keyword scans run in the CPU executor when the message is long
+            found = await cpu_executor.run(rule_based_entities, user_input, size=len(user_input))
+            state.destination = state.destination or found["destination"]
+            state.trip_duration = state.trip_duration or found["trip_duration"]
+            state.theme = state.theme or found["theme"]
+
+    # Canonicalize places so "NYC", "new york" and "New York City" share one key,
+    # and derive scope from the place index instead of trusting the model
+    state.destination = canonicalize_place(state.destination)
+    state.flying_from = canonicalize_place(state.flying_from)
+    scope = resolve_scope(state.destination, state.flying_from, DEFAULT_DOMESTIC_COUNTRY)
+    if scope:
+        state.scope = scope
 
     logger.info(f"Extracted: {state.to_dict()}")
     return state
 
 
-async def generate_itinerary(state: ConversationState) -> str:
-    """Generate travel itinerary using AI"""
-    logger.info("Generating itinerary...")
-
-    prompt = (
-        f"Create a detailed travel itinerary for a trip from {state.flying_from or DEFAULT_DOMESTIC_COUNTRY} "
-        f"to {state.destination} starting on {state.start_date} for {state.trip_duration} days. "
+def build_itinerary_prompt(
+    destination: str,
+    trip_duration: int,
+    theme: Optional[str] = None,
+    flying_from: Optional[str] = None,
+    start_date: Optional[str] = None
+) -> str:
+    """Itinerary prompt for a trip; without origin and start date it describes any trip of that shape"""
+    prompt = "Create a detailed travel itinerary for a trip"
+    if flying_from:
+        prompt += f" from {flying_from}"
+    prompt += f" to {destination}"
+    if start_date:
+        prompt += f" starting on {start_date}"
+    prompt += (
+        f" for {trip_duration} days. "
         f"Format the response as a well-structured itinerary with day-by-day activities, "
-        f"including morning, afternoon, and evening activities. Make it engaging and practical."
+        f"including morning, afternoon, and evening activities. Make it engaging and practical. "
+        f"Start each day with a heading like 'Day 1: <title>' and label its Morning, Afternoon and Evening sections."
     )
 
-    if state.theme:
-        prompt += f" Focus on {state.theme}-themed activities."
+    if theme:
+        prompt += f" Focus on {theme}-themed activities."
+    return prompt
 
-    try:
-        response = client.chat.completions.create(
-            model="deepseek-r1-distill-llama-70b",
+
+async def request_itinerary(prompt: str) -> str:
+    """Run an itinerary completion within the generation budget and return the itinerary text"""
+    response = await call_with_budget(
+        lambda: get_llm_client().chat.completions.create(
+            model=GENERATION_MODEL,
             messages=[
                 {"role": "system", "content": "You are a professional travel planner. Create detailed, practical itineraries."},
                 {"role": "user", "content": prompt}
             ],
-            temperature=0.7
-        )
+            temperature=0.7,
+            timeout=GENERATION_BUDGET_SECONDS,
+            **({"max_tokens": GENERATION_MAX_TOKENS} if GENERATION_MAX_TOKENS > 0 else {})
+        ),
+        GENERATION_BUDGET_SECONDS
+    )
+    return strip_reasoning(response.choices[0].message.content or "")
+
+
+def pregenerated_key(destination: str, trip_duration: int, theme: Optional[str] = None) -> str:
+    """Store key for a destination/duration/theme combination"""
+    return f"{normalize_place_key(destination)}|{int(trip_duration)}|{(theme or '').strip().lower()}"
+
 
-        itinerary = response.choices[0].message.content
-        if itinerary is None:
+async def find_pregenerated_itinerary(state: ConversationState) -> Optional[str]:
+    """Pre-generated itinerary matching the trip's destination, duration and theme, if there is one"""
+    if not (SERVE_PREGENERATED and state.destination and state.trip_duration):
+        return None
+    entry = await get_pregenerated_itinerary(pregenerated_key(state.destination, state.trip_duration, state.theme))
+    return entry["itinerary"] if entry else None
+
+
+async def generate_itinerary(state: ConversationState) -> str:
+    """Generate travel itinerary using AI"""
+    with span("generation.pregenerated_lookup") as lookup:
+        itinerary = await find_pregenerated_itinerary(state)
+        if lookup:
+            lookup.set(hit=bool(itinerary))
+    if itinerary:
+        logger.info("Serving pre-generated itinerary")
+        state.itinerary = itinerary
+        state.itinerary_days = parse_itinerary_days(itinerary)
+        return itinerary
+
+    logger.info("Generating itinerary...")
+
+    prompt = build_itinerary_prompt(
+        state.destination, state.trip_duration, state.theme,
+        state.flying_from or DEFAULT_DOMESTIC_COUNTRY, state.start_date
+    )
+
+    breaker = breakers["generation"]
+    if not breaker.allow_request():
+        logger.warning("Generation circuit is open, not calling the model")
+        return "I apologize, but our itinerary planner is temporarily unavailable. Please try again in a few minutes."
+
+    try:
+        record_prompt(len(prompt))
+        capture(**{"generation.prompt": prompt})
+        with span("generation", **{"llm.model": GENERATION_MODEL, "prompt.chars": len(prompt)}):
+            itinerary = await request_itinerary(prompt)
+        breaker.record_success()
+
+        if not itinerary:
             itinerary = "I apologize, but I couldn't generate an itinerary at this time. Please try again."
 
         state.itinerary = itinerary
-        logger.info("Itinerary generated successfully")
+        state.itinerary_days = parse_itinerary_days(itinerary)
+        logger.info(f"Itinerary generated successfully ({len(state.itinerary_days)} days parsed)")
         return itinerary
+    except asyncio.CancelledError:
+        breaker.release()
+        raise
+    except asyncio.TimeoutError:
+        breaker.record_failure()
+        logger.error(f"Itinerary generation exceeded its {GENERATION_BUDGET_SECONDS}s budget")
+        return "I apologize, but generating your itinerary is taking too long right now. Please try again."
     except Exception as e:
+        breaker.record_failure()
         logger.error(f"Error generating itinerary: {e}")
         return "I apologize, but I encountered an error while generating your itinerary. Please try again."
 
 
-async def process_user_message(session_id: str, user_message: str) -> AsyncGenerator[str, None]:
-    """Process user message and generate appropriate responses"""
+async def edit_itinerary(state: ConversationState, user_message: str, edit: Dict) -> Optional[str]:
+    """
+    Regenerate only the days/slots an edit request touches and splice them into the itinerary
+
+    Returns the updated itinerary, or None if the edit couldn't be applied.
+    """
+    current = {day["day"]: day["content"] for day in state.itinerary_days}
+    target_days = [day for day in edit["days"] if day in current] or sorted(current)
+    slots = edit["slots"]
+
+    # Slot-level edits need every targeted day to have those slots; otherwise rewrite whole days
+    if slots and not all(slot in split_day_slots(current[day]) for day in target_days for slot in slots):
+        slots = []
+    if not edit["days"] and not slots:
+        return None
+
+    sections = "\n\n".join(current[day] for day in target_days)
+    if slots:
+        slot_names = ", ".join(slots)
+        instruction = (
+            f"Rewrite only the {slot_names} section(s) of each day below. For each day, return its heading line "
+            f"followed by only the rewritten {slot_names} section(s), using the same labels and format."
+        )
+    else:
+        instruction = "Rewrite each day below. Return each day in full, starting with its original heading line, in the same format."
+
+    prompt = f"This is part of a {state.trip_duration}-day itinerary for {state.destination}."
+    if state.theme:
+        prompt += f" The trip is {state.theme}-themed."
+    prompt += f"\nTraveler's request: {user_message}\n\n{instruction}\n\n{sections}"
+
+    breaker = breakers["generation"]
+    if not breaker.allow_request():
+        logger.warning("Generation circuit is open, not editing the itinerary")
+        return None
+
+    logger.info(f"Editing itinerary days {target_days} (slots: {slots or 'all'})")
+    record_prompt(len(prompt))
+    try:
+        with span("edit", **{"llm.model": EDIT_MODEL, "prompt.chars": len(prompt), "edit.days": len(target_days)}):
+            response = await call_with_budget(
+                lambda: get_llm_client().chat.completions.create(
+                    model=EDIT_MODEL,
+                    messages=[
+                        {"role": "system", "content": "You are a professional travel planner. Apply the requested change and return only the rewritten sections."},
+                        {"role": "user", "content": prompt}
+                    ],
+                    temperature=0.7,
+                    timeout=EDIT_BUDGET_SECONDS,
+                    **({"max_tokens": EDIT_MAX_TOKENS} if EDIT_MAX_TOKENS > 0 else {})
+                ),
+                EDIT_BUDGET_SECONDS
+            )
+        breaker.record_success()
+        edited_text = strip_reasoning(response.choices[0].message.content or "")
+    except asyncio.CancelledError:
+        breaker.release()
+        raise
+    except asyncio.TimeoutError:
+        breaker.record_failure()
+        logger.error(f"Itinerary edit exceeded its {EDIT_BUDGET_SECONDS}s budget")
+        return None
+    except Exception as e:
+        breaker.record_failure()
+        logger.error(f"Error editing itinerary: {e}")
+        return None
+
+    updated = apply_itinerary_edits(state.itinerary, state.itinerary_days, edited_text, slots)
+    if updated:
+        state.itinerary = updated
+        state.itinerary_days = parse_itinerary_days(updated)
+    return updated
+
+
+async def complete_itinerary(state: ConversationState, save_state: StateSaver = save_conversation_state) -> Tuple[str, str]:
+    """Generate the itinerary, record it in the conversation and return (itinerary, follow-up) messages"""
+    itinerary = await generate_itinerary(state)
+    state.conversation_step = "completed"
+    state.job_id = None
+    if state.turns_to_itinerary is None:
+        state.turns_to_itinerary = sum(1 for message in state.messages if message["role"] == "user")
+
+    itinerary_response = f"Here's your personalized {state.trip_duration}-day itinerary for {state.destination}:\n\n{itinerary}"
+    state.add_message("bot", itinerary_response)
+    await save_state(state)
+
+    # Offer additional help
+    follow_up = "Would you like me to adjust anything in your itinerary or help you plan another trip?"
+    state.add_message("bot", follow_up)
+    await save_state(state)
+    return itinerary_response, follow_up
+
+
+async def start_itinerary_job(state: ConversationState) -> GenerationJob:
+    """Queue the itinerary for a session under a new job id"""
+    # The worker loads state from storage, so always persist it before enqueueing
+    state.job_id = uuid.uuid4().hex
+    await save_conversation_state(state)
+    return await enqueue_job(state.session_id, job_id=state.job_id)
+
+
+async def run_itinerary_job(job: GenerationJob) -> Dict:
+    """Worker pool handler: generate the itinerary for a queued session"""
+    state = await get_conversation_state(job.session_id)
+    if not state:
+        raise ValueError(f"Session {job.session_id} not found")
+    if state.job_id != job.job_id or state.conversation_step != "generating_itinerary":
+        # A newer job took over (this one looked stale, or was re-claimed after its lease)
+        # or the session moved on; generating now would add a second itinerary
+        logger.info(f"Skipping superseded job {job.job_id} for session {job.session_id}")
+        return {"superseded": True}
+
+    async def save_merged(updated: ConversationState):
+        # Generation takes a while: keep the turns the user took meanwhile instead of overwriting them
+        stored = await get_conversation_state(updated.session_id)
+        if stored and stored is not updated:
+            updated.merge_messages(stored.messages)
+        await save_conversation_state(updated)
+
+    itinerary_response, follow_up = await complete_itinerary(state, save_merged)
+    return {"itinerary": itinerary_response, "follow_up": follow_up}
+
+
+async def process_user_message(
+    session_id: str,
+    user_message: str,
+    state: Optional[ConversationState] = None,
+    save_state: StateSaver = save_conversation_state
+) -> AsyncGenerator[str, None]:
+    """
+    Process user message and generate appropriate responses
+
+    Long-lived connections pass their in-memory state and a deferred saver so
+    the state is not reloaded and rewritten on every turn.
+    """
     # Get or create conversation state
-    state = await get_conversation_state(session_id)
+    if state is None:
+        state = await get_conversation_state(session_id)
     if not state:
         state = ConversationState(session_id)
 
+    # Adding the message bumps updated_at; keep when the state last changed
+    last_updated_at = state.updated_at
     state.add_message("user", user_message)
+    annotate_turn(**{
+        "chat.turn": sum(1 for message in state.messages if message["role"] == "user"),
+        "chat.step": state.conversation_step
+    })
+    capture(**{"turn.input": user_message})
 
     # Handle greeting - only on first interaction
     if state.conversation_step == "greeting":
@@ -194,7 +560,7 @@ async def process_user_message(session_id: str, user_message: str) -> AsyncGener
             )
             state.add_message("bot", greeting_response)
             state.conversation_step = "gathering_info"  # Move to next step
-            await save_conversation_state(state)
+            await save_state(state)
             yield f"data: {json.dumps({'type': 'message', 'content': greeting_response})}\n\n"
             yield f"data: {json.dumps({'type': 'done'})}\n\n"
             return
@@ -206,7 +572,7 @@ async def process_user_message(session_id: str, user_message: str) -> AsyncGener
                 "I see you're ready to plan a trip! Let me help you with that."
             )
             state.add_message("bot", greeting_response)
-            await save_conversation_state(state)
+            await save_state(state)
             yield f"data: {json.dumps({'type': 'message', 'content': greeting_response})}\n\n"
             # Continue processing below - don't return here
 
@@ -214,7 +580,7 @@ async def process_user_message(session_id: str, user_message: str) -> AsyncGener
     if state.conversation_step == "gathering_info":
         # Extract entities from user message
         old_state = state.to_dict()  # Store old state for comparison
-        extract_entities(user_message, state)
+        await extract_entities(user_message, state)
 
         # Log what was extracted
         logger.info(f"Before extraction: {old_state}")
@@ -231,7 +597,7 @@ async def process_user_message(session_id: str, user_message: str) -> AsyncGener
             if next_question:
                 response = f"Great! I have some information about your trip. {next_question}"
                 state.add_message("bot", response)
-                await save_conversation_state(state)
+                await save_state(state)
                 yield f"data: {json.dumps({'type': 'message', 'content': response})}\n\n"
                 yield f"data: {json.dumps({'type': 'done'})}\n\n"
                 return
@@ -247,25 +613,55 @@ async def process_user_message(session_id: str, user_message: str) -> AsyncGener
             f"Let me create a detailed itinerary for you..."
         )
         state.add_message("bot", confirmation_message)
-        await save_conversation_state(state)
+        await save_state(state)
         yield f"data: {json.dumps({'type': 'message', 'content': confirmation_message})}\n\n"
 
-        # Generate itinerary
-        await asyncio.sleep(1)  # Show "thinking" delay
-        itinerary = await generate_itinerary(state)
-        state.conversation_step = "completed"
+        if JOB_MODE:
+            # Hand generation to the worker pool and let the client poll or subscribe
+            job = await start_itinerary_job(state)
+            yield f"data: {json.dumps({'type': 'job', 'job_id': job.job_id, 'status': job.status})}\n\n"
+            yield f"data: {json.dumps({'type': 'done'})}\n\n"
+            return
 
-        itinerary_response = f"Here's your personalized {state.trip_duration}-day itinerary for {state.destination}:\n\n{itinerary}"
-        state.add_message("bot", itinerary_response)
-        await save_conversation_state(state)
+        # Generate itinerary
+        with span("thinking_delay"):
+            await asyncio.sleep(1)  # Show "thinking" delay
+        itinerary_response, follow_up = await complete_itinerary(state, save_state)
         yield f"data: {json.dumps({'type': 'itinerary', 'content': itinerary_response})}\n\n"
-
-        # Offer additional help
-        follow_up = "Would you like me to adjust anything in your itinerary or help you plan another trip?"
-        state.add_message("bot", follow_up)
-        await save_conversation_state(state)
         yield f"data: {json.dumps({'type': 'message', 'content': follow_up})}\n\n"
 
+    elif state.conversation_step == "generating_itinerary":
+        job = await get_job(state.job_id) if state.job_id else None
+
+        if not JOB_MODE and (datetime.now() - last_updated_at).total_seconds() <= GENERATION_BUDGET_SECONDS:
+            # Another worker or connection is generating inline and will save the itinerary;
+            # this state is not saved, so the in-flight generation keeps its deadline
+            response = "I'm still working on your itinerary. It will be ready shortly!"
+            yield f"data: {json.dumps({'type': 'message', 'content': response})}\n\n"
+        elif job and not job.is_finished and not job_is_stale(job):
+            # Itinerary is still being generated in the background
+            response = "I'm still working on your itinerary. It will be ready shortly!"
+            state.add_message("bot", response)
+            await save_state(state)
+            yield f"data: {json.dumps({'type': 'job', 'job_id': state.job_id, 'status': 'pending'})}\n\n"
+            yield f"data: {json.dumps({'type': 'message', 'content': response})}\n\n"
+        else:
+            # The job finished without updating this state, failed, or was lost with its
+            # worker or a restart (or inline generation outlived its budget): start again
+            logger.warning(f"Itinerary for session {session_id} was not delivered (job: {job.status if job else 'missing'}), restarting it")
+            if JOB_MODE:
+                response = "Sorry for the wait! I'm preparing your itinerary again, it will be ready shortly."
+                state.add_message("bot", response)
+                job = await start_itinerary_job(state)
+                await save_state(state)
+                yield f"data: {json.dumps({'type': 'job', 'job_id': job.job_id, 'status': job.status})}\n\n"
+                yield f"data: {json.dumps({'type': 'message', 'content': response})}\n\n"
+            else:
+                state.job_id = None
+                itinerary_response, follow_up = await complete_itinerary(state, save_state)
+                yield f"data: {json.dumps({'type': 'itinerary', 'content': itinerary_response})}\n\n"
+                yield f"data: {json.dumps({'type': 'message', 'content': follow_up})}\n\n"
+
     elif state.conversation_step == "completed":
         # Handle post-itinerary conversation
         if "another trip" in user_message.lower() or "new trip" in user_message.lower():
@@ -276,6 +672,8 @@ async def process_user_message(session_id: str, user_message: str) -> AsyncGener
             state.end_date = None
             state.trip_duration = None
             state.itinerary = None
+            state.itinerary_days = []
+            state.itinerary_ref = None
             state.theme = None
             state.scope = None
             state.conversation_step = "gathering_info"
@@ -283,17 +681,39 @@ async def process_user_message(session_id: str, user_message: str) -> AsyncGener
 
             response = "Great! I'd be happy to help you plan another trip. What kind of adventure are you thinking of next?"
             state.add_message("bot", response)
-            await save_conversation_state(state)
+            await save_state(state)
             yield f"data: {json.dumps({'type': 'message', 'content': response})}\n\n"
         else:
-            # General conversation or itinerary modifications
-            response = (
-                "I'm here to help with your travel planning! "
-                "You can ask me to modify your itinerary, plan a new trip, or ask any travel-related questions."
-            )
-            state.add_message("bot", response)
-            await save_conversation_state(state)
-            yield f"data: {json.dumps({'type': 'message', 'content': response})}\n\n"
+            edit = None
+            if await resolve_itinerary(state) and state.itinerary_days:
+                edit = classify_itinerary_edit(user_message, {day["day"] for day in state.itinerary_days})
+
+            if edit and (edit["days"] or edit["slots"]):
+                updated = await edit_itinerary(state, user_message, edit)
+                if updated:
+                    itinerary_response = f"Here's your updated {state.trip_duration}-day itinerary for {state.destination}:\n\n{updated}"
+                    state.add_message("bot", itinerary_response)
+                    await save_state(state)
+                    yield f"data: {json.dumps({'type': 'itinerary', 'content': itinerary_response})}\n\n"
+                else:
+                    response = "I'm sorry, I couldn't update your itinerary this time. Could you describe the change again?"
+                    state.add_message("bot", response)
+                    await save_state(state)
+                    yield f"data: {json.dumps({'type': 'message', 'content': response})}\n\n"
+            elif edit:
+                response = "Sure! Which day (or morning, afternoon or evening) of your itinerary would you like me to change?"
+                state.add_message("bot", response)
+                await save_state(state)
+                yield f"data: {json.dumps({'type': 'message', 'content': response})}\n\n"
+            else:
+                # General conversation
+                response = (
+                    "I'm here to help with your travel planning! "
+                    "You can ask me to modify your itinerary, plan a new trip, or ask any travel-related questions."
+                )
+                state.add_message("bot", response)
+                await save_state(state)
+                yield f"data: {json.dumps({'type': 'message', 'content': response})}\n\n"
 
     # Send final stream termination event
     yield f"data: {json.dumps({'type': 'done'})}\n\n"
@@ -0,0 +1,141 @@
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+from collections import deque
+from typing import AsyncGenerator, AsyncIterator, Callable, Dict, Optional
+
+# Add current directory to Python path for local imports
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from tracing import span
+
+logger = logging.getLogger("TravelBot")
+
+# Replay buffer configuration
+REPLAY_BUFFER_SIZE = int(os.getenv("REPLAY_BUFFER_SIZE", "200"))
+STREAM_TTL_SECONDS = int(os.getenv("STREAM_TTL_SECONDS", "600"))
+
+
+class SessionStream:
+    """Per-session SSE event log with monotonic ids and a bounded replay buffer"""
+
+    def __init__(self, session_id: str, max_events: int = REPLAY_BUFFER_SIZE):
+        self.session_id = session_id
+        self.events: deque = deque(maxlen=max_events)  # (event_id, chunk)
+        self.last_event_id = 0
+        self.turn_active = False
+        self.turn_message: Optional[str] = None
+        self.turn_start_id = 0
+        self.task: Optional[asyncio.Task] = None
+        self.last_activity = time.monotonic()
+        self._condition = asyncio.Condition()
+
+    async def publish(self, chunk: str):
+        """Append an SSE chunk ("data: ...\\n\\n") to the log and wake subscribers"""
+        async with self._condition:
+            self.last_event_id += 1
+            self.events.append((self.last_event_id, chunk))
+            self.last_activity = time.monotonic()
+            self._condition.notify_all()
+
+    async def finish(self):
+        """Mark the current turn as finished"""
+        async with self._condition:
+            self.turn_active = False
+            self.turn_message = None
+            self.last_activity = time.monotonic()
+            self._condition.notify_all()
+
+    async def subscribe(self, last_event_id: int = 0) -> AsyncGenerator[str, None]:
+        """Yield events after last_event_id, then follow the in-flight turn until it finishes"""
+        cursor = last_event_id
+        while True:
+            async with self._condition:
+                pending = [(event_id, chunk) for event_id, chunk in self.events if event_id > cursor]
+                if not pending:
+                    if not self.turn_active:
+                        return
+                    await self._condition.wait()
+                    continue
+
+            for event_id, chunk in pending:
+                cursor = event_id
+                yield f"id: {event_id}\n{chunk}"
+
+
+# Session id -> stream, kept in-process
+session_streams: Dict[str, SessionStream] = {}
+
+
+def _prune_streams():
+    """Drop idle streams whose turn finished more than STREAM_TTL_SECONDS ago"""
+    now = time.monotonic()
+    expired = [
+        session_id for session_id, stream in session_streams.items()
+        if not stream.turn_active and now - stream.last_activity > STREAM_TTL_SECONDS
+    ]
+    for session_id in expired:
+        session_streams.pop(session_id, None)
+
+
+def get_session_stream(session_id: str) -> Optional[SessionStream]:
+    """Get the stream for a session if one exists"""
+    return session_streams.get(session_id)
+
+
+def drop_session_stream(session_id: str):
+    """Forget a session's stream (e.g. when the session is deleted)"""
+    stream = session_streams.pop(session_id, None)
+    if stream and stream.task and not stream.task.done():
+        stream.task.cancel()
+
+
+async def _run_turn(stream: SessionStream, events: AsyncIterator[str]):
+    """Drive a turn to completion, independent of any client connection"""
+    try:
+        async for chunk in events:
+            with span("stream.flush", **{"event.bytes": len(chunk)}):
+                await stream.publish(chunk)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        logger.error(f"Error while streaming turn for session {stream.session_id}: {e}")
+        await stream.publish(f"data: {json.dumps({'type': 'error', 'content': 'An error occurred while processing your message'})}\n\n")
+        await stream.publish(f"data: {json.dumps({'type': 'done'})}\n\n")
+    finally:
+        await stream.finish()
+
+
+def start_turn(session_id: str, user_message: str, events_factory: Callable[[], AsyncIterator[str]]) -> Optional[SessionStream]:
+    """
+    Start a turn in the background and return its stream
+
+    Returns None if a different message is already being processed for this
+    session. A re-post of the in-flight message attaches to the running turn
+    instead of starting a new one.
+    """
+    stream = session_streams.get(session_id)
+    if stream and stream.turn_active:
+        return stream if stream.turn_message == user_message else None
+
+    _prune_streams()
+    if stream is None:
+        stream = SessionStream(session_id)
+        session_streams[session_id] = stream
+
+    stream.turn_active = True
+    stream.turn_message = user_message
+    stream.turn_start_id = stream.last_event_id
+    stream.task = asyncio.create_task(_run_turn(stream, events_factory()))
+    return stream
+
+
+def parse_last_event_id(value: Optional[str]) -> int:
+    """Parse a Last-Event-ID header value, defaulting to 0"""
+    try:
+        return max(int(value), 0) if value else 0
+    except ValueError:
+        return 0
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the in-memory analytics aggregation and report shaping
+
+Run with: python -m pytest test_analytics.py
+"""
+
+import os
+import sys
+
+# Add current directory to Python path for local imports
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from analytics import aggregate_facts, build_report
+
+
+FACTS = [
+    {"created_at": "2026-03-01T09:15:00", "conversation_step": "completed", "missing_fields": [], "destination": "Paris", "turns_to_itinerary": 4},
+    {"created_at": "2026-03-01T10:30:00", "conversation_step": "completed", "missing_fields": [], "destination": "Paris", "turns_to_itinerary": 6},
+    {"created_at": "2026-03-01T11:00:00", "conversation_step": "collecting_details", "missing_fields": ["travel_dates", "budget"], "destination": "Rome", "turns_to_itinerary": None},
+    {"created_at": "2026-03-02T08:00:00", "conversation_step": "collecting_details", "missing_fields": ["destination"], "destination": None, "turns_to_itinerary": None},
+    {"created_at": "2026-03-02T12:00:00", "conversation_step": "completed", "missing_fields": ["budget"], "destination": "Tokyo", "turns_to_itinerary": 3},
+]
+
+
+def counts(rows):
+    return {(row["_id"]["bucket"], row["_id"]["key"]): row["count"] for row in rows}
+
+
+def test_aggregate_facts_without_bucket():
+    rows = aggregate_facts(FACTS, None, None, None, top=10)
+
+    assert counts(rows["steps"]) == {("all", "completed"): 3, ("all", "collecting_details"): 2}
+    assert counts(rows["destinations"]) == {("all", "Paris"): 2, ("all", "Rome"): 1, ("all", "Tokyo"): 1}
+    assert rows["turns"] == [{"_id": {"bucket": "all", "key": None}, "count": 3, "total": 13}]
+
+
+def test_aggregate_facts_drop_off_excludes_completed_sessions():
+    rows = aggregate_facts(FACTS, None, None, None, top=10)
+
+    # The completed Tokyo session still lists budget as missing, but didn't drop off
+    assert counts(rows["drop_off"]) == {("all", "travel_dates"): 1, ("all", "budget"): 1, ("all", "destination"): 1}
+
+
+def test_aggregate_facts_buckets_by_day():
+    rows = aggregate_facts(FACTS, "day", None, None, top=10)
+
+    assert counts(rows["steps"]) == {
+        ("2026-03-01", "completed"): 2,
+        ("2026-03-01", "collecting_details"): 1,
+        ("2026-03-02", "collecting_details"): 1,
+        ("2026-03-02", "completed"): 1,
+    }
+
+
+def test_aggregate_facts_since_and_until():
+    rows = aggregate_facts(FACTS, None, "2026-03-01T10:00:00", "2026-03-02T09:00:00", top=10)
+
+    # since is inclusive, until exclusive
+    assert sum(row["count"] for row in rows["steps"]) == 3
+    assert counts(rows["destinations"]) == {("all", "Paris"): 1, ("all", "Rome"): 1}
+
+
+def test_aggregate_facts_limits_destinations_per_bucket():
+    rows = aggregate_facts(FACTS, "day", None, None, top=1)
+
+    assert counts(rows["destinations"]) == {("2026-03-01", "Paris"): 2, ("2026-03-02", "Tokyo"): 1}
+
+
+def test_aggregate_facts_destination_ties_by_name():
+    rows = aggregate_facts(FACTS[2:], None, None, None, top=1)
+
+    assert counts(rows["destinations"]) == {("all", "Rome"): 1}
+
+
+def test_aggregate_facts_missing_created_at():
+    rows = aggregate_facts([{"conversation_step": "greeting"}], "day", "2026-01-01", None, top=10)
+
+    # Without a timestamp a session can't be shown to fall inside the window
+    assert rows["steps"] == []
+
+
+def test_build_report():
+    report = build_report(aggregate_facts(FACTS, "day", None, None, top=10), top=10)
+
+    assert [entry["bucket"] for entry in report] == ["2026-03-01", "2026-03-02"]
+    first = report[0]
+    assert first["sessions"] == 3
+    assert first["steps"] == {"completed": 2, "collecting_details": 1}
+    assert first["top_destinations"] == [{"destination": "Paris", "sessions": 2}, {"destination": "Rome", "sessions": 1}]
+    assert first["itineraries"] == 2
+    assert first["avg_turns_to_itinerary"] == 5
+    assert report[1]["drop_off"] == {"destination": 1}
+
+
+def test_build_report_without_itineraries():
+    report = build_report(aggregate_facts(FACTS[3:4], None, None, None, top=10), top=10)
+
+    assert report[0]["itineraries"] == 0
+    assert report[0]["avg_turns_to_itinerary"] is None
+    assert report[0]["steps"] == {"collecting_details": 1}
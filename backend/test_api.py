@@ -17,6 +17,9 @@ from datetime import datetime
 BASE_URL = "http://localhost:8000"
 TEST_SESSION_ID = "test_session_123"
 
+# Set by the travel request test when the server runs itinerary jobs (ITINERARY_JOB_MODE=true)
+job_id = None
+
 
 def print_separator(title):
     """Print a formatted separator with title"""
@@ -40,6 +43,22 @@ def print_response(response, title="Response"):
         print(f"Raw Response: {response.text}")
 
 
+def read_sse_events(response, limit=100):
+    """Read (event id, event) pairs from an SSE response until it closes or the limit"""
+    events = []
+    event_id = None
+    for line in response.iter_lines(decode_unicode=True):
+        if line.startswith('id: '):
+            event_id = int(line[4:])
+        elif line.startswith('data: '):
+            event = json.loads(line[6:])
+            events.append((event_id, event))
+            print(f"  Event {event_id}: {json.dumps(event)[:200]}")
+            if len(events) >= limit:
+                break
+    return events
+
+
 def test_health_endpoint():
     """Test the health endpoint"""
     print_separator("Testing Health Endpoint")
@@ -53,6 +72,21 @@ def test_health_endpoint():
         return False
 
 
+def test_ready_endpoint():
+    """Test the readiness endpoint"""
+    print_separator("Testing Ready Endpoint")
+
+    try:
+        response = requests.get(f"{BASE_URL}/ready")
+        print_response(response)
+        # 503 while components are still warming up
+        ready = response.json().get("ready")
+        return (response.status_code == 200 and ready is True) or (response.status_code == 503 and ready is False)
+    except Exception as e:
+        print(f"Error testing ready endpoint: {e}")
+        return False
+
+
 def test_root_endpoint():
     """Test the root endpoint"""
     print_separator("Testing Root Endpoint")
@@ -113,6 +147,7 @@ def test_chat_endpoint_greeting():
 
 def test_chat_endpoint_travel_request():
     """Test chat endpoint with travel request"""
+    global job_id
     print_separator("Testing Chat Endpoint - Travel Request")
 
     try:
@@ -137,6 +172,9 @@ def test_chat_endpoint_travel_request():
                     event_count += 1
                     print(f"  Event {event_count}: {json.dumps(parsed, indent=4)}")
 
+                    if parsed.get('type') == 'job':
+                        job_id = parsed['job_id']
+
                     # Check if this is the done event
                     if parsed.get('type') == 'done':
                         print("  Stream completed successfully")
@@ -156,6 +194,90 @@ def test_chat_endpoint_travel_request():
         return False
 
 
+def test_resume_stream():
+    """Test replaying the session's buffered events once its turns have finished"""
+    print_separator("Testing Resume Stream Endpoint")
+
+    try:
+        response = requests.get(
+            f"{BASE_URL}/chat/{TEST_SESSION_ID}/stream",
+            headers={"Last-Event-ID": "0"},
+            stream=True
+        )
+        print(f"Status Code: {response.status_code}")
+        events = read_sse_events(response)
+        ids = [event_id for event_id, _ in events]
+        if not events or ids != sorted(ids) or events[-1][1].get('type') != 'done':
+            return False
+
+        # Resuming after the last event has nothing left to replay
+        response = requests.get(
+            f"{BASE_URL}/chat/{TEST_SESSION_ID}/stream",
+            params={"last_event_id": ids[-1]},
+            stream=True
+        )
+        if read_sse_events(response):
+            return False
+
+        response = requests.get(f"{BASE_URL}/chat/nonexistent_session/stream")
+        print_response(response, "Unknown Session")
+        return response.status_code == 200 and 'error' in response.json()
+    except Exception as e:
+        print(f"Error testing resume stream: {e}")
+        return False
+
+
+def test_job_status():
+    """Test polling an itinerary job (only queued when the server runs in job mode)"""
+    print_separator("Testing Job Status Endpoint")
+
+    try:
+        if job_id:
+            response = requests.get(f"{BASE_URL}/jobs/{job_id}", params={"wait": 30}, timeout=40)
+            print_response(response)
+            job = response.json()
+            if response.status_code != 200 or job.get("job_id") != job_id:
+                return False
+            if job.get("status") == "completed" and not job.get("result", {}).get("itinerary"):
+                return False
+        else:
+            print("No job was queued (job mode is off)")
+
+        response = requests.get(f"{BASE_URL}/jobs/nonexistent_job")
+        print_response(response, "Unknown Job")
+        return response.status_code == 200 and 'error' in response.json()
+    except Exception as e:
+        print(f"Error testing job status: {e}")
+        return False
+
+
+def test_analytics_endpoint():
+    """Test the analytics report and a single metric"""
+    print_separator("Testing Analytics Endpoint")
+
+    try:
+        response = requests.get(f"{BASE_URL}/analytics", params={"bucket": "day", "top": 5, "refresh": "true"})
+        print_response(response)
+        report = response.json()
+        if response.status_code != 200 or not isinstance(report.get("buckets"), list):
+            return False
+        if any(len(entry["top_destinations"]) > 5 for entry in report["buckets"]):
+            return False
+
+        response = requests.get(f"{BASE_URL}/analytics/destinations")
+        print_response(response, "Destinations Metric")
+        buckets = response.json().get("buckets")
+        if not isinstance(buckets, list) or any(set(entry) != {"bucket", "top_destinations"} for entry in buckets):
+            return False
+
+        response = requests.get(f"{BASE_URL}/analytics", params={"bucket": "week"})
+        print_response(response, "Invalid Bucket")
+        return 'error' in response.json()
+    except Exception as e:
+        print(f"Error testing analytics endpoint: {e}")
+        return False
+
+
 def test_get_session():
     """Test get session endpoint"""
     print_separator("Testing Get Session Endpoint")
@@ -250,9 +372,13 @@ def main():
     # Run tests
     tests = [
         ("Health Endpoint", test_health_endpoint),
+        ("Ready Endpoint", test_ready_endpoint),
         ("Root Endpoint", test_root_endpoint),
         ("Chat - Greeting", test_chat_endpoint_greeting),
         ("Chat - Travel Request", test_chat_endpoint_travel_request),
+        ("Resume Stream", test_resume_stream),
+        ("Job Status", test_job_status),
+        ("Analytics", test_analytics_endpoint),
         ("Get Session", test_get_session),
         ("Missing Message Error", test_missing_message_error),
         ("Delete Session", test_delete_session),
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the micro-batcher
+
+Run with: python -m pytest test_batching.py
+"""
+
+import asyncio
+import os
+import sys
+
+# Add current directory to Python path for local imports
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from batching import MicroBatcher
+
+
+class Recorder:
+    """Batch and single handlers that record their calls"""
+
+    def __init__(self, fail_items=(), batch_error=None):
+        self.fail_items = set(fail_items)
+        self.batch_error = batch_error
+        self.batches = []
+        self.singles = []
+
+    async def run_batch(self, items):
+        self.batches.append([item for _, item in items])
+        if self.batch_error:
+            raise self.batch_error
+        # Items the batch call couldn't handle are left out of the result
+        return {item_id: f"batch:{item}" for item_id, item in items if item not in self.fail_items}
+
+    async def run_single(self, item):
+        self.singles.append(item)
+        return f"single:{item}"
+
+
+def submit_all(batcher, items):
+    async def run():
+        return await asyncio.gather(*(batcher.submit(item) for item in items), return_exceptions=True)
+    return asyncio.run(run())
+
+
+def test_batches_items_within_window():
+    recorder = Recorder()
+    batcher = MicroBatcher(recorder.run_batch, recorder.run_single, window_ms=20, max_items=10)
+
+    assert submit_all(batcher, ["a", "b", "c"]) == ["batch:a", "batch:b", "batch:c"]
+    assert recorder.batches == [["a", "b", "c"]]
+    assert recorder.singles == []
+
+
+def test_lone_item_skips_batch_call():
+    recorder = Recorder()
+    batcher = MicroBatcher(recorder.run_batch, recorder.run_single, window_ms=20, max_items=10)
+
+    assert submit_all(batcher, ["a"]) == ["single:a"]
+    assert recorder.batches == []
+
+
+def test_flushes_at_max_items():
+    recorder = Recorder()
+    batcher = MicroBatcher(recorder.run_batch, recorder.run_single, window_ms=20, max_items=2)
+
+    assert submit_all(batcher, ["a", "b", "c"]) == ["batch:a", "batch:b", "single:c"]
+    assert recorder.batches == [["a", "b"]]
+
+
+def test_partial_batch_falls_back_to_single_calls():
+    recorder = Recorder(fail_items={"b"})
+    batcher = MicroBatcher(recorder.run_batch, recorder.run_single, window_ms=20, max_items=10)
+
+    assert submit_all(batcher, ["a", "b", "c"]) == ["batch:a", "single:b", "batch:c"]
+    assert recorder.singles == ["b"]
+
+
+def test_failed_batch_falls_back_to_single_calls():
+    recorder = Recorder(batch_error=ValueError("bad batch reply"))
+    batcher = MicroBatcher(recorder.run_batch, recorder.run_single, window_ms=20, max_items=10)
+
+    assert submit_all(batcher, ["a", "b"]) == ["single:a", "single:b"]
+    assert recorder.singles == ["a", "b"]
+
+
+def test_batch_timeout_is_not_retried():
+    recorder = Recorder(batch_error=asyncio.TimeoutError())
+    batcher = MicroBatcher(recorder.run_batch, recorder.run_single, window_ms=20, max_items=10)
+
+    results = submit_all(batcher, ["a", "b"])
+
+    assert all(isinstance(result, asyncio.TimeoutError) for result in results)
+    assert recorder.singles == []
+
+
+def test_single_call_errors_reach_the_caller():
+    async def run_single(item):
+        raise RuntimeError(f"no result for {item}")
+
+    recorder = Recorder(fail_items={"b"})
+    batcher = MicroBatcher(recorder.run_batch, run_single, window_ms=20, max_items=10)
+
+    results = submit_all(batcher, ["a", "b"])
+
+    assert results[0] == "batch:a"
+    assert isinstance(results[1], RuntimeError)
+    assert str(results[1]) == "no result for b"
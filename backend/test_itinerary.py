@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Unit tests for itinerary parsing and partial edits
+
+Run with: python -m pytest test_itinerary.py
+"""
+
+import os
+import sys
+import time
+
+# Add current directory to Python path for local imports
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from itinerary import parse_itinerary_days, split_day_slots, classify_itinerary_edit, apply_itinerary_edits
+
+
+ITINERARY = """Here's your 3-day itinerary for Paris:
+
+### Day 1: Arrival
+- **Morning:** Check in near the Marais
+- **Afternoon:** Walk along the Seine
+- **Evening:** Dinner in Le Marais
+
+### Day 2: Museums
+- **Morning:** The Louvre
+- **Afternoon:** Musée d'Orsay
+- **Evening:** Seine river cruise
+
+### Day 3: Montmartre
+- **Morning:** Sacré-Cœur
+- **Evening:** Farewell dinner
+
+### Travel Tips
+- Buy a Navigo pass
+"""
+
+# Models sometimes merge days into one heading
+MERGED_ITINERARY = """### Day 1-2: Paris
+- **Morning:** Eiffel Tower
+- **Afternoon:** Louvre
+
+### Day 3: Versailles
+- **Morning:** Palace of Versailles
+- **Afternoon:** Gardens
+"""
+
+
+def test_parse_itinerary_days_splits_on_day_headings():
+    days = parse_itinerary_days(ITINERARY)
+
+    assert [day["day"] for day in days] == [1, 2, 3]
+    assert days[0]["content"].startswith("### Day 1: Arrival")
+    assert "The Louvre" in days[1]["content"]
+    # Each section is an exact substring, so it can be spliced back
+    assert all(day["content"] in ITINERARY for day in days)
+
+
+def test_parse_itinerary_days_keeps_closing_notes_out_of_last_day():
+    last_day = parse_itinerary_days(ITINERARY)[-1]["content"]
+
+    assert "Farewell dinner" in last_day
+    assert "Travel Tips" not in last_day
+    assert "Navigo" not in last_day
+
+
+def test_parse_itinerary_days_accepts_bold_and_plain_headings():
+    text = "**Day 1 - Arrival**\nMorning: Check in\n\nDay 2:\nMorning: Hike\n"
+
+    assert [day["day"] for day in parse_itinerary_days(text)] == [1, 2]
+
+
+def test_parse_itinerary_days_skips_repeated_days():
+    text = "Day 1: A\nFirst\nDay 1: B\nRepeat\nDay 2: C\nSecond\n"
+    days = parse_itinerary_days(text)
+
+    assert [day["day"] for day in days] == [1, 2]
+    assert "First" in days[0]["content"]
+
+
+def test_parse_itinerary_days_without_days():
+    assert parse_itinerary_days("Sorry, I couldn't plan that trip.") == []
+
+
+def test_parse_itinerary_days_non_contiguous():
+    assert [day["day"] for day in parse_itinerary_days(MERGED_ITINERARY)] == [1, 3]
+
+
+def test_split_day_slots():
+    day = parse_itinerary_days(ITINERARY)[1]["content"]
+    slots = split_day_slots(day)
+
+    assert list(slots) == ["morning", "afternoon", "evening"]
+    assert slots["morning"] == "- **Morning:** The Louvre"
+    assert slots["evening"] == "- **Evening:** Seine river cruise"
+
+
+def test_split_day_slots_only_returns_present_slots():
+    day = parse_itinerary_days(ITINERARY)[2]["content"]
+
+    assert list(split_day_slots(day)) == ["morning", "evening"]
+    assert split_day_slots("### Day 4: Free day") == {}
+
+
+def test_classify_itinerary_edit_days_and_slots():
+    days = {1, 2, 3}
+
+    assert classify_itinerary_edit("Change the morning of day 2", days) == {"days": [2], "slots": ["morning"]}
+    assert classify_itinerary_edit("Swap days 1 and 3", days) == {"days": [1, 3], "slots": []}
+    assert classify_itinerary_edit("Replace day 1 to 2 with something else", days) == {"days": [1, 2], "slots": []}
+    assert classify_itinerary_edit("Change the second day", days) == {"days": [2], "slots": []}
+    assert classify_itinerary_edit("Can we do something different tonight on day three?", days) == {"days": [3], "slots": ["evening"]}
+
+
+def test_classify_itinerary_edit_last_day():
+    assert classify_itinerary_edit("Change the last day", {1, 2, 3}) == {"days": [3], "slots": []}
+    assert classify_itinerary_edit("Change the last day", {1, 3, 5}) == {"days": [5], "slots": []}
+
+
+def test_classify_itinerary_edit_huge_day_range():
+    started = time.perf_counter()
+    edit = classify_itinerary_edit("Change days 1 to 99999999999", {1, 2, 3})
+
+    assert edit == {"days": [1, 2, 3], "slots": []}
+    assert time.perf_counter() - started < 0.5
+
+
+def test_classify_itinerary_edit_ignores_days_not_in_itinerary():
+    assert classify_itinerary_edit("Change day 7", {1, 2, 3}) == {"days": [], "slots": []}
+
+
+def test_classify_itinerary_edit_non_contiguous_days():
+    days = {day["day"] for day in parse_itinerary_days(MERGED_ITINERARY)}
+
+    # Day 2 has no section of its own, so it must not be targeted
+    assert classify_itinerary_edit("Change day 2", days) == {"days": [], "slots": []}
+    assert classify_itinerary_edit("Change days 2 and 3", days) == {"days": [3], "slots": []}
+
+
+def test_classify_itinerary_edit_weak_keywords_need_a_target():
+    days = {1, 2, 3}
+
+    assert classify_itinerary_edit("Make day 2 more relaxed", days) == {"days": [2], "slots": []}
+    assert classify_itinerary_edit("I want more", days) is None
+    assert classify_itinerary_edit("Thanks, this looks great!", days) is None
+
+
+def test_apply_itinerary_edits_replaces_whole_day():
+    days = parse_itinerary_days(ITINERARY)
+    edited = "### Day 2: Parks\n- **Morning:** Luxembourg Gardens\n- **Afternoon:** Tuileries"
+
+    updated = apply_itinerary_edits(ITINERARY, days, edited, [])
+
+    assert "Luxembourg Gardens" in updated
+    assert "The Louvre" not in updated
+    # Other days and the closing notes are untouched
+    assert days[0]["content"] in updated
+    assert days[2]["content"] in updated
+    assert "Buy a Navigo pass" in updated
+
+
+def test_apply_itinerary_edits_replaces_only_requested_slots():
+    days = parse_itinerary_days(ITINERARY)
+    edited = (
+        "### Day 2: Museums\n"
+        "- **Morning:** Centre Pompidou\n"
+        "- **Afternoon:** Rodin Museum\n"
+        "- **Evening:** Seine river cruise"
+    )
+
+    updated = apply_itinerary_edits(ITINERARY, days, edited, ["morning"])
+
+    assert "Centre Pompidou" in updated
+    assert "The Louvre" not in updated
+    # The afternoon wasn't requested, so the model's change to it is ignored
+    assert "Musée d'Orsay" in updated
+    assert "Rodin Museum" not in updated
+
+
+def test_apply_itinerary_edits_non_contiguous_days():
+    days = parse_itinerary_days(MERGED_ITINERARY)
+    edited = "### Day 3: Giverny\n- **Morning:** Monet's house\n- **Afternoon:** Water lily pond"
+
+    updated = apply_itinerary_edits(MERGED_ITINERARY, days, edited, [])
+
+    assert "Monet's house" in updated
+    assert "Palace of Versailles" not in updated
+    assert days[0]["content"] in updated
+
+
+def test_apply_itinerary_edits_returns_none_when_nothing_applies():
+    days = parse_itinerary_days(ITINERARY)
+
+    assert apply_itinerary_edits(ITINERARY, days, "I can't change that, sorry.", []) is None
+    assert apply_itinerary_edits(ITINERARY, days, "### Day 9: Extra\n- **Morning:** Nothing", []) is None
+    # Unchanged text isn't an edit either
+    assert apply_itinerary_edits(ITINERARY, days, days[1]["content"], []) is None
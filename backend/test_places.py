@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Unit tests for place lookup and trip scope
+
+Run with: python -m pytest test_places.py
+"""
+
+import json
+import os
+import sys
+
+# Add current directory to Python path for local imports
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import places
+from places import normalize_place_key, lookup_place, canonicalize_place, resolve_scope, load_place_index
+
+
+def test_normalize_place_key():
+    assert normalize_place_key("  The Maldives ") == "maldives"
+    assert normalize_place_key("Zürich") == "zurich"
+    assert normalize_place_key("Ho-Chi-Minh City!") == "ho chi minh city"
+
+
+def test_lookup_place_by_name_and_alias():
+    assert lookup_place("Mumbai").name == "Mumbai"
+    assert lookup_place("bombay").name == "Mumbai"
+    assert lookup_place("NYC").name == "New York"
+    assert lookup_place("the big apple").name == "New York"
+
+
+def test_lookup_place_unknown_or_empty():
+    assert lookup_place("Atlantis") is None
+    assert lookup_place("") is None
+    assert lookup_place(None) is None
+
+
+def test_lookup_place_keeps_places_within_places_separate():
+    # A region's city or a country's island isn't another name for it
+    assert lookup_place("Kashmir").name == "Kashmir"
+    assert lookup_place("Srinagar").name == "Srinagar"
+    assert lookup_place("Male").name == "Male"
+    assert lookup_place("Maldives").name == "Maldives"
+    assert lookup_place("Machu Picchu").name == "Machu Picchu"
+    assert lookup_place("England").name == "England"
+    assert lookup_place("Male").country == lookup_place("Maldives").country
+
+
+def test_lookup_place_city_country():
+    assert lookup_place("Paris, France").name == "Paris"
+    assert lookup_place("Kyoto, Kansai, Japan").name == "Kyoto"
+    assert lookup_place("New York, USA").name == "New York"
+    # England is in the United Kingdom, so it works as the country part
+    assert lookup_place("London, England").name == "London"
+
+
+def test_lookup_place_city_in_another_country():
+    assert lookup_place("Paris, Texas") is None
+    assert lookup_place("Paris, Japan") is None
+
+
+def test_lookup_place_trailing_comma():
+    assert lookup_place("Paris,").name == "Paris"
+
+
+def test_canonicalize_place():
+    assert canonicalize_place("bangalore") == "Bengaluru"
+    assert canonicalize_place("  Atlantis ") == "Atlantis"
+    assert canonicalize_place(None) is None
+
+
+def test_resolve_scope():
+    assert resolve_scope("Goa", "Mumbai", "India") == "domestic"
+    assert resolve_scope("Paris", "Delhi", "India") == "international"
+    # Without an origin the domestic country is assumed
+    assert resolve_scope("Kerala", None, "India") == "domestic"
+    assert resolve_scope("Atlantis", "Delhi", "India") is None
+    assert resolve_scope("Paris", "Atlantis", "India") is None
+
+
+def test_places_file_overrides_builtin_entries(tmp_path, monkeypatch):
+    places_file = tmp_path / "places.json"
+    places_file.write_text(json.dumps([
+        {"name": "Coorg", "country": "India", "region": "South Asia", "aliases": ["kodagu"]},
+        {"name": "Paris", "country": "United States", "region": "North America", "aliases": []},
+    ]))
+    monkeypatch.setattr(places, "PLACES_FILE", str(places_file))
+    try:
+        load_place_index()
+
+        assert lookup_place("Kodagu").name == "Coorg"
+        assert lookup_place("Paris").country == "United States"
+    finally:
+        monkeypatch.setattr(places, "PLACES_FILE", None)
+        load_place_index()
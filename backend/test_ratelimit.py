@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Unit tests for token buckets, client addresses and the rate limit middleware
+
+Run with: python -m pytest test_ratelimit.py
+"""
+
+import asyncio
+import json
+import math
+import os
+import sys
+
+# Add current directory to Python path for local imports
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import ratelimit
+from ratelimit import TokenBucket, RateLimiter, RateLimitMiddleware, get_client_ip
+
+
+def rewind(bucket, seconds):
+    """Move the bucket's clock back instead of sleeping"""
+    bucket.updated_at -= seconds
+
+
+def test_token_bucket_allows_burst_up_to_capacity():
+    bucket = TokenBucket(3, 1)
+
+    assert [bucket.take() for _ in range(3)] == [0, 0, 0]
+    assert bucket.take() > 0
+
+
+def test_token_bucket_retry_after_is_time_to_refill():
+    bucket = TokenBucket(2, 0.5)
+    bucket.take(2)
+
+    # One token at half a token per second
+    assert math.isclose(bucket.take(), 2, rel_tol=0.01)
+
+
+def test_token_bucket_refills_over_time():
+    bucket = TokenBucket(2, 1)
+    bucket.take(2)
+    rewind(bucket, 1.5)
+
+    assert bucket.take() == 0
+    assert math.isclose(bucket.tokens, 0.5, rel_tol=0.01)
+
+
+def test_token_bucket_refill_is_capped_at_capacity():
+    bucket = TokenBucket(2, 1)
+    rewind(bucket, 60)
+
+    assert bucket.take() == 0
+    assert math.isclose(bucket.tokens, 1, rel_tol=0.01)
+
+
+def test_token_bucket_without_refill_waits_forever():
+    bucket = TokenBucket(1, 0)
+    bucket.take()
+
+    assert bucket.take() == math.inf
+
+
+def test_rate_limiter_returns_longest_wait():
+    limiter = RateLimiter(backend="memory")
+
+    async def run():
+        await limiter.check([("a", 60), ("b", 6)])
+        for _ in range(5):
+            await limiter.check([("b", 6)])
+        return await limiter.check([("a", 60), ("b", 6)])
+
+    # "a" still has tokens; "b" (6 per minute) is empty and refills one every 10 seconds
+    assert math.isclose(asyncio.run(run()), 10, rel_tol=0.01)
+
+
+def test_rate_limiter_skips_disabled_limits():
+    limiter = RateLimiter(backend="memory")
+
+    assert asyncio.run(limiter.check([("a", 0)])) == 0
+    assert "a" not in limiter._buckets
+
+
+def test_rate_limiter_evicts_least_recently_used():
+    limiter = RateLimiter(backend="memory", max_buckets=2)
+    limiter._take_local("a", 60)
+    limiter._take_local("b", 60)
+    limiter._take_local("a", 60)
+    limiter._take_local("c", 60)
+
+    assert list(limiter._buckets) == ["a", "c"]
+
+
+def test_get_client_ip_ignores_forwarded_for_by_default(monkeypatch):
+    monkeypatch.setattr(ratelimit, "RATE_LIMIT_TRUST_PROXY", False)
+    scope = {"client": ("10.0.0.1", 1234), "headers": [(b"x-forwarded-for", b"1.2.3.4")]}
+
+    assert get_client_ip(scope) == "10.0.0.1"
+
+
+def test_get_client_ip_takes_entry_added_by_outermost_proxy(monkeypatch):
+    monkeypatch.setattr(ratelimit, "RATE_LIMIT_TRUST_PROXY", True)
+    monkeypatch.setattr(ratelimit, "RATE_LIMIT_PROXY_HOPS", 2)
+    scope = {
+        "client": ("10.0.0.1", 1234),
+        "headers": [(b"x-forwarded-for", b"6.6.6.6, 1.2.3.4"), (b"x-forwarded-for", b"10.0.0.2")],
+    }
+
+    # 6.6.6.6 was supplied by the client itself
+    assert get_client_ip(scope) == "1.2.3.4"
+
+
+def test_get_client_ip_without_client():
+    assert get_client_ip({"headers": []}) == "unknown"
+
+
+def call_middleware(limiter, path="/chat/abc", method="POST"):
+    sent = []
+    app_calls = []
+
+    async def app(scope, receive, send):
+        app_calls.append(scope["path"])
+
+    async def receive():
+        return {"type": "http.request"}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "path": path, "method": method, "client": ("10.0.0.1", 1234), "headers": []}
+    asyncio.run(RateLimitMiddleware(app, limiter)(scope, receive, send))
+    return app_calls, sent
+
+
+def test_middleware_rejects_with_retry_after(monkeypatch):
+    monkeypatch.setattr(ratelimit, "RATE_LIMIT_ENABLED", True)
+    monkeypatch.setattr(ratelimit, "RATE_LIMIT_TURNS_PER_MINUTE_SESSION", 1)
+    limiter = RateLimiter(backend="memory")
+
+    app_calls, _ = call_middleware(limiter)
+    assert app_calls == ["/chat/abc"]
+
+    app_calls, sent = call_middleware(limiter)
+    assert app_calls == []
+    assert sent[0]["status"] == 429
+    headers = dict(sent[0]["headers"])
+    # One turn per minute refills in 60 seconds
+    assert 59 <= int(headers[b"retry-after"]) <= 60
+    assert json.loads(sent[1]["body"])["retry_after"] == int(headers[b"retry-after"])
+
+
+def test_middleware_exempts_health_checks(monkeypatch):
+    monkeypatch.setattr(ratelimit, "RATE_LIMIT_ENABLED", True)
+    monkeypatch.setattr(ratelimit, "RATE_LIMIT_REQUESTS_PER_MINUTE", 1)
+    limiter = RateLimiter(backend="memory")
+
+    for _ in range(3):
+        app_calls, _ = call_middleware(limiter, path="/health", method="GET")
+        assert app_calls == ["/health"]
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the circuit breaker and latency budgets
+
+Run with: python -m pytest test_resilience.py
+"""
+
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+
+# Add current directory to Python path for local imports
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from resilience import CircuitBreaker, call_with_budget
+
+
+def open_breaker(threshold=3, reset_seconds=30):
+    breaker = CircuitBreaker("test", failure_threshold=threshold, reset_seconds=reset_seconds)
+    for _ in range(threshold):
+        breaker.record_failure()
+    return breaker
+
+
+def let_reset_pass(breaker):
+    """Move the breaker's clock back instead of sleeping through reset_seconds"""
+    breaker.opened_at -= breaker.reset_seconds
+
+
+def test_breaker_stays_closed_below_threshold():
+    breaker = CircuitBreaker("test", failure_threshold=3, reset_seconds=30)
+    breaker.record_failure()
+    breaker.record_failure()
+
+    assert breaker.state == "closed"
+    assert breaker.allow_request()
+
+
+def test_breaker_success_resets_failure_count():
+    breaker = CircuitBreaker("test", failure_threshold=3, reset_seconds=30)
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+
+    assert breaker.state == "closed"
+    assert breaker.to_dict() == {"state": "closed", "failures": 1}
+
+
+def test_breaker_opens_at_threshold():
+    breaker = open_breaker()
+
+    assert breaker.state == "open"
+    assert not breaker.allow_request()
+
+
+def test_breaker_half_opens_after_reset():
+    breaker = open_breaker()
+    let_reset_pass(breaker)
+
+    assert breaker.allow_request()
+    assert breaker.state == "half_open"
+
+
+def test_breaker_lets_one_probe_through():
+    breaker = open_breaker()
+    let_reset_pass(breaker)
+
+    assert breaker.allow_request()
+    assert not breaker.allow_request()
+
+
+def test_breaker_probe_success_closes():
+    breaker = open_breaker()
+    let_reset_pass(breaker)
+    breaker.allow_request()
+    breaker.record_success()
+
+    assert breaker.state == "closed"
+    assert breaker.failures == 0
+    assert breaker.allow_request()
+    assert breaker.allow_request()
+
+
+def test_breaker_probe_failure_reopens():
+    breaker = open_breaker()
+    let_reset_pass(breaker)
+    breaker.allow_request()
+    breaker.record_failure()
+
+    assert breaker.state == "open"
+    # The reset period starts over
+    assert not breaker.allow_request()
+
+
+def test_breaker_release_frees_the_probe():
+    breaker = open_breaker()
+    let_reset_pass(breaker)
+    breaker.allow_request()
+    breaker.release()
+
+    assert breaker.state == "half_open"
+    assert breaker.allow_request()
+
+
+def test_breaker_replaces_stale_probe():
+    breaker = open_breaker()
+    let_reset_pass(breaker)
+    breaker.allow_request()
+    # The probe never reported back within reset_seconds
+    breaker._probe_started_at -= breaker.reset_seconds
+
+    assert breaker.allow_request()
+
+
+def test_call_with_budget_returns_result():
+    assert asyncio.run(call_with_budget(lambda: "ok", budget=1)) == "ok"
+
+
+def test_call_with_budget_times_out():
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(call_with_budget(lambda: time.sleep(0.5), budget=0.05))
+
+
+def test_call_with_budget_hedge_retries_fast_failure():
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) == 1:
+            raise RuntimeError("first attempt failed")
+        return "ok"
+
+    assert asyncio.run(call_with_budget(flaky, budget=1, hedge_after=0.5)) == "ok"
+    assert len(calls) == 2
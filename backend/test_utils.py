@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Unit tests for model output helpers: reasoning removal and JSON extraction
+
+Run with: python -m pytest test_utils.py
+"""
+
+import json
+import os
+import sys
+
+# Add current directory to Python path for local imports
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from utils import strip_reasoning, JsonStreamParser, extract_first_json
+
+
+def feed_chunks(parser, chunks):
+    """Feed chunks until the parser returns a value; returns it and the number of chunks read"""
+    for count, chunk in enumerate(chunks, 1):
+        result = parser.feed(chunk)
+        if result is not None:
+            return result, count
+    return None, len(chunks)
+
+
+def test_strip_reasoning_removes_think_blocks():
+    text = "<think>The user wants Paris.\nThree days.</think>\nHere's your itinerary."
+
+    assert strip_reasoning(text) == "Here's your itinerary."
+
+
+def test_strip_reasoning_removes_every_block():
+    assert strip_reasoning("<think>a</think>One <think>b</think>two") == "One two"
+
+
+def test_strip_reasoning_drops_unterminated_block():
+    assert strip_reasoning("Answer first.\n<think>still thinking when the output was cut") == "Answer first."
+
+
+def test_strip_reasoning_leaves_plain_text():
+    assert strip_reasoning("  No reasoning here.  ") == "No reasoning here."
+
+
+def test_extract_first_json_object():
+    text = 'Sure! Here you go: {"destination": "Paris", "trip_duration": 3} Anything else?'
+
+    assert json.loads(extract_first_json(text)) == {"destination": "Paris", "trip_duration": 3}
+
+
+def test_extract_first_json_nested_values():
+    text = '{"place": {"name": "Paris", "tags": ["art", {"food": true}]}} {"second": 1}'
+
+    assert json.loads(extract_first_json(text)) == {"place": {"name": "Paris", "tags": ["art", {"food": True}]}}
+
+
+def test_extract_first_json_ignores_braces_in_strings():
+    text = '{"note": "use {curly} and \\"quoted\\" text", "ok": true}'
+
+    assert json.loads(extract_first_json(text)) == {"note": 'use {curly} and "quoted" text', "ok": True}
+
+
+def test_extract_first_json_skips_reasoning():
+    text = '<think>Maybe {"destination": "Rome"}?</think>{"destination": "Paris"}'
+
+    assert json.loads(extract_first_json(text)) == {"destination": "Paris"}
+
+
+def test_extract_first_json_arrays_only_when_allowed():
+    text = 'Days: [1, 2] and {"a": 1}'
+
+    assert extract_first_json(text) == '{"a": 1}'
+    assert extract_first_json(text, openers="[{") == "[1, 2]"
+
+
+def test_extract_first_json_incomplete():
+    assert extract_first_json('{"destination": "Par') is None
+    assert extract_first_json("No JSON in this reply.") is None
+
+
+def test_stream_parser_returns_once_value_is_closed():
+    parser = JsonStreamParser()
+    chunks = ['Here: {"destin', 'ation": "Pa', 'ris", "days": [1, ', '2]}', " and trailing text"]
+
+    result, chunks_read = feed_chunks(parser, chunks)
+
+    assert json.loads(result) == {"destination": "Paris", "days": [1, 2]}
+    # The caller can stop reading the stream as soon as the value closes
+    assert chunks_read == 4
+
+
+def test_stream_parser_split_think_tags():
+    parser = JsonStreamParser()
+    chunks = ["<thi", 'nk>Consider {"wrong": 1}</th', "ink>", '{"right"', ": 2}"]
+
+    result, _ = feed_chunks(parser, chunks)
+
+    assert json.loads(result) == {"right": 2}
+
+
+def test_stream_parser_split_think_tag_one_character_at_a_time():
+    parser = JsonStreamParser()
+    text = '<think>{"wrong": 1}</think>{"right": 2}'
+
+    result, _ = feed_chunks(parser, list(text))
+
+    assert json.loads(result) == {"right": 2}
+
+
+def test_stream_parser_lone_angle_bracket_is_not_a_tag():
+    parser = JsonStreamParser()
+
+    result, _ = feed_chunks(parser, ["a < b, ", '{"ok": true}'])
+
+    assert json.loads(result) == {"ok": True}
+
+
+def test_stream_parser_split_escape_in_string():
+    parser = JsonStreamParser()
+    chunks = ['{"quote": "say \\', '"hi\\', '" }', '"}']
+
+    result, _ = feed_chunks(parser, chunks)
+
+    assert json.loads(result) == {"quote": 'say "hi" }'}
+
+
+def test_stream_parser_keeps_buffer():
+    parser = JsonStreamParser()
+    parser.feed("partial ")
+    parser.feed('{"a": ')
+
+    assert parser.buffer == 'partial {"a": '
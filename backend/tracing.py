@@ -0,0 +1,220 @@
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger("TravelBot")
+
+# Per-turn span tracing, written as OTLP JSON lines (one trace per line) to a rotating file
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "true").lower() == "true"
+TRACE_FILE = os.getenv("TRACE_FILE", "traces.jsonl")
+TRACE_FILE_MAX_BYTES = int(os.getenv("TRACE_FILE_MAX_BYTES", str(10 * 1024 * 1024)))
+TRACE_FILE_BACKUPS = int(os.getenv("TRACE_FILE_BACKUPS", "5"))
+# Fraction of normal turns written; turns slower than TRACE_SLOW_TURN_MS are always written
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.1"))
+TRACE_SLOW_TURN_MS = float(os.getenv("TRACE_SLOW_TURN_MS", "5000"))
+
+SERVICE_NAME = "travel-bot"
+
+_current_trace: ContextVar[Optional["TurnTrace"]] = ContextVar("current_trace", default=None)
+_current_span: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+
+_trace_logger = logging.getLogger("TravelBot.traces")
+_trace_logger.propagate = False
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def _new_id(num_bytes: int) -> str:
+    return os.urandom(num_bytes).hex()
+
+
+def _otlp_value(value: Any) -> Dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_attributes(attributes: Dict[str, Any]) -> List[Dict]:
+    return [{"key": key, "value": _otlp_value(value)} for key, value in attributes.items() if value is not None]
+
+
+class Span:
+    __slots__ = ("name", "span_id", "parent_id", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, name: str, parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.name = name
+        self.span_id = _new_id(8)
+        self.parent_id = parent_id
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes = attributes
+        self.error: Optional[str] = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def end(self):
+        if self.end_ns is None:
+            self.end_ns = time.time_ns()
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+    def to_otlp(self, trace_id: str) -> Dict:
+        span = {
+            "traceId": trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns or self.start_ns),
+            "attributes": _otlp_attributes(self.attributes),
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 0}
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+class TurnTrace:
+    """
+    Spans of one chat turn, kept in memory until the turn finishes
+
+    Whether the trace is written is decided at the end, so slow turns are
+    always kept and carry the captured input and prompt sizes.
+    """
+
+    def __init__(self, session_id: str, **attributes):
+        self.trace_id = _new_id(16)
+        self.root = Span("chat.turn", None, {"session.id": session_id, **attributes})
+        self.spans: List[Span] = [self.root]
+        self.captures: Dict[str, Any] = {}
+        self.prompt_chars = 0
+        self.llm_calls = 0
+
+    def to_otlp(self) -> Dict:
+        return {"resourceSpans": [{
+            "resource": {"attributes": _otlp_attributes({"service.name": SERVICE_NAME})},
+            "scopeSpans": [{
+                "scope": {"name": "TravelBot"},
+                "spans": [span.to_otlp(self.trace_id) for span in self.spans]
+            }]
+        }]}
+
+
+def start_turn_trace(session_id: str, **attributes) -> Optional[TurnTrace]:
+    """Start tracing a turn in the current context; None when tracing is disabled"""
+    if not TRACING_ENABLED:
+        return None
+    trace = TurnTrace(session_id, **attributes)
+    _current_trace.set(trace)
+    _current_span.set(trace.root)
+    return trace
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """Time a step of the current turn as a child of the innermost open span"""
+    trace = _current_trace.get()
+    if trace is None:
+        yield None
+        return
+
+    parent = _current_span.get()
+    current = Span(name, parent.span_id if parent else trace.root.span_id, attributes)
+    trace.spans.append(current)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except Exception as e:
+        current.error = repr(e)
+        raise
+    finally:
+        current.end()
+        _current_span.reset(token)
+
+
+def annotate_turn(**attributes):
+    """Add attributes to the current turn's root span"""
+    trace = _current_trace.get()
+    if trace:
+        trace.root.set(**attributes)
+
+
+def capture(**values):
+    """Record details that are only written if the turn turns out to be slow"""
+    trace = _current_trace.get()
+    if trace:
+        trace.captures.update(values)
+
+
+def record_prompt(chars: int):
+    """Count the size of a prompt sent to the LLM during the current turn"""
+    trace = _current_trace.get()
+    if trace:
+        trace.prompt_chars += chars
+        trace.llm_calls += 1
+
+
+def finish_turn_trace(trace: Optional[TurnTrace], error: Optional[BaseException] = None):
+    """End the turn and write its trace if it was slow or sampled"""
+    if trace is None:
+        return
+    if _current_trace.get() is trace:
+        _current_trace.set(None)
+        _current_span.set(None)
+    trace.root.end()
+    if error:
+        trace.root.error = repr(error)
+
+    duration_ms = trace.root.duration_ms
+    slow = duration_ms >= TRACE_SLOW_TURN_MS
+    if not slow and random.random() >= TRACE_SAMPLE_RATE:
+        return
+
+    trace.root.set(**{"turn.duration_ms": round(duration_ms, 1), "turn.slow": slow, "llm.calls": trace.llm_calls, "llm.prompt_chars": trace.prompt_chars})
+    if slow:
+        trace.root.set(**trace.captures)
+        logger.warning(f"Slow turn for session {trace.root.attributes.get('session.id')}: {duration_ms:.0f}ms (trace {trace.trace_id})")
+    try:
+        _write(json.dumps(trace.to_otlp()))
+    except Exception as e:
+        logger.error(f"Error writing trace: {e}")
+
+
+def _write(line: str):
+    global _listener
+    if _listener is None:
+        # The file is written from a background thread so the event loop never blocks on disk
+        records = queue.SimpleQueue()
+        file_handler = logging.handlers.RotatingFileHandler(
+            TRACE_FILE, maxBytes=TRACE_FILE_MAX_BYTES, backupCount=TRACE_FILE_BACKUPS, encoding="utf-8"
+        )
+        file_handler.setFormatter(logging.Formatter("%(message)s"))
+        _trace_logger.addHandler(logging.handlers.QueueHandler(records))
+        _trace_logger.setLevel(logging.INFO)
+        _listener = logging.handlers.QueueListener(records, file_handler)
+        _listener.start()
+    _trace_logger.info(line)
+
+
+def close_tracing():
+    """Flush and close the trace file"""
+    global _listener
+    if _listener:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+        _trace_logger.handlers.clear()
@@ -1,6 +1,12 @@
 import re
+import os
+import sys
 from datetime import datetime
-import dateparser
+
+# Add current directory to Python path for local imports
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from components import get_date_parser
 
 
 def is_greeting(text: str) -> bool:
@@ -16,36 +22,76 @@ def is_greeting(text: str) -> bool:
     return text in greetings
 
 
+# Date expressions normalize_dates_in_text hands to dateparser
+DATE_PATTERNS = [
+    r"\btoday\b", r"\btomorrow\b", r"\byesterday\b",
+    r"\bnext\s+(monday|tuesday|wednesday|thursday|friday|saturday|sunday)\b",
+    r"\bthis\s+(monday|tuesday|wednesday|thursday|friday|saturday|sunday)\b",
+    r"\b(?:on\s+)?\d{1,2}(st|nd|rd|th)?\s+(january|february|march|april|may|june|july|august|september|october|november|december)\b",
+    r"\b(?:on\s+)?(january|february|march|april|may|june|july|august|september|october|november|december)\s+\d{1,2}(st|nd|rd|th)?\b",
+]
+BETWEEN_PATTERN = r"between\s+(.*?)\s+and\s+(.*?)([\.!\?]|$)"
+
+
+def count_date_expressions(text: str) -> int:
+    """How many dateparser calls normalize_dates_in_text will make (at most), without making them"""
+    count = 2 if re.search(BETWEEN_PATTERN, text, flags=re.IGNORECASE) else 0
+    return count + sum(len(re.findall(pattern, text, flags=re.IGNORECASE)) for pattern in DATE_PATTERNS)
+
+
 def normalize_dates_in_text(text: str) -> str:
     """Normalize date expressions in text to standard format"""
-    patterns = [
-        r"\btoday\b", r"\btomorrow\b", r"\byesterday\b",
-        r"\bnext\s+(monday|tuesday|wednesday|thursday|friday|saturday|sunday)\b",
-        r"\bthis\s+(monday|tuesday|wednesday|thursday|friday|saturday|sunday)\b",
-        r"\b(?:on\s+)?\d{1,2}(st|nd|rd|th)?\s+(january|february|march|april|may|june|july|august|september|october|november|december)\b",
-        r"\b(?:on\s+)?(january|february|march|april|may|june|july|august|september|october|november|december)\s+\d{1,2}(st|nd|rd|th)?\b",
-    ]
-
     # Handle "between X and Y" patterns
-    between_pattern = r"between\s+(.*?)\s+and\s+(.*?)([\.!\?]|$)"
-    match = re.search(between_pattern, text, flags=re.IGNORECASE)
+    match = re.search(BETWEEN_PATTERN, text, flags=re.IGNORECASE)
     if match:
+        # dateparser is slow to load, so it is only fetched once a date expression is found
+        dateparser = get_date_parser()
         date1 = dateparser.parse(match.group(1), settings={"RELATIVE_BASE": datetime.now()})
         date2 = dateparser.parse(match.group(2), settings={"RELATIVE_BASE": datetime.now()})
         if date1 and date2:
             text = text.replace(match.group(0), f"from {date1.strftime('%Y-%m-%d')} to {date2.strftime('%Y-%m-%d')}")
 
     # Handle individual date patterns
-    for pattern in patterns:
+    for pattern in DATE_PATTERNS:
         matches = re.finditer(pattern, text, flags=re.IGNORECASE)
         for match in matches:
-            parsed_date = dateparser.parse(match.group(0), settings={"RELATIVE_BASE": datetime.now()})
+            parsed_date = get_date_parser().parse(match.group(0), settings={"RELATIVE_BASE": datetime.now()})
             if parsed_date:
                 text = text.replace(match.group(0), parsed_date.strftime("%Y-%m-%d"))
 
     return text
 
 
+# Keywords for the rule-based extraction fallback
+FALLBACK_DESTINATIONS = ["paris", "london", "tokyo", "new york", "rome", "barcelona", "amsterdam", "berlin", "madrid", "lisbon", "prague", "vienna", "budapest", "dubai", "singapore", "thailand", "bali", "maldives", "greece", "italy", "spain", "france", "germany", "japan", "india", "china", "australia", "canada", "usa", "uk", "mexico", "brazil", "argentina", "peru", "chile", "egypt", "morocco", "turkey", "russia", "norway", "sweden", "finland", "denmark", "iceland", "croatia", "montenegro", "serbia", "poland", "czech republic", "slovakia", "hungary", "romania", "bulgaria", "ukraine", "belarus", "estonia", "latvia", "lithuania"]
+FALLBACK_THEMES = {
+    "romantic": ["romantic", "romance", "honeymoon", "couple", "anniversary"],
+    "adventure": ["adventure", "hiking", "trekking", "climbing", "extreme"],
+    "family": ["family", "kids", "children", "child"],
+    "business": ["business", "work", "conference", "meeting"],
+    "relaxation": ["relaxation", "spa", "wellness", "peaceful", "quiet"],
+    "cultural": ["cultural", "museum", "history", "art", "heritage"],
+    "food": ["food", "culinary", "restaurant", "dining", "cuisine"]
+}
+
+
+def rule_based_entities(text: str) -> dict:
+    """Simple keyword extraction of destination, trip duration and theme, used when the AI extraction fails"""
+    text_lower = text.lower()
+
+    destination = next((dest.title() for dest in FALLBACK_DESTINATIONS if dest in text_lower), None)
+
+    # Look for number + "day" patterns
+    duration_match = re.search(r'(\d+)\s*day', text_lower)
+    trip_duration = int(duration_match.group(1)) if duration_match else None
+
+    theme = next(
+        (theme_type for theme_type, keywords in FALLBACK_THEMES.items() if any(keyword in text_lower for keyword in keywords)),
+        None
+    )
+    return {"destination": destination, "trip_duration": trip_duration, "theme": theme}
+
+
 def clean_entity_value(val):
     """Clean and validate entity values from AI extraction"""
     return None if val in ["null", "", "None"] else val
@@ -59,3 +105,89 @@ def get_missing_info_questions():
         "start_date": "When would you like to start your trip? (Please provide a date in YYYY-MM-DD format)",
         "trip_duration": "How many days would you like your trip to be?"
     }
+
+
+def strip_reasoning(text: str) -> str:
+    """Remove <think>...</think> reasoning blocks (and an unterminated trailing one) from model output"""
+    text = re.sub(r"<think>.*?</think>", "", text, flags=re.DOTALL)
+    unterminated = text.find("<think>")
+    if unterminated != -1:
+        text = text[:unterminated]
+    return text.strip()
+
+
+class JsonStreamParser:
+    """
+    Finds the first complete top-level JSON object or array in model output
+
+    Output can be fed chunk by chunk as it streams in, so the caller can stop
+    reading as soon as the value is closed. Braces inside strings and inside
+    <think> reasoning blocks are ignored.
+    """
+
+    def __init__(self, openers: str = "{"):
+        self.openers = openers
+        self.buffer = ""
+        self._pos = 0
+        self._start = -1
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._in_think = False
+
+    def feed(self, chunk: str):
+        """Add output; returns the JSON text once the first value is complete, else None"""
+        self.buffer += chunk
+        buffer = self.buffer
+
+        while self._pos < len(buffer):
+            if self._in_think:
+                end = buffer.find("</think>", self._pos)
+                if end == -1:
+                    # Keep enough of the tail to recognize a split closing tag
+                    self._pos = max(self._pos, len(buffer) - len("</think>") + 1)
+                    return None
+                self._pos = end + len("</think>")
+                self._in_think = False
+                continue
+
+            char = buffer[self._pos]
+            if self._start == -1:
+                if char == "<":
+                    rest = buffer[self._pos:self._pos + len("<think>")]
+                    if rest == "<think>":
+                        self._in_think = True
+                        self._pos += len("<think>")
+                        continue
+                    if "<think>".startswith(rest):
+                        # Possibly a split opening tag; wait for more output
+                        return None
+                elif char in self.openers:
+                    self._start = self._pos
+                    self._depth = 1
+                self._pos += 1
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._pos += 1
+                    return buffer[self._start:self._pos]
+            self._pos += 1
+        return None
+
+
+def extract_first_json(text: str, openers: str = "{"):
+    """Return the first complete JSON object/array text in model output, or None"""
+    return JsonStreamParser(openers).feed(text)
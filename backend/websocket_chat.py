@@ -0,0 +1,172 @@
+import asyncio
+import json
+import logging
+import math
+import os
+import sys
+from typing import Dict, Optional
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+# Add current directory to Python path for local imports
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from models import ConversationState
+from database import get_conversation_state, save_conversation_state
+from services import process_user_message
+from jobs import wait_for_job
+from ratelimit import RATE_LIMIT_ENABLED, rate_limiter, get_client_ip
+from executor import cpu_executor
+from tracing import start_turn_trace, finish_turn_trace, span
+
+logger = logging.getLogger("TravelBot")
+
+# WebSocket configuration
+WS_IDLE_FLUSH_SECONDS = float(os.getenv("WS_IDLE_FLUSH_SECONDS", "5"))
+WS_MAX_PENDING_MESSAGES = int(os.getenv("WS_MAX_PENDING_MESSAGES", "20"))
+
+
+class ChatConnection:
+    """
+    A WebSocket chat session that keeps its conversation state in memory
+
+    Incoming messages are queued so clients can pipeline them; turns are
+    processed in order and state is written back to storage when the
+    connection goes idle or closes, instead of after every step.
+    """
+
+    def __init__(self, websocket: WebSocket, session_id: str):
+        self.websocket = websocket
+        self.session_id = session_id
+        self.client_ip = get_client_ip(websocket.scope)
+        self.state: Optional[ConversationState] = None
+        self.dirty = False
+        self.inbox: asyncio.Queue = asyncio.Queue(maxsize=WS_MAX_PENDING_MESSAGES)
+        self._send_lock = asyncio.Lock()
+        self._job_watchers: Dict[str, asyncio.Task] = {}
+
+    async def mark_dirty(self, state: ConversationState):
+        """Deferred saver passed to the message pipeline"""
+        self.state = state
+        self.dirty = True
+
+    async def flush(self):
+        """Persist the hot state if it changed since the last flush"""
+        if self.state and self.dirty:
+            self.dirty = False
+            await save_conversation_state(self.state)
+
+    async def adopt_stored_state(self):
+        """Take the stored state (updated by a worker) as the hot copy, keeping unsaved messages"""
+        stored = await get_conversation_state(self.session_id)
+        if not stored or stored is self.state:
+            return
+
+        extra = stored.merge_messages(self.state.messages) if self.state and self.dirty else 0
+        self.state = stored
+        self.dirty = bool(extra)
+
+    async def send_event(self, event: Dict, size: int = 0):
+        """Send an event; pass the approximate text size of large events to encode them off the event loop"""
+        text = await cpu_executor.run(json.dumps, event, size=size)
+        async with self._send_lock:
+            await self.websocket.send_text(text)
+
+    async def send_state_update(self):
+        await self.send_event({"type": "state_update", "state": self.state.to_update_dict()})
+
+    async def receive_loop(self):
+        """Read client messages into the inbox until the client disconnects"""
+        while True:
+            raw = await self.websocket.receive_text()
+            try:
+                payload = json.loads(raw)
+                message = payload.get("message", "") if isinstance(payload, dict) else str(payload)
+            except json.JSONDecodeError:
+                message = raw
+            message = message.strip()
+
+            retry_after = await rate_limiter.check_turn(self.client_ip, self.session_id) if RATE_LIMIT_ENABLED and message else 0
+            if not message:
+                await self.send_event({"type": "error", "content": "Message is required"})
+            elif retry_after:
+                await self.send_event({"type": "error", "content": "Too many messages, please slow down", "retry_after": math.ceil(retry_after)})
+            elif self.inbox.full():
+                await self.send_event({"type": "error", "content": "Too many pending messages"})
+            else:
+                await self.inbox.put(message)
+
+    async def process_loop(self):
+        """Run queued turns in order, flushing state whenever the connection goes idle"""
+        while True:
+            try:
+                message = await asyncio.wait_for(self.inbox.get(), timeout=WS_IDLE_FLUSH_SECONDS)
+            except asyncio.TimeoutError:
+                await self.flush()
+                continue
+
+            trace = start_turn_trace(self.session_id, **{"chat.transport": "websocket"})
+            error = None
+            try:
+                async for chunk in process_user_message(self.session_id, message, self.state, self.mark_dirty):
+                    event = json.loads(chunk[len("data: "):])
+                    if event.get("type") == "job":
+                        self.watch_job(event["job_id"])
+                    with span("stream.flush", **{"event.bytes": len(chunk)}):
+                        await self.send_event(event)
+
+                if self.state:
+                    await self.send_state_update()
+            except WebSocketDisconnect as e:
+                error = e
+                raise
+            except Exception as e:
+                # Like the SSE stream: report the failed turn and keep serving the session
+                error = e
+                logger.error(f"Error while processing turn for session {self.session_id}: {e}")
+                await self.send_event({"type": "error", "content": "An error occurred while processing your message"})
+                await self.send_event({"type": "done"})
+            finally:
+                finish_turn_trace(trace, error)
+
+    def watch_job(self, job_id: str):
+        """Push a background itinerary to the client as soon as its job finishes"""
+        if job_id not in self._job_watchers:
+            self._job_watchers[job_id] = asyncio.create_task(self._push_job_result(job_id))
+
+    async def _push_job_result(self, job_id: str):
+        job = await wait_for_job(job_id)
+        self._job_watchers.pop(job_id, None)
+        if job and job.result and job.result.get("superseded"):
+            # The session's newer job delivers the itinerary
+            return
+        if job and job.status == "completed" and job.result:
+            await self.adopt_stored_state()
+            await self.send_event({"type": "itinerary", "content": job.result["itinerary"]})
+            await self.send_event({"type": "message", "content": job.result["follow_up"]})
+            if self.state:
+                await self.send_state_update()
+        else:
+            await self.send_event({"type": "error", "content": "Itinerary generation failed. Please try again."})
+
+    async def run(self):
+        self.state = await get_conversation_state(self.session_id)
+        receiver = asyncio.create_task(self.receive_loop())
+        processor = asyncio.create_task(self.process_loop())
+        try:
+            done, _ = await asyncio.wait({receiver, processor}, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() and not isinstance(task.exception(), WebSocketDisconnect):
+                    logger.error(f"WebSocket chat error for session {self.session_id}: {task.exception()}")
+        finally:
+            for task in [receiver, processor, *self._job_watchers.values()]:
+                task.cancel()
+            await self.flush()
+
+
+async def handle_chat_websocket(websocket: WebSocket, session_id: str):
+    """Serve a persistent multi-turn chat session over a WebSocket"""
+    await websocket.accept()
+    connection = ChatConnection(websocket, session_id)
+    await connection.run()
+    logger.info(f"WebSocket chat closed for session {session_id}")
@@ -0,0 +1,43 @@
+import asyncio
+import logging
+import os
+import sys
+
+# Add current directory to Python path for local imports
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# Load .env before importing modules that read their configuration at import time
+from components import components, load_environment
+load_environment()
+
+from database import init_database, close_database
+from jobs import JOB_WORKERS, JobWorkerPool, create_job_queue
+from places import load_place_index
+from services import run_itinerary_job
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("TravelBot")
+
+
+async def run_workers():
+    """Run itinerary workers against the storage-backed queue until cancelled"""
+    await init_database()
+    components.register("place_index", load_place_index)
+    await components.warm_up()
+
+    pool = JobWorkerPool(create_job_queue("storage"), run_itinerary_job, max(JOB_WORKERS, 1))
+    pool.start()
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await pool.stop()
+        await close_database()
+
+
+# Standalone worker entry point, scaled independently of the API
+if __name__ == "__main__":
+    try:
+        asyncio.run(run_workers())
+    except KeyboardInterrupt:
+        logger.info("Worker shutting down")